@@ -20,8 +20,10 @@ import importlib
 import json
 import locale
 import logging
+import multiprocessing
 import os
 import sys
+import threading
 import traceback
 
 from config import log
@@ -34,7 +36,7 @@ from os import PathLike
 
 from PySide6.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QTabWidget, QFileDialog, QMessageBox, \
     QMenu, QStatusBar, QProgressBar, QSplitter, \
-    QListView, QFrame
+    QListView, QFrame, QLabel
 from PySide6.QtCore import Qt, QSize, QPersistentModelIndex, QTimer, QKeyCombination, QPoint, QFileInfo, QEvent
 from PySide6.QtGui import QAction, QIcon, QActionGroup, QResizeEvent,  QPalette, QShortcut, QKeySequence
 
@@ -51,9 +53,15 @@ from components.filter import FilterWidget
 from components.songs import SongTable
 from components.files import DirectoryWidget
 from components.lights import LightsWidget
+from components.jobs import JobsDialog, progress_summary
 
-from logic.mp3 import Mp3Entry, parse_mp3, create_m3u, get_m3u_paths, save_playlist
-from logic.analyzer import Analyzer, has_voxalyzer
+from logic.mp3 import Mp3Entry, parse_mp3, read_m3u, save_playlist, get_playlist_writer
+from logic.analyzer import Analyzer, MockAnalyzer
+from logic.audiofeatures import is_available as bpm_detection_available
+from logic.bpm import BpmDetector
+from logic.covers import prune_thumbnails
+from logic.jobs import JobPriority
+from logic.progress import AnalysisProgress
 
 logger = logging.getLogger(__file__)
 
@@ -68,6 +76,8 @@ class MusicPlayer(QMainWindow):
     old_table: SongTable | None = None
 
     analyzer: Analyzer = None
+    jobs_dialog: JobsDialog | None = None
+    bpm_detector: BpmDetector | None = None
 
     def __init__(self, application: QApplication):
         super().__init__()
@@ -95,10 +105,18 @@ class MusicPlayer(QMainWindow):
         self.load_settings()
 
         self.init_analyzer()
+
+        self.playlist_writer = get_playlist_writer()
+        self.playlist_writer.save_finished.connect(self.on_playlist_saved)
+        application.aboutToQuit.connect(self.playlist_writer.flush)
+        application.aboutToQuit.connect(lambda: self.analyzer.shutdown())
+        application.aboutToQuit.connect(self.stop_bpm_detection)
+
         self.init_ui()
         self.load_initial_directory()
 
         self.check_newer_version()
+        threading.Thread(target=prune_thumbnails, name="thumbnail-cleanup", daemon=True).start()
 
         if AppSettings.value(SettingKeys.START_TOUR, True, type=bool):
             QTimer.singleShot(500, lambda: self.start_tour())
@@ -113,16 +131,82 @@ class MusicPlayer(QMainWindow):
         if self.isFullScreen():
             self.showNormal()
 
+    def can_analyze(self) -> bool:
+        """Analysis is offered with any real analyzer, the offline one included, but not with the mock."""
+        return not isinstance(self.analyzer, MockAnalyzer)
+
     def init_analyzer(self):
         if self.analyzer is not None:
+            self.analyzer.shutdown()
             self.analyzer.progress.disconnect(self.update_status_label)
             self.analyzer.error.disconnect(self.update_status_label)
             self.analyzer.result.disconnect(self.update_table_entry)
+            self.analyzer.aggregator.updated.disconnect(self.on_analysis_progress)
 
         self.analyzer = Analyzer.get_analyzer()
         self.analyzer.progress.connect(self.update_status_label)
         self.analyzer.error.connect(self.update_status_label)
         self.analyzer.result.connect(self.update_table_entry)
+        self.analyzer.aggregator.updated.connect(self.on_analysis_progress)
+        # pick up the jobs left over by the last run once the window is set up
+        QTimer.singleShot(0, self.analyzer.resume)
+
+    def on_analysis_progress(self, progress: AnalysisProgress):
+        self.cancel_analysis_action.setEnabled(not progress.finished)
+        self.retry_failed_analysis_action.setEnabled(self.analyzer.failed_count() > 0)
+
+        if not progress.finished:
+            self.statusBar().setVisible(True)
+            self.analysis_queue_label.setText(progress_summary(progress))
+            self.analysis_queue_label.setVisible(True)
+        else:
+            self.analysis_queue_label.setVisible(False)
+            if progress.total > 0:
+                self.update_status_label(progress_summary(progress), False)
+
+        if self.jobs_dialog is not None:
+            self.jobs_dialog.update_progress(progress)
+
+    def open_jobs_dialog(self):
+        if self.jobs_dialog is None:
+            self.jobs_dialog = JobsDialog([self.cancel_analysis_action, self.retry_failed_analysis_action], self)
+            self.jobs_dialog.update_progress(self.analyzer.aggregator.snapshot())
+        self.jobs_dialog.show()
+        self.jobs_dialog.raise_()
+
+    def cancel_analysis(self):
+        self.analyzer.cancel_all()
+
+    def detect_bpm(self, paths: list[PathLike[str]]):
+        if self.bpm_detector is not None and self.bpm_detector.isRunning():
+            self.update_status_label(_("BPM detection is already running"))
+            return
+
+        if self.bpm_detector is not None:
+            self.bpm_detector.deleteLater()
+        self.bpm_detector = BpmDetector(paths, parent=self)
+        self.bpm_detector.progress.connect(self.on_bpm_progress)
+        self.bpm_detector.result.connect(self.update_table_entry)
+        self.bpm_detector.start()
+
+    def on_bpm_progress(self, done: int, total: int):
+        if done < total:
+            self.update_status_label(_("Detecting BPM: {0} of {1}").format(done, total))
+        else:
+            self.update_status_label(_("BPM detected for {0} of {1} files").format(self.bpm_detector.detected, total), False)
+
+    def stop_bpm_detection(self):
+        if self.bpm_detector is not None:
+            self.bpm_detector.stop()
+
+    def pick_detect_bpm_directory(self):
+        directory = QFileDialog.getExistingDirectory(self, _("Select Directory to Detect BPM"), dir=self._get_default_directory())
+        if directory:
+            self.detect_bpm([directory])
+
+    def retry_failed_analysis(self):
+        retried = self.analyzer.retry_failed()
+        self.update_status_label(_("Retrying analysis of {0} files").format(retried))
 
     def load_settings(self):
         # Load custom categories and tags
@@ -192,9 +276,28 @@ class MusicPlayer(QMainWindow):
 
         self.analyze_file_action = QAction(_("Analyze File"), self, icon=QIcon.fromTheme(QIcon.ThemeIcon.Scanner))
         self.analyze_file_action.triggered.connect(self.pick_analyze_file)
-        self.analyze_file_action.setVisible(has_voxalyzer())
+        self.analyze_file_action.setVisible(self.can_analyze())
         file_menu.addAction(self.analyze_file_action)
 
+        self.cancel_analysis_action = QAction(_("Cancel Analysis"), self, icon=QIcon.fromTheme(QIcon.ThemeIcon.ProcessStop))
+        self.cancel_analysis_action.triggered.connect(self.cancel_analysis)
+        self.cancel_analysis_action.setEnabled(self.analyzer.queue_depth() > 0)
+        file_menu.addAction(self.cancel_analysis_action)
+
+        jobs_action = QAction(_("Analysis Jobs"), self, icon=QIcon.fromTheme(QIcon.ThemeIcon.Scanner))
+        jobs_action.triggered.connect(self.open_jobs_dialog)
+        file_menu.addAction(jobs_action)
+
+        self.retry_failed_analysis_action = QAction(_("Retry Failed Analysis"), self, icon=QIcon.fromTheme(QIcon.ThemeIcon.ViewRefresh))
+        self.retry_failed_analysis_action.triggered.connect(self.retry_failed_analysis)
+        self.retry_failed_analysis_action.setEnabled(self.analyzer.failed_count() > 0)
+        file_menu.addAction(self.retry_failed_analysis_action)
+
+        detect_bpm_action = QAction(_("Detect BPM in Directory"), self, icon=QIcon.fromTheme(QIcon.ThemeIcon.AudioVolumeHigh))
+        detect_bpm_action.triggered.connect(self.pick_detect_bpm_directory)
+        detect_bpm_action.setVisible(bpm_detection_available())
+        file_menu.addAction(detect_bpm_action)
+
         file_menu.addSeparator()
 
         settings_action = QAction(_("Settings"), self, icon=QIcon.fromTheme(QIcon.ThemeIcon.DocumentProperties))
@@ -489,7 +592,7 @@ class MusicPlayer(QMainWindow):
                 self.current_table().update_category_column_visibility()
 
             self.init_analyzer()
-            self.analyze_file_action.setVisible(has_voxalyzer())
+            self.analyze_file_action.setVisible(self.can_analyze())
 
             if dialog.has_changed(SettingKeys.LIGHTS_WIDGET, SettingKeys.LIGHTS_BROADCAST_IP, SettingKeys.LIGHTS_TIMEOUT):
                 self.lights_widget.refresh()
@@ -524,8 +627,11 @@ class MusicPlayer(QMainWindow):
             self.player.play_track(QPersistentModelIndex(), entry)
 
     def analyze_files(self, datas: list[Mp3Entry]):
+        self.analyzer.process_files(datas, JobPriority.SELECTED)
+
+    def cancel_analyze_files(self, datas: list[Mp3Entry]):
         for data in datas:
-            self.analyzer.process(data.path)
+            self.analyzer.cancel(data.path)
 
     def edit_song(self, datas: list[Mp3Entry]):
         dialog = EditSongDialog(datas[0], self)
@@ -548,10 +654,18 @@ class MusicPlayer(QMainWindow):
             edit_name_action = menu.addAction(QIcon.fromTheme(QIcon.ThemeIcon.EditPaste), _("Edit Song"))
             edit_name_action.triggered.connect(functools.partial(self.edit_song, datas))
 
-            if has_voxalyzer():
+            if self.can_analyze():
                 analyze_action = menu.addAction(QIcon.fromTheme(QIcon.ThemeIcon.Scanner), _("Analyze"))
                 analyze_action.triggered.connect(functools.partial(self.analyze_files, datas))
 
+                if any(self.analyzer.is_queued(data.path) for data in datas):
+                    cancel_analyze_action = menu.addAction(QIcon.fromTheme(QIcon.ThemeIcon.ProcessStop), _("Cancel Analysis"))
+                    cancel_analyze_action.triggered.connect(functools.partial(self.cancel_analyze_files, datas))
+
+            if bpm_detection_available():
+                detect_bpm_action = menu.addAction(QIcon.fromTheme(QIcon.ThemeIcon.AudioVolumeHigh), _("Detect BPM"))
+                detect_bpm_action.triggered.connect(functools.partial(self.detect_bpm, [data.path for data in datas]))
+
             menu.addSeparator()
 
     def populate_playlist_context_menu(self, menu: QMenu, datas: list[Mp3Entry]):
@@ -669,6 +783,10 @@ class MusicPlayer(QMainWindow):
         self.status_progress.setRange(0, 0)
         self.statusBar().addPermanentWidget(self.status_progress)
 
+        self.analysis_queue_label = QLabel()
+        self.analysis_queue_label.setVisible(False)
+        self.statusBar().addPermanentWidget(self.analysis_queue_label)
+
 
         # Visibility
         self.statusBar().setVisible(False)
@@ -685,6 +803,12 @@ class MusicPlayer(QMainWindow):
     def resizeEvent(self, event: QResizeEvent):
         AppSettings.setValue(SettingKeys.WINDOW_SIZE, event.size())
 
+    def on_playlist_saved(self, playlist: str, success: bool):
+        if success:
+            self.statusBar().showMessage(_("Playlist saved"), 2000)
+        else:
+            self.update_status_label(_("Failed to save playlist {0}").format(Path(playlist).name), False)
+
     def update_table_entry(self, path: PathLike[str]):
         self.current_table().refresh_item(path)
 
@@ -733,14 +857,16 @@ class MusicPlayer(QMainWindow):
 
     def add_table_tab(self, file_path: PathLike[str] = None, lazy: bool = False, activate: bool = True):
         if os.path.isfile(file_path):
-            mp3_files = get_m3u_paths(file_path)
+            mp3_files = read_m3u(file_path)
         elif os.path.isdir(file_path):
-            mp3_files = list(Path(file_path).rglob("*.mp3"))
+            # scanned in the background while the tab is already visible
+            mp3_files = None
         else:
             QMessageBox.warning("Invalid File Path")
             return None
 
         table = SongTable(self, file_path, mp3_files, lazy=lazy)
+        table.loading_progress.connect(self.on_table_loading_progress)
         index = self.table_tabs.addTab(table, table.get_icon(), table.get_name())
 
         if activate:
@@ -748,6 +874,20 @@ class MusicPlayer(QMainWindow):
 
         return table
 
+    def on_table_loading_progress(self, loaded: int, found: int, scanning: bool):
+        table: SongTable = self.sender()
+
+        if scanning:
+            self.status_progress.setRange(0, 0)
+            self.update_status_label(_("Scanning {0}: {1} files found, {2} loaded").format(table.get_name(), found, loaded))
+        elif loaded < found:
+            self.status_progress.setRange(0, found)
+            self.status_progress.setValue(loaded)
+            self.update_status_label(_("Loading {0}: {1} of {2} files").format(table.get_name(), loaded, found))
+        else:
+            self.status_progress.setRange(0, 0)
+            self.update_status_label(_("Loaded {0} files").format(loaded), False)
+
     def attach_song_table(self, table: SongTable):
         table.item_double_clicked.connect(self.play_track)
         table.content_changed.connect(self.on_table_content_changed)
@@ -802,6 +942,7 @@ class MusicPlayer(QMainWindow):
     def on_table_tab_close(self, index: int):
         table: SongTable = self.table_tabs.widget(index)
         if table:
+            table.cancel_loading()
             self.detach_song_table(table)
             if self.old_table == table:
                 self.old_table = None
@@ -897,10 +1038,10 @@ class MusicPlayer(QMainWindow):
             table = self.table_tabs.widget(i)
             if table.playlist == playlist:
                 table.table_model.addRows(songs)
+                table.update_playlist()
                 break
-
-        if table:
-            create_m3u(table.mp3_datas(), playlist)
+        else:
+            self.playlist_writer.append(playlist, songs)
 
     def get_open_tables(self) -> list[PathLike[str]]:
         open_tables = []
@@ -928,16 +1069,12 @@ class MusicPlayer(QMainWindow):
                 self.statusBar().showMessage(_("Directory already opened"))
                 return None
 
-            self.statusBar().showMessage(_("Loading directory"), 5000)
-            QApplication.processEvents()
-
             AppSettings.setValue(SettingKeys.LAST_DIRECTORY, directory)
 
             table = self.add_table_tab(directory, lazy=lazy, activate=activate)
 
             AppSettings.setValue(SettingKeys.OPEN_TABLES, self.get_open_tables())
 
-            self.statusBar().clearMessage()
             return table
         except Exception as e:
             traceback.print_exc()
@@ -952,13 +1089,16 @@ class MusicPlayer(QMainWindow):
 
         for i in reversed(range(self.table_tabs.count())):
             if i != current_index:
+                self.table(i).cancel_loading()
                 self.table_tabs.removeTab(i)
 
     def close_tables_all(self):
+        for i in range(self.table_tabs.count()):
+            self.table(i).cancel_loading()
         self.table_tabs.clear()
 
     def close_tables_current(self):
-        self.table_tabs.removeTab(self.table_tabs.currentIndex())
+        self.on_table_tab_close(self.table_tabs.currentIndex())
 
     def reload_table(self, checked:bool = False, index: int = None):
         if index is None:
@@ -1017,6 +1157,8 @@ class MusicPlayer(QMainWindow):
 
         if entry is not None:
             self.apply_light_settings(entry)
+            # a queued analysis of the playing track jumps the queue
+            self.analyzer.prioritize(entry.path, JobPriority.PLAYING)
 
         self.player.play_track(index, entry)
 
@@ -1075,6 +1217,8 @@ def main():
 
 
 if __name__ == "__main__":
+    # the offline analyzer starts worker processes, which re-run the frozen executable
+    multiprocessing.freeze_support()
     try:
         main()
     except Exception as e:
@@ -0,0 +1,201 @@
+"""
+Drives Analyzer.process over a synthetic library against the stand-in Voxalyzer and reports throughput and tail latency.
+
+    python -m benchmarks.analyzer_load [--files 200] [--mode local|upload] [--latency 200] [--failure-rate 0.05] ...
+
+local runs the stand-in through the Voxalyzer command setting, so requests carry file paths like with
+LocalVoxalyzerAnalyzer. upload starts a single stand-in and sends the audio like VoxalyzerAnalyzer.
+Settings, journal and result cache live in a temporary directory, the real ones are not touched.
+"""
+import argparse
+import gettext
+import json
+import logging
+import os
+import shlex
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+from pathlib import Path
+
+from PySide6.QtCore import QCoreApplication, QSettings, QTimer
+
+# 128 kbit/s, 44.1 kHz mono MPEG1 layer III frame without padding, a zero side info decodes to silence
+FRAME_HEADER = b"\xFF\xFB\x90\xC0"
+FRAME_LENGTH = 417
+
+
+def write_library(directory: Path, count: int, size: int) -> int:
+    """Writes count silent MP3s of about size bytes, returns the total size. Every file gets unique audio bytes."""
+    directory.mkdir(parents=True, exist_ok=True)
+    run = uuid.uuid4().hex
+    frames = max(1, size // FRAME_LENGTH)
+    silent_frame = FRAME_HEADER + bytes(FRAME_LENGTH - len(FRAME_HEADER))
+    total = 0
+    for index in range(count):
+        marker = "{0}:{1}".format(run, index).encode()
+        # the marker ends up in the ancillary data, which decoders ignore
+        first_frame = silent_frame[:FRAME_LENGTH - len(marker)] + marker
+        with open(directory.joinpath("track_{0:05d}.mp3".format(index)), "wb") as f:
+            f.write(first_frame + silent_frame * (frames - 1))
+            total += f.tell()
+    return total
+
+
+def percentile(values: list[float], share: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def server_stats(urls: list[str]) -> dict[str, int]:
+    totals = {}
+    for url in urls:
+        try:
+            with urllib.request.urlopen(url + "/health", timeout=2) as response:
+                for key, value in json.loads(response.read()).items():
+                    if isinstance(value, int):
+                        totals[key] = totals.get(key, 0) + value
+        except OSError:
+            pass
+    return totals
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Analyzer load test against the stand-in Voxalyzer")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--size-kb", type=int, default=512, help="size of each synthetic file")
+    parser.add_argument("--mode", choices=["local", "upload"], default="local")
+    parser.add_argument("--instances", type=int, default=1, help="stand-in processes in local mode")
+    parser.add_argument("--batch-size", type=int, default=1, help="files per request in local mode")
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds until the run is aborted")
+    parser.add_argument("--excerpt-min-length", type=int, default=0)
+    # passed on to the stand-in
+    parser.add_argument("--latency", type=float, default=200.0)
+    parser.add_argument("--jitter", type=float, default=50.0)
+    parser.add_argument("--latency-per-mb", type=float, default=0.0)
+    parser.add_argument("--overhead", type=float, default=50.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--queue-timeout", type=float, default=2.0)
+    parser.add_argument("--no-batch", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    options = parse_arguments()
+    work_directory = Path(tempfile.mkdtemp(prefix="analyzer_load_"))
+
+    # settings, journal and result cache of the run are kept apart from the real ones
+    os.environ["APPDATA"] = str(work_directory.joinpath("appdata"))
+    QSettings.setDefaultFormat(QSettings.Format.IniFormat)
+    QSettings.setPath(QSettings.Format.IniFormat, QSettings.Scope.UserScope, str(work_directory.joinpath("settings")))
+    gettext.install("DungeonTuber")
+
+    from config.log import StrFormatLogRecord
+    from config.settings import AppSettings, SettingKeys, get_category_keys
+    from logic import analyzer as analyzer_module
+    from logic.analyzer import Analyzer, stop_voxalyzer
+    from logic.progress import AnalysisProgress
+    from logic.voxalyzer import PORT_PATTERN
+
+    logging.setLogRecordFactory(StrFormatLogRecord)
+    app = QCoreApplication([])
+
+    library = work_directory.joinpath("library")
+    library_size = write_library(library, options.files, options.size_kb * 1024)
+
+    server_arguments = [sys.executable, "-m", "benchmarks.standin_voxalyzer", "--latency", str(options.latency), "--jitter", str(options.jitter),
+                        "--latency-per-mb", str(options.latency_per_mb), "--overhead", str(options.overhead),
+                        "--failure-rate", str(options.failure_rate), "--concurrency", str(options.concurrency),
+                        "--queue-timeout", str(options.queue_timeout), "--seed", str(options.seed),
+                        "--categories", ",".join(get_category_keys())] + (["--no-batch"] if options.no_batch else [])
+
+    server = None
+    AppSettings.setValue(SettingKeys.EXCERPT_MIN_LENGTH, options.excerpt_min_length)
+    if options.mode == "local":
+        AppSettings.setValue(SettingKeys.VOXALYZER_LOCAL, True)
+        AppSettings.setValue(SettingKeys.VOXALYZER_COMMAND, subprocess.list2cmdline(server_arguments) if os.name == "nt" else shlex.join(server_arguments))
+        AppSettings.setValue(SettingKeys.VOXALYZER_INSTANCES, options.instances)
+        AppSettings.setValue(SettingKeys.VOXALYZER_BATCH_SIZE, options.batch_size)
+    else:
+        server = subprocess.Popen(server_arguments, stdout=subprocess.PIPE, text=True)
+        url = "http://127.0.0.1:{0}".format(PORT_PATTERN.search(server.stdout.readline()).group(1))
+        AppSettings.setValue(SettingKeys.VOXALYZER_LOCAL, False)
+        AppSettings.setValue(SettingKeys.VOXALYZER_URL, url)
+
+    analyzer = Analyzer.get_analyzer()
+    print("Analyzer:        {0}, {1} files of {2} KB".format(type(analyzer).__name__, options.files, options.size_kb))
+
+    # latency of every request, divided by the files it carried
+    latencies: list[float] = []
+    file_latencies: list[float] = []
+
+    def timed(function, count):
+        def call(files):
+            start = time.perf_counter()
+            try:
+                return function(files)
+            finally:
+                elapsed = time.perf_counter() - start
+                latencies.append(elapsed)
+                file_latencies.extend([elapsed / count(files)] * count(files))
+        return call
+
+    analyzer.analyze_mp3 = timed(analyzer.analyze_mp3, lambda files: 1)
+    analyzer.analyze_mp3s = timed(analyzer.analyze_mp3s, len)
+
+    last_progress = AnalysisProgress()
+
+    def on_progress(progress: AnalysisProgress):
+        nonlocal last_progress
+        last_progress = progress
+        if progress.finished and progress.done >= options.files:
+            app.quit()
+
+    analyzer.aggregator.updated.connect(on_progress)
+    QTimer.singleShot(int(options.timeout * 1000), app.quit)
+
+    start = time.perf_counter()
+    analyzer.process(str(library))
+    app.exec()
+    elapsed = time.perf_counter() - start
+
+    if options.mode == "local" and analyzer_module.voxalyzer_pool is not None:
+        urls = [instance.url for instance in analyzer_module.voxalyzer_pool.instances if instance.url]
+    else:
+        urls = [url]
+    stats = server_stats(urls)
+
+    done = last_progress.analyzed + last_progress.failed
+    print("Analyzed:        {0}, failed {1}, skipped {2} in {3:.1f} s{4}".format(last_progress.analyzed, last_progress.failed,
+                                                                                last_progress.skipped, elapsed,
+                                                                                "" if done >= options.files else " (timed out)"))
+    print("Throughput:      {0:.2f} files/s, {1:.2f} MB/s".format(done / elapsed, library_size * done / options.files / elapsed / (1024 * 1024)))
+    print("Requests:        {0} sent, {1} retried files, final concurrency {2:.1f}".format(len(latencies), analyzer.pipeline.retried,
+                                                                                         analyzer.pipeline.limiter.limit))
+    if stats:
+        print("Server:          {0} requests, {1} failures, {2} rejected".format(stats.get("requests", 0), stats.get("failures", 0),
+                                                                                  stats.get("rejected", 0)))
+    if latencies:
+        print("Request latency: p50 {0:.0f} ms, p95 {1:.0f} ms, p99 {2:.0f} ms, max {3:.0f} ms".format(
+            *(1000 * percentile(latencies, share) for share in (0.5, 0.95, 0.99, 1.0))))
+        print("Per file:        mean {0:.0f} ms, p99 {1:.0f} ms".format(1000 * statistics.mean(file_latencies), 1000 * percentile(file_latencies, 0.99)))
+
+    analyzer.shutdown()
+    stop_voxalyzer()
+    if server is not None:
+        server.terminate()
+        server.wait()
+    shutil.rmtree(work_directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Measures the memory footprint of Mp3Entry objects for a synthetic library.
+
+    python -m benchmarks.entry_memory [count]
+
+Compares the compact Mp3Entry (interned strings, tag tuples, fixed-slot category array)
+against a replica of the previous layout using a fresh list and dict per entry.
+"""
+import gettext
+import random
+import sys
+import tracemalloc
+from pathlib import Path
+
+gettext.install("DungeonTuber")
+
+from config.settings import get_category_keys  # noqa: E402
+from logic.mp3 import Mp3Entry  # noqa: E402
+
+ARTISTS = ["Artist {0}".format(i) for i in range(40)]
+ALBUMS = ["Album {0}".format(i) for i in range(120)]
+GENRES = ["Ambient", "Soundtrack", "Folk", "Medieval", "Orchestral", "Electronic"]
+TAGS = ["battle", "tavern", "forest", "dungeon", "rain", "city", "tension", "calm", "boss", "night"]
+
+
+class LegacyEntry(object):
+    __slots__ = ["index", "name", "path", "title", "artist", "album", "summary", "genres", "length", "favorite", "categories", "_tags",
+                 "_has_cover", "_cover_key", "bpm", "_moods", "light", "chapters"]
+
+    def __init__(self, name, path, categories, tags, artist, album, title, genre):
+        self.name = name
+        self.path = path
+        self.title = title
+        self.artist = artist
+        self.album = album
+        self.genres = genre
+        self.summary = ""
+        self.length = -1
+        self.favorite = False
+        self.categories = categories
+        self._tags = tags
+        self._has_cover = None
+        self._cover_key = None
+        self.bpm = None
+        self.index = None
+        self.light = None
+        self.chapters = []
+
+
+def _synthetic_rows(count: int) -> list[dict]:
+    rng = random.Random(42)
+    keys = get_category_keys()
+    rows = []
+    for i in range(count):
+        # strings are rebuilt for every row just like they come out of the ID3 parser
+        rows.append({
+            "name": "Track {0}".format(i),
+            "path": Path("/music/library/track_{0}.mp3".format(i)),
+            "title": "Title {0}".format(i),
+            "artist": "".join(rng.choice(ARTISTS)),
+            "album": "".join(rng.choice(ALBUMS)),
+            "genre": ["".join(g) for g in rng.sample(GENRES, 2)],
+            "tags": ["".join(t) for t in rng.sample(TAGS, 4)],
+            "categories": {"".join(k): rng.randint(0, 10) for k in keys},
+        })
+    return rows
+
+
+def _measure(factory, count: int) -> tuple[int, list]:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    rows = _synthetic_rows(count)
+    entries = [factory(**row) for row in rows]
+    # only what the entries keep alive counts, the parsed rows are dropped
+    del rows
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, entries
+
+
+def main(count: int = 20000):
+    legacy_size, _legacy = _measure(LegacyEntry, count)
+    compact_size, _compact = _measure(Mp3Entry, count)
+
+    print("Entries:         {0}".format(count))
+    print("Legacy layout:   {0:.2f} MB ({1:.0f} bytes/entry)".format(legacy_size / 1024 / 1024, legacy_size / count))
+    print("Compact layout:  {0:.2f} MB ({1:.0f} bytes/entry)".format(compact_size / 1024 / 1024, compact_size / count))
+    print("Saved:           {0:.1f} %".format(100 * (1 - compact_size / legacy_size)))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,86 @@
+"""
+Compares the analysis of whole files with the analysis of excerpts.
+
+    python -m benchmarks.excerpt_drift <directory> [min_length] [windows] [window_length]
+
+Every MP3 in the directory longer than min_length seconds is analyzed twice by the configured
+Voxalyzer, once as a whole and once from excerpts. Reports the time saved and how far the
+categories of the excerpt analysis drift from those of the whole file. No tags are written.
+"""
+import gettext
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+gettext.install("DungeonTuber")
+
+from PySide6.QtCore import QCoreApplication  # noqa: E402
+
+from config.settings import DEFAULT_EXCERPT_WINDOWS, DEFAULT_EXCERPT_WINDOW_LENGTH  # noqa: E402
+from logic.analyzer import Analyzer, stop_voxalyzer  # noqa: E402
+from logic.excerpt import audio_length  # noqa: E402
+
+
+def _analyze(analyzer: Analyzer, file_path: Path, min_length: int) -> tuple[float, dict[str, int] | None]:
+    analyzer.excerpt_min_length = min_length
+    start = time.perf_counter()
+    response = analyzer.analyze_mp3(file_path)
+    elapsed = time.perf_counter() - start
+    categories = response.get("categories") if isinstance(response, dict) else None
+    if isinstance(categories, list):
+        categories = {item["category"]: item["scale"] for item in categories}
+    return elapsed, categories
+
+
+def main(directory: str, min_length: int = 600, windows: int = DEFAULT_EXCERPT_WINDOWS,
+         window_length: int = DEFAULT_EXCERPT_WINDOW_LENGTH):
+    app = QCoreApplication([])
+    analyzer = Analyzer.get_analyzer()
+    if not analyzer.supports_excerpt:
+        print("No Voxalyzer configured")
+        return
+    analyzer.excerpt_windows = windows
+    analyzer.excerpt_window_length = window_length
+
+    files = [path for path in sorted(Path(directory).rglob("*.mp3")) if audio_length(path) > min_length]
+    print("Files:           {0} longer than {1} s, {2} x {3} s excerpts".format(len(files), min_length, windows, window_length))
+
+    full_time = 0.0
+    excerpt_time = 0.0
+    drifts = []
+    if files:
+        # the start of a local Voxalyzer is not part of either measurement
+        _analyze(analyzer, files[0], min_length)
+
+    for file_path in files:
+        full_elapsed, full = _analyze(analyzer, file_path, 0)
+        excerpt_elapsed, excerpted = _analyze(analyzer, file_path, min_length)
+        if not full or not excerpted:
+            print("{0}: no categories".format(file_path.name))
+            continue
+
+        full_time += full_elapsed
+        excerpt_time += excerpt_elapsed
+        file_drifts = [abs(full[key] - excerpted[key]) for key in full.keys() & excerpted.keys()]
+        drifts.extend(file_drifts)
+        print("{0}: {1:.1f} s -> {2:.1f} s, max drift {3}".format(file_path.name, full_elapsed, excerpt_elapsed, max(file_drifts, default=0)))
+
+    if drifts:
+        print("Whole files:     {0:.1f} s".format(full_time))
+        print("Excerpts:        {0:.1f} s".format(excerpt_time))
+        print("Saved:           {0:.1f} %".format(100 * (1 - excerpt_time / full_time) if full_time else 0.0))
+        print("Mean drift:      {0:.2f} levels".format(statistics.mean(drifts)))
+        print("Drift > 1 level: {0:.1f} % of categories".format(100 * sum(1 for drift in drifts if drift > 1) / len(drifts)))
+
+    analyzer.shutdown()
+    stop_voxalyzer()
+    del app
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or not os.path.isdir(sys.argv[1]):
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1], *[int(argument) for argument in sys.argv[2:5]])
@@ -0,0 +1,220 @@
+"""
+Lightweight stand-in for the Voxalyzer server, for load tests without the real models.
+
+    python -m benchmarks.standin_voxalyzer [--port 0] [--latency 200] [--failure-rate 0.05] [--concurrency 4] ...
+
+Implements the contract used by the analyzers:
+
+    POST /analyze        {"file": path} from the local analyzer or the uploaded MP3 as request body
+    POST /analyze/batch  {"files": [path, ...]}, answered with {"results": [...]}
+    GET  /health
+
+Results are derived from a hash of the file, so the same file always gets the same categories.
+Whether an attempt fails only depends on the file and the number of its attempt, not on the timing.
+Like Voxalyzer it prints the address it listens on, so it can be used as Voxalyzer command in the settings.
+"""
+import argparse
+import gettext
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+gettext.install("DungeonTuber")
+
+from config.settings import get_category_keys, CATEGORY_MIN, CATEGORY_MAX  # noqa: E402
+
+TAGS = ["battle", "tavern", "forest", "dungeon", "rain", "city", "tension", "calm", "boss", "night"]
+
+
+class StandInState:
+
+    def __init__(self, options: argparse.Namespace):
+        self.options = options
+        self.categories = options.categories.split(",") if options.categories else get_category_keys()
+        self.slots = threading.BoundedSemaphore(options.concurrency) if options.concurrency > 0 else None
+        self.lock = threading.Lock()
+        self.attempts: dict[str, int] = {}
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def attempt(self, key: str) -> int:
+        with self.lock:
+            attempt = self.attempts.get(key, 0)
+            self.attempts[key] = attempt + 1
+            return attempt
+
+    def fails(self, key: str) -> bool:
+        attempt = self.attempt(key)
+        roll = int.from_bytes(hashlib.blake2b("{0}:{1}:{2}".format(self.options.seed, key, attempt).encode(), digest_size=4).digest())
+        return roll / 0xFFFFFFFF < self.options.failure_rate
+
+    def delay(self, size: int, files: int = 1) -> float:
+        """Seconds to answer a request, the per request overhead is shared by the files of a batch."""
+        jitter = random.uniform(-self.options.jitter, self.options.jitter)
+        per_file = max(0.0, self.options.latency + jitter) + self.options.latency_per_mb * size / (1024 * 1024)
+        return (self.options.overhead + per_file * files) / 1000
+
+    def result(self, key: str, name: str) -> dict:
+        digest = hashlib.blake2b(key.encode(), digest_size=32).digest()
+        generator = random.Random(digest)
+        return {
+            "summary": "Stand-in analysis of {0}.".format(name),
+            "categories": [{"category": category, "scale": generator.randint(CATEGORY_MIN, CATEGORY_MAX)} for category in self.categories],
+            "tags": generator.sample(TAGS, 3),
+        }
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # keep-alive like the real server
+    protocol_version = "HTTP/1.1"
+    state: StandInState
+
+    def log_message(self, format, *args):
+        if self.state.options.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, data, headers: dict[str, str] = None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/health":
+            state = self.state
+            self._send_json(200, {"status": "ok", "in_flight": state.in_flight, "requests": state.requests,
+                                  "failures": state.failures, "rejected": state.rejected})
+        else:
+            self._send_json(404, {"detail": "Not Found"})
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        if path not in ("/analyze", "/analyze/batch") or (path == "/analyze/batch" and self.state.options.no_batch):
+            self._read_body()
+            self._send_json(404, {"detail": "Not Found"})
+            return
+
+        body = self._read_body()
+        state = self.state
+        with state.lock:
+            state.requests += 1
+
+        # a full server lets requests wait for a while before turning them away
+        if state.slots is not None and not state.slots.acquire(timeout=state.options.queue_timeout):
+            with state.lock:
+                state.rejected += 1
+            self._send_json(503, {"detail": "Server busy"}, {"Retry-After": "1"})
+            return
+
+        with state.lock:
+            state.in_flight += 1
+        try:
+            if path == "/analyze/batch":
+                self._analyze_batch(json.loads(body))
+            elif self.headers.get("Content-Type", "").startswith("application/json"):
+                self._analyze_file(json.loads(body)["file"])
+            else:
+                self._analyze_upload(body)
+        except (ValueError, KeyError) as e:
+            self._send_json(422, {"detail": str(e)})
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+            if state.slots is not None:
+                state.slots.release()
+
+    def _fail(self) -> bool:
+        with self.state.lock:
+            self.state.failures += 1
+        self._send_json(500, {"detail": "Simulated failure"})
+        return True
+
+    def _analyze_file(self, file_path: str):
+        if not os.path.isfile(file_path):
+            self._send_json(404, {"detail": "File not found: {0}".format(file_path)})
+            return
+
+        time.sleep(self.state.delay(os.path.getsize(file_path)))
+        if self.state.fails(file_path):
+            self._fail()
+        else:
+            self._send_json(200, self.state.result(file_path, os.path.basename(file_path)))
+
+    def _analyze_upload(self, body: bytes):
+        key = hashlib.blake2b(body, digest_size=20).hexdigest()
+        time.sleep(self.state.delay(len(body)))
+        if self.state.fails(key):
+            self._fail()
+        else:
+            self._send_json(200, self.state.result(key, key[:8]))
+
+    def _analyze_batch(self, data: dict):
+        files = data["files"]
+        sizes = [os.path.getsize(file_path) if os.path.isfile(file_path) else 0 for file_path in files]
+        time.sleep(self.state.delay(sum(sizes) // max(1, len(files)), len(files)))
+
+        results = []
+        for file_path in files:
+            if not os.path.isfile(file_path):
+                results.append({"file": file_path, "error": "File not found"})
+            elif self.state.fails(file_path):
+                with self.state.lock:
+                    self.state.failures += 1
+                results.append({"file": file_path, "error": "Simulated failure"})
+            else:
+                results.append({"file": file_path, **self.state.result(file_path, os.path.basename(file_path))})
+        self._send_json(200, {"results": results})
+
+
+def parse_arguments(arguments: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Stand-in Voxalyzer server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--latency", type=float, default=200.0, help="milliseconds per file")
+    parser.add_argument("--jitter", type=float, default=50.0, help="random milliseconds added to or removed from the latency")
+    parser.add_argument("--latency-per-mb", type=float, default=0.0, help="additional milliseconds per MB of audio")
+    parser.add_argument("--overhead", type=float, default=50.0, help="milliseconds per request")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of attempts answered with status 500")
+    parser.add_argument("--concurrency", type=int, default=4, help="requests processed at the same time, 0 for no limit")
+    parser.add_argument("--queue-timeout", type=float, default=2.0, help="seconds a request waits for a slot before status 503")
+    parser.add_argument("--no-batch", action="store_true", help="answer /analyze/batch with 404 like older servers")
+    parser.add_argument("--categories", help="comma separated category keys, defaults to the configured ones")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true")
+    return parser.parse_args(arguments)
+
+
+def main(arguments: list[str] = None):
+    options = parse_arguments(arguments)
+    StandInHandler.state = StandInState(options)
+
+    server = ThreadingHTTPServer((options.host, options.port), StandInHandler)
+    server.daemon_threads = True
+    host, port = server.server_address[:2]
+    # same form as the uvicorn output the analyzer looks for
+    print("Stand-in Voxalyzer running on http://{0}:{1} (Press CTRL+C to quit)".format(host, port), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        state = StandInHandler.state
+        print("Requests: {0}, failures: {1}, rejected: {2}".format(state.requests, state.failures, state.rejected), flush=True)
+
+
+if __name__ == "__main__":
+    main()
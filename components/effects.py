@@ -1,5 +1,3 @@
-import os
-
 from PySide6.QtCore import QModelIndex, QPersistentModelIndex, QEvent, QSortFilterProxyModel, Qt, \
     Signal, QRect, QSize, QAbstractTableModel, QAbstractItemModel, QPoint
 from PySide6.QtGui import QIcon, QAction, QColor, QPainter, QPalette, QPen, QKeyEvent, \
@@ -12,6 +10,7 @@ from config.settings import AppSettings, SettingKeys
 from config.theme import app_theme
 from logic.audioengine import AudioEngine
 from logic.mp3 import EffectEntry, Mp3Entry
+from logic.scanner import scan
 
 
 def _get_grid_width(total_width: int):
@@ -626,11 +625,7 @@ class EffectWidget(QFrame):
         if self.open_item is not None:
             self.layout.removeWidget(self.open_item)
             self.open_item.setParent(None)
-        try:
-            with os.scandir(dir_path) as entries:
-                effects: list[EffectEntry] = [EffectEntry.from_file(entry) for entry in entries if entry.is_dir() or entry.name.lower().endswith(".mp3")]
-        except OSError:
-            effects = []
+        effects: list[EffectEntry] = [EffectEntry.from_file(entry.path) for entry in scan(dir_path, recursive=False, include_dirs=True)]
         effects = [effect for effect in effects if effect is not None]
         self.list_widget.setModel(EffectTableModel(effects))
 
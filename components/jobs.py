@@ -0,0 +1,91 @@
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QIcon, QAction
+from PySide6.QtWidgets import QDialog, QVBoxLayout, QFormLayout, QLabel, QProgressBar, QHBoxLayout, QToolButton
+
+from logic.progress import AnalysisProgress
+
+
+def format_eta(seconds: float | None) -> str:
+    if seconds is None:
+        return "--:--"
+    seconds = round(seconds)
+    if seconds >= 3600:
+        return "{0}:{1:02d}:{2:02d}".format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+    return "{0:02d}:{1:02d}".format(seconds // 60, seconds % 60)
+
+
+def progress_summary(progress: AnalysisProgress) -> str:
+    """Short one line form for the status bar."""
+    if progress.finished:
+        return _("Analysis: {0} of {1} done, {2} failed").format(progress.done, progress.total, progress.failed)
+    return _("Analysis: {0} of {1}, {2:.1f} files/s, ETA {3}").format(progress.done, progress.total, progress.files_per_second,
+                                                                       format_eta(progress.eta))
+
+
+class JobsDialog(QDialog):
+    """Non modal panel showing the progress of the running analysis."""
+
+    def __init__(self, actions: list[QAction] = None, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(_("Analysis Jobs"))
+        self.setWindowIcon(QIcon.fromTheme(QIcon.ThemeIcon.Scanner))
+        self.setModal(False)
+        self.setMinimumWidth(360)
+
+        layout = QVBoxLayout(self)
+
+        self.current_label = QLabel()
+        self.current_label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        layout.addWidget(self.current_label)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 1)
+        layout.addWidget(self.progress_bar)
+
+        form_layout = QFormLayout()
+        self.running_label = QLabel()
+        form_layout.addRow(_("Running"), self.running_label)
+        self.queued_label = QLabel()
+        form_layout.addRow(_("Queued"), self.queued_label)
+        self.analyzed_label = QLabel()
+        form_layout.addRow(_("Analyzed"), self.analyzed_label)
+        self.skipped_label = QLabel()
+        form_layout.addRow(_("Skipped"), self.skipped_label)
+        self.cache_hits_label = QLabel()
+        form_layout.addRow(_("Cache Hits"), self.cache_hits_label)
+        self.failed_label = QLabel()
+        form_layout.addRow(_("Failed"), self.failed_label)
+        self.throughput_label = QLabel()
+        form_layout.addRow(_("Throughput"), self.throughput_label)
+        self.eta_label = QLabel()
+        form_layout.addRow(_("Remaining"), self.eta_label)
+        layout.addLayout(form_layout)
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        for action in actions or []:
+            button = QToolButton()
+            button.setToolButtonStyle(Qt.ToolButtonStyle.ToolButtonTextBesideIcon)
+            button.setDefaultAction(action)
+            button_layout.addWidget(button)
+        layout.addLayout(button_layout)
+
+        self.update_progress(AnalysisProgress())
+
+    def update_progress(self, progress: AnalysisProgress):
+        self.current_label.setText(_("Analyzing {0}...").format(progress.current) if progress.current else
+                                   _("Analysis finished") if progress.total else _("No analysis running"))
+
+        self.progress_bar.setRange(0, max(1, progress.total))
+        self.progress_bar.setValue(progress.done)
+        self.progress_bar.setFormat(_("{0} of {1}").format(progress.done, progress.total))
+
+        self.running_label.setText(str(progress.running))
+        self.queued_label.setText(str(progress.queued))
+        self.analyzed_label.setText(str(progress.analyzed))
+        self.skipped_label.setText(str(progress.skipped))
+        self.cache_hits_label.setText(str(progress.cache_hits))
+        self.failed_label.setText(str(progress.failed))
+        self.throughput_label.setText(_("{0:.1f} files/s, {1:.2f} MB/s").format(progress.files_per_second,
+                                                                                progress.bytes_per_second / (1024 * 1024)))
+        self.eta_label.setText(format_eta(progress.eta))
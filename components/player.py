@@ -186,6 +186,9 @@ class PlayerWidget(QFrame):
 
     current_index = QPersistentModelIndex()
     current_data: Mp3Entry = None
+    # the track the engine continues with when the current one ends
+    next_index = QPersistentModelIndex()
+    next_data: Mp3Entry = None
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -199,6 +202,9 @@ class PlayerWidget(QFrame):
         self.engine.state_changed.connect(self.on_playback_state_changed)
         self.engine.position_changed.connect(self.update_progress)
         self.engine.track_finished.connect(self.on_track_finished)
+        self.engine.track_ending.connect(self.preload_next_track)
+        self.engine.track_advanced.connect(self.on_track_advanced)
+        self._advancing = False
 
         self.seeker_layout = QVBoxLayout()
         self.seeker_layout.setObjectName("seeker_layout")
@@ -359,6 +365,8 @@ class PlayerWidget(QFrame):
 
     def on_repeat_mode_changed(self, mode: RepeatMode):
         AppSettings.setValue(SettingKeys.REPEAT_MODE, self.btn_repeat.REPEAT_MODES.index(mode))
+        # the engine asks again for the next track if the current one is about to end
+        self.engine.cancel_preload()
 
     def repeat_mode(self):
         return self.btn_repeat.repeat_mode()
@@ -421,6 +429,33 @@ class PlayerWidget(QFrame):
         elif repeat_mode == RepeatMode.NO_REPEAT:
             self.engine.stop()
 
+    def preload_next_track(self):
+        """Tells the engine which track follows, in the same order as on_track_finished would play it."""
+        repeat_mode = self.btn_repeat.repeat_mode()
+        if repeat_mode == RepeatMode.REPEAT_SINGLE:
+            next_index, next_data = self.current_index, self.current_data
+        elif repeat_mode == RepeatMode.REPEAT_ALL:
+            next_index = self._increment_persistent_index(self.current_index, 1)
+            next_data = next_index.data(Qt.ItemDataRole.UserRole) if next_index.isValid() else None
+        else:
+            return
+
+        if next_data is None:
+            return
+        self.next_index, self.next_data = next_index, next_data
+        self.engine.preload(next_data.path)
+
+    def on_track_advanced(self, track_path: str):
+        if self.next_data is None or str(self.next_data.path) != track_path:
+            return
+        # selection, lights and labels follow the track, but the engine is already playing it
+        self._advancing = True
+        try:
+            self.track_changed.emit(self.next_index, self.next_data)
+        finally:
+            self._advancing = False
+            self.next_index, self.next_data = QPersistentModelIndex(), None
+
     def toggle_play(self):
         if self.engine.is_playing():
             self.engine.pause_toggle()
@@ -488,7 +523,8 @@ class PlayerWidget(QFrame):
                 self.visualizer.set_state(EngineState.PLAY, self.slider_vol.volume)
                 self.elide_text(self.track_label, data.name)
 
-                self.engine.play(track_path)
+                if not (self._advancing and self.engine.current_path == str(track_path)):
+                    self.engine.play(track_path)
                 self.progress_slider.setMaximum(data.length_in_ms)
                 self.progress_slider.set_chapters(data.chapters)
 
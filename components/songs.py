@@ -7,7 +7,7 @@ from os import PathLike
 from pathlib import Path
 
 from PySide6.QtCore import QSortFilterProxyModel, Signal, Qt, QModelIndex, QMimeData, QByteArray, QDataStream, QIODevice, QPersistentModelIndex, \
-    QAbstractTableModel, QSize, QObject, QEvent, QPoint, QFileInfo, QRect, QPointF
+    QAbstractTableModel, QSize, QObject, QEvent, QPoint, QFileInfo, QRect, QPointF, QThread
 from PySide6.QtGui import QColor, QBrush, QIcon, QLinearGradient, QGradient, QAction, QKeyEvent, QDragMoveEvent, QDragEnterEvent, QPainter, QPalette, \
     QFontMetrics, QDropEvent, QPolygonF, QPainterStateGuard, QPen
 from PySide6.QtWidgets import QMessageBox, QAbstractItemView, QWidget, QHeaderView, QMenu, QStyleOptionViewItem, QStyledItemDelegate, QStyle, QTableView
@@ -20,7 +20,9 @@ from config.settings import AppSettings, SettingKeys, MusicCategory, get_music_c
 from config.theme import app_theme, _alpha
 
 from logic.mp3 import Mp3Entry, update_mp3_favorite, update_mp3_title, update_mp3_album, update_mp3_artist, update_mp3_genre, update_mp3_bpm, \
-    update_mp3_category, Mp3FileLoader, save_playlist, remove_m3u, append_m3u, parse_mp3, update_mp3_tags, get_m3u_paths, update_mp3_summary
+    update_mp3_category, Mp3FileLoader, get_playlist_writer, parse_mp3, update_mp3_tags, read_m3u, update_mp3_summary, \
+    PlaylistItem, PlaylistValidator
+from logic.scanner import DirectoryScanner, ScanEntry
 
 logger = logging.getLogger(__file__)
 
@@ -333,7 +335,8 @@ class SongTableModel(QAbstractTableModel):
     def addRows(self, data: list[Mp3Entry]):
         row_position = self.rowCount()
 
-        data = [item for item in data if item not in self._data]
+        existing = set(self._data)
+        data = [item for item in data if item not in existing]
 
         # 2. Notify the view that rows are about to be inserted
         self.beginInsertRows(QModelIndex(), row_position, row_position + len(data) - 1)
@@ -348,7 +351,8 @@ class SongTableModel(QAbstractTableModel):
         else:
             row_position = index
 
-        data = [item for item in data if item not in self._data]
+        existing = set(self._data)
+        data = [item for item in data if item not in existing]
 
         # 2. Notify the view that rows are about to be inserted
         self.beginInsertRows(QModelIndex(), row_position, row_position + len(data) - 1)
@@ -362,6 +366,26 @@ class SongTableModel(QAbstractTableModel):
 
         self._add_available_tags_and_categories(data)
 
+    def replaceRows(self, data: list[Mp3Entry]):
+        rows = {entry: row for row, entry in enumerate(self._data)}
+        for entry in data:
+            row = rows.get(entry)
+            if row is not None:
+                self._data[row] = entry
+                self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+
+        self._add_available_tags_and_categories(data)
+
+    def removePaths(self, paths: list[Path]):
+        paths = set(paths)
+        for row in reversed(range(len(self._data))):
+            if self._data[row].path in paths:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self._data[row]
+                self.endRemoveRows()
+
+        self._update_available_tags_and_categories(self._data)
+
     def removeRow(self, row: int, /, parent: QModelIndex | QPersistentModelIndex = ...) -> bool:
         if 0 <= row < len(self._data):
             self.beginRemoveRows(QModelIndex(), row, row)
@@ -537,21 +561,30 @@ class SongTableModel(QAbstractTableModel):
             else:
                 begin_row = len(self._data)
 
-        items = [self._data[r] for r in rows]
+        rows = sorted(set(rows))
+        moved = set(rows)
+        begin_row -= sum(1 for r in rows if r < begin_row)
 
-        for r in sorted(rows, reverse=True):
-            self.beginRemoveRows(QModelIndex(), r, r)
-            del self._data[r]
-            self.endRemoveRows()
-            if r < begin_row:
-                begin_row -= 1
+        # new order as old row numbers, the whole move is a single layout change no matter how many rows are dragged
+        remaining = [r for r in range(len(self._data)) if r not in moved]
+        order = remaining[:begin_row] + rows + remaining[begin_row:]
+        if order == list(range(len(self._data))):
+            return True
 
-        self.beginInsertRows(QModelIndex(), begin_row, begin_row + len(items) - 1)
-        for i, item in enumerate(items):
-            self._data.insert(begin_row + i, item)
-        self.endInsertRows()
+        new_rows = [0] * len(order)
+        for new_row, old_row in enumerate(order):
+            new_rows[old_row] = new_row
+
+        self.layoutAboutToBeChanged.emit()
 
-        self.on_mime_drop.emit('application/x-dungeontuber-song', begin_row, begin_row + len(items) - 1)
+        old_indexes = self.persistentIndexList()
+        new_indexes = [self.index(new_rows[index.row()], index.column()) for index in old_indexes]
+        self._data[:] = [self._data[r] for r in order]
+        self.changePersistentIndexList(old_indexes, new_indexes)
+
+        self.layoutChanged.emit()
+
+        self.on_mime_drop.emit('application/x-dungeontuber-song', begin_row, begin_row + len(rows) - 1)
         return True
 
     def _calculate_score(self, data: Mp3Entry):
@@ -638,6 +671,8 @@ def _get_table_padding():
 class SongTable(QTableView):
     item_double_clicked = Signal(QPersistentModelIndex, Mp3Entry)
     content_changed = Signal()
+    # loaded entries, found files, directory scan still running
+    loading_progress = Signal(int, int, bool)
 
     analyze_file = Signal(QFileInfo)
     open_files = Signal(list[QFileInfo])
@@ -709,6 +744,9 @@ class SongTable(QTableView):
         self.source_files: list[Path] = []
         self.is_loaded = False
         self.loader = None
+        self.scanner = None
+        self.validator = None
+        self.loaded_count = 0
 
         self._load_files(mp3_files, lazy)
 
@@ -726,12 +764,22 @@ class SongTable(QTableView):
         else:
             return QIcon.fromTheme("list-music")
 
-    def _load_files(self, mp3_files: list[Path | Mp3Entry], lazy: bool = False):
+    def _load_files(self, mp3_files: list[Path | Mp3Entry] | None, lazy: bool = False):
+        if mp3_files is None and self.directory:
+            # the directory is scanned while loading, see start_lazy_loading
+            self.cancel_loading()
+            self.table_model.clear()
+            self.source_files = []
+            self.is_loaded = False
+            if not lazy:
+                self.start_lazy_loading()
+            return
+
         if not mp3_files:
             QMessageBox.information(self, _("Scan"), _("No MP3 files found."))
             return
 
-        if isinstance(mp3_files[0], Path):
+        if isinstance(mp3_files[0], (Path, PlaylistItem)):
             self.table_model.clear()
             self.source_files = mp3_files
             self.is_loaded = False
@@ -742,12 +790,10 @@ class SongTable(QTableView):
 
     def reload_files(self):
         if self.playlist:
-            mp3_files = get_m3u_paths(self.playlist)
+            mp3_files = read_m3u(self.playlist)
             self._load_files(mp3_files)
         else:
-            base_path = Path(self.directory)
-            mp3_files = list(base_path.rglob("*.mp3", case_sensitive=False))
-            self._load_files(mp3_files)
+            self._load_files(None)
 
     def get_available_categories(self) -> list[MusicCategory]:
         return self.table_model.available_categories
@@ -830,19 +876,81 @@ class SongTable(QTableView):
         if self.is_loaded or self.loader is not None:
             return
 
-        self.loader = Mp3FileLoader(self.source_files, self)
+        self.loaded_count = 0
+        if self.directory and not self.source_files:
+            self.loader = Mp3FileLoader(None, self)
+            self.scanner = DirectoryScanner(self.directory, parent=self)
+            self.scanner.files_found.connect(self.on_scan_progress)
+            self.scanner.finished.connect(self.on_scan_finished)
+        else:
+            self.loader = Mp3FileLoader(self.source_files, self)
+
         self.loader.files_loaded.connect(self.on_load_progress)
         self.loader.finished.connect(self.on_load_finished)
         self.loader.start()
 
+        if self.scanner is not None:
+            self.scanner.start()
+
+    def cancel_loading(self):
+        if self.scanner is not None:
+            self.scanner.files_found.disconnect(self.on_scan_progress)
+            self.scanner.finished.disconnect(self.on_scan_finished)
+            self.scanner.cancel()
+            self.scanner = None
+
+        if self.loader is not None:
+            self.loader.files_loaded.disconnect(self.on_load_progress)
+            self.loader.finished.disconnect(self.on_load_finished)
+            self.loader.cancel()
+            self.loader = None
+
+        if self.validator is not None:
+            self.validator.entries_updated.disconnect(self.table_model.replaceRows)
+            self.validator.entries_missing.disconnect(self.table_model.removePaths)
+            self.validator.finished.disconnect(self.on_validation_finished)
+            self.validator.cancel()
+            self.validator = None
+
+    def on_scan_progress(self, entries: list[ScanEntry]):
+        paths = [entry.path for entry in entries]
+        self.source_files.extend(paths)
+        self.loader.add_files(paths)
+        self.loading_progress.emit(self.loaded_count, len(self.source_files), True)
+
+    def on_scan_finished(self):
+        self.scanner = None
+        self.loader.close_input()
+
     def on_load_progress(self, entries: list):
         self.table_model.addRows(entries)
+        self.loaded_count += len(entries)
+        self.loading_progress.emit(self.loaded_count, len(self.source_files), self.scanner is not None)
 
     def on_load_finished(self):
         self.is_loaded = True
         self.loader = None
+        self.loading_progress.emit(self.loaded_count, len(self.source_files), False)
         self.content_changed.emit()
 
+        if self.directory and not self.source_files:
+            QMessageBox.information(self, _("Scan"), _("No MP3 files found."))
+
+        if self.playlist and self.validator is None:
+            # entries may come from the playlist cache, check them against the files once everything is shown
+            self.validator = PlaylistValidator(list(self.get_raw_data()), self)
+            self.validator.entries_updated.connect(self.table_model.replaceRows)
+            self.validator.entries_missing.connect(self.table_model.removePaths)
+            self.validator.finished.connect(self.on_validation_finished)
+            self.validator.start(QThread.Priority.LowPriority)
+
+    def on_validation_finished(self):
+        if self.validator.updated > 0:
+            logger.debug("Revalidated playlist {0}: {1} updated, {2} missing", self.playlist, self.validator.updated, self.validator.missing)
+            # only the cache lines of changed tracks are rewritten, missing tracks may just be on an unmounted drive
+            get_playlist_writer().refresh_cache(self.playlist, self.validator.updated_entries)
+        self.validator = None
+
     def changeEvent(self, event: QEvent, /):
         if event.type() == QEvent.Type.FontChange:
             self._update_table_sizes()
@@ -1055,7 +1163,7 @@ class SongTable(QTableView):
 
     def update_playlist(self):
         if self.playlist is not None:
-            save_playlist(self.playlist, self.mp3_datas())
+            get_playlist_writer().save(self.playlist, self.mp3_datas())
 
     def is_column_visible(self, category_key: str):
         if AppSettings.value(SettingKeys.DYNAMIC_TABLE_COLUMNS, False, type=bool):
@@ -1136,7 +1244,7 @@ class SongTable(QTableView):
             self.table_model.removeRow(source_index.row())
 
         if self.playlist is not None:
-            remove_m3u(datas, self.playlist)
+            get_playlist_writer().remove(self.playlist, datas)
 
     def show_context_menu(self, point: QPoint):
         # index = self.indexAt(point)
@@ -1205,10 +1313,10 @@ class SongTable(QTableView):
                 songs = [song for song in songs if song is not None]
 
                 if index.isValid():
-                    append_m3u(songs, self.playlist, index.row())
+                    get_playlist_writer().append(self.playlist, songs, index.row())
                     self.table_model.insertRows(index.row(), songs)
                 else:
-                    append_m3u(songs, self.playlist)
+                    get_playlist_writer().append(self.playlist, songs)
                     self.table_model.addRows(songs)
 
             else:
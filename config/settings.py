@@ -1,6 +1,7 @@
 import json
 import logging
 import os
+import shlex
 from dataclasses import dataclass, asdict
 from enum import StrEnum
 from functools import total_ordering
@@ -31,13 +32,36 @@ CAT_PARTY = "Party"
 CAT_RELAXED = "Relaxed"
 CAT_SAD = "Sad"
 
+DEFAULT_EXCERPT_WINDOWS = 6
+DEFAULT_EXCERPT_WINDOW_LENGTH = 20
+DEFAULT_CROSSFADE_MS = 1000
+DEFAULT_CROSSFADE_CURVE = "EQUAL_POWER"
+
 
 def has_voxalyzer():
     return has_local_voxalyzer() or AppSettings.value(SettingKeys.VOXALYZER_URL, type=str, defaultValue='') != ''
 
 
 def has_local_voxalyzer():
-    return os.path.isfile(get_executable_path("voxalyzer.exe")) and AppSettings.value(SettingKeys.VOXALYZER_LOCAL, True, type=bool)
+    return get_voxalyzer_command() is not None and AppSettings.value(SettingKeys.VOXALYZER_LOCAL, True, type=bool)
+
+
+def get_voxalyzer_command(command: str = None) -> list[str] | None:
+    """Command line of a local Voxalyzer instance, a custom command allows a stand-in server where there is no voxalyzer.exe."""
+    if command is None:
+        command = AppSettings.value(SettingKeys.VOXALYZER_COMMAND, type=str, defaultValue='')
+    if command:
+        return shlex.split(command, posix=os.name != "nt")
+
+    if os.path.isfile(get_executable_path("voxalyzer.exe")):
+        return [get_executable_path("voxalyzer.exe"), "--port", "0", "--host", "127.0.0.1"]
+    return None
+
+
+def get_voxalyzer_instances() -> int:
+    # every instance loads its own models, so only big machines run more than one by default
+    default = max(1, min(4, (os.cpu_count() or 1) // 4))
+    return max(1, AppSettings.value(SettingKeys.VOXALYZER_INSTANCES, default, type=int))
 
 
 @total_ordering
@@ -225,6 +249,8 @@ class SettingKeys(StrEnum):
     REPEAT_MODE = "repeatMode"
     VOLUME = "volume"
     NORMALIZE_VOLUME = "normalizeVolume"
+    CROSSFADE_DURATION = "crossfadeDuration"
+    CROSSFADE_CURVE = "crossfadeCurve"
     EFFECTS_DIRECTORY = "effectsDirectory"
     EFFECTS_TREE = "effectsTree"
     EFFECTS_LIST_VIEW_MODE = "effectsListViewMode"
@@ -246,6 +272,7 @@ class SettingKeys(StrEnum):
     START_TOUR = "startTour"
     OPEN_TABLES = "openTables"
     LIGHTS_WIDGET = "lightsWidget"
+    COVER_CACHE_SIZE = "coverCacheSize"
 
     TABLE_COLUMNS = "tableColumns"
     DYNAMIC_TABLE_COLUMNS = "dynamicTableColumns"
@@ -276,6 +303,13 @@ class SettingKeys(StrEnum):
 
     VOXALYZER_URL = "voxalyzerUrl"
     VOXALYZER_LOCAL = "voxalyzerLocal"
+    VOXALYZER_TIMEOUT = "voxalyzerTimeout"
+    VOXALYZER_BATCH_SIZE = "voxalyzerBatchSize"
+    VOXALYZER_COMMAND = "voxalyzerCommand"
+    VOXALYZER_INSTANCES = "voxalyzerInstances"
+    EXCERPT_MIN_LENGTH = "excerptMinLength"
+    EXCERPT_WINDOWS = "excerptWindows"
+    EXCERPT_WINDOW_LENGTH = "excerptWindowLength"
 
 
 class TabColorStyle(QProxyStyle):
@@ -346,13 +380,50 @@ class SettingsDialog(QDialog):
         self.analyzer_layout.addRow(_("Voxalyzer BaseUrl"), self.voxalyzerUrl)
 
         self.local_voxalyzer = QCheckBox(_("Use Local Voxalyzer"))
-        self.local_voxalyzer.setEnabled(os.path.isfile(get_executable_path("voxalyzer.exe")))
+        self.local_voxalyzer.setEnabled(get_voxalyzer_command() is not None)
         self.local_voxalyzer.setChecked(has_local_voxalyzer() and AppSettings.value(SettingKeys.VOXALYZER_LOCAL, True, type=bool))
         self.local_voxalyzer.clicked.connect(self._local_voxalyzer_changed)
         self.analyzer_layout.addRow("", self.local_voxalyzer)
 
         self.voxalyzerUrl.setEnabled(not self.local_voxalyzer.isEnabled() or not self.local_voxalyzer.isChecked())
 
+        self.voxalyzer_timeout = QLineEdit()
+        self.voxalyzer_timeout.setText(AppSettings.value(SettingKeys.VOXALYZER_TIMEOUT, "300", type=str))
+        self.voxalyzer_timeout.setToolTip(_("Maximum time to wait for the analysis of a file in seconds"))
+        self.analyzer_layout.addRow(_("Voxalyzer Timeout"), self.voxalyzer_timeout)
+
+        self.voxalyzer_batch_size = QLineEdit()
+        self.voxalyzer_batch_size.setText(AppSettings.value(SettingKeys.VOXALYZER_BATCH_SIZE, "1", type=str))
+        self.voxalyzer_batch_size.setToolTip(_("Number of files sent to the local Voxalyzer per request"))
+        self.analyzer_layout.addRow(_("Voxalyzer Batch Size"), self.voxalyzer_batch_size)
+
+        self.voxalyzer_command = QLineEdit()
+        self.voxalyzer_command.setPlaceholderText(" ".join(get_voxalyzer_command("") or ["voxalyzer", "--port", "0", "--host", "127.0.0.1"]))
+        self.voxalyzer_command.setText(AppSettings.value(SettingKeys.VOXALYZER_COMMAND, type=str))
+        self.voxalyzer_command.setToolTip(_("Command starting a local Voxalyzer, it has to print the address it listens on"))
+        self.voxalyzer_command.textChanged.connect(self._voxalyzer_command_changed)
+        self.analyzer_layout.addRow(_("Voxalyzer Command"), self.voxalyzer_command)
+
+        self.voxalyzer_instances = QLineEdit()
+        self.voxalyzer_instances.setText(AppSettings.value(SettingKeys.VOXALYZER_INSTANCES, str(get_voxalyzer_instances()), type=str))
+        self.voxalyzer_instances.setToolTip(_("Number of local Voxalyzer processes analyzing files in parallel"))
+        self.analyzer_layout.addRow(_("Voxalyzer Instances"), self.voxalyzer_instances)
+
+        self.excerpt_min_length = QLineEdit()
+        self.excerpt_min_length.setText(AppSettings.value(SettingKeys.EXCERPT_MIN_LENGTH, "0", type=str))
+        self.excerpt_min_length.setToolTip(_("Files longer than this many seconds are analyzed from a few excerpts, 0 analyzes every file as a whole"))
+        self.analyzer_layout.addRow(_("Excerpt Files Longer Than"), self.excerpt_min_length)
+
+        self.excerpt_windows = QLineEdit()
+        self.excerpt_windows.setText(AppSettings.value(SettingKeys.EXCERPT_WINDOWS, str(DEFAULT_EXCERPT_WINDOWS), type=str))
+        self.excerpt_windows.setToolTip(_("Number of excerpts spread over a long file"))
+        self.analyzer_layout.addRow(_("Excerpts"), self.excerpt_windows)
+
+        self.excerpt_window_length = QLineEdit()
+        self.excerpt_window_length.setText(AppSettings.value(SettingKeys.EXCERPT_WINDOW_LENGTH, str(DEFAULT_EXCERPT_WINDOW_LENGTH), type=str))
+        self.excerpt_window_length.setToolTip(_("Length of each excerpt in seconds"))
+        self.analyzer_layout.addRow(_("Excerpt Length"), self.excerpt_window_length)
+
         #
         player_group = QGroupBox(_("Player"))
         self.player_layout = QFormLayout(player_group)
@@ -366,6 +437,19 @@ class SettingsDialog(QDialog):
         normalize_volume_description.setContentsMargins(28, 0, 0, 0)
         self.player_layout.addRow("", normalize_volume_description)
 
+        self.crossfade_duration = QLineEdit()
+        self.crossfade_duration.setText(AppSettings.value(SettingKeys.CROSSFADE_DURATION, str(DEFAULT_CROSSFADE_MS), type=str))
+        self.crossfade_duration.setToolTip(_("Milliseconds two tracks overlap when changing tracks, 0 switches without fading"))
+        self.player_layout.addRow(_("Crossfade Duration"), self.crossfade_duration)
+
+        self.crossfade_curve = QComboBox(editable=False)
+        self.crossfade_curve.addItem(_("Equal Power"), "EQUAL_POWER")
+        self.crossfade_curve.addItem(_("Linear"), "LINEAR")
+        self.crossfade_curve.addItem(_("Logarithmic"), "LOGARITHMIC")
+        self.crossfade_curve.setCurrentIndex(max(0, self.crossfade_curve.findData(
+            AppSettings.value(SettingKeys.CROSSFADE_CURVE, DEFAULT_CROSSFADE_CURVE, type=str))))
+        self.player_layout.addRow(_("Crossfade Curve"), self.crossfade_curve)
+
         layout.addWidget(player_group, 0)
         #
         table_group = QGroupBox(_("Song Table"))
@@ -437,6 +521,10 @@ class SettingsDialog(QDialog):
     def _local_voxalyzer_changed(self, checked: bool = False):
         self.voxalyzerUrl.setEnabled(not checked)
 
+    def _voxalyzer_command_changed(self, command: str):
+        self.local_voxalyzer.setEnabled(get_voxalyzer_command(command) is not None)
+        self.voxalyzerUrl.setEnabled(not self.local_voxalyzer.isEnabled() or not self.local_voxalyzer.isChecked())
+
     def init_categories_tab(self):
 
         groups = set()
@@ -550,7 +638,17 @@ class SettingsDialog(QDialog):
         else:
             self._set_settings_value(SettingKeys.VOXALYZER_URL, str, self.voxalyzerUrl.text())
 
+        self._set_settings_value(SettingKeys.VOXALYZER_TIMEOUT, int, int(self.voxalyzer_timeout.text()))
+        self._set_settings_value(SettingKeys.VOXALYZER_BATCH_SIZE, int, int(self.voxalyzer_batch_size.text()))
+        self._set_settings_value(SettingKeys.VOXALYZER_COMMAND, str, self.voxalyzer_command.text().strip() or None)
+        self._set_settings_value(SettingKeys.VOXALYZER_INSTANCES, int, max(1, int(self.voxalyzer_instances.text())))
+        self._set_settings_value(SettingKeys.EXCERPT_MIN_LENGTH, int, max(0, int(self.excerpt_min_length.text())))
+        self._set_settings_value(SettingKeys.EXCERPT_WINDOWS, int, max(1, int(self.excerpt_windows.text())))
+        self._set_settings_value(SettingKeys.EXCERPT_WINDOW_LENGTH, int, max(1, int(self.excerpt_window_length.text())))
+
         self._set_settings_value(SettingKeys.NORMALIZE_VOLUME, bool, self.normalize_volume.isChecked())
+        self._set_settings_value(SettingKeys.CROSSFADE_DURATION, int, max(0, int(self.crossfade_duration.text())))
+        self._set_settings_value(SettingKeys.CROSSFADE_CURVE, str, self.crossfade_curve.currentData())
 
         _categories = []
         for row in range(self.categories_table.rowCount()):
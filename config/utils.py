@@ -1,4 +1,5 @@
 import ctypes
+import functools
 import ipaddress
 import json
 import logging
@@ -37,6 +38,18 @@ def get_executable_path(path:str) -> PathLike[str]:
     path = os.path.join(os.path.dirname(os.path.realpath(sys.argv[0])), path)
     return Path(path).as_posix()
 
+@functools.cache
+def get_app_data_path(*paths: str) -> Path:
+    """Directory below the app data directory, created on the first call."""
+    if "APPDATA" in os.environ:
+        base_dir = Path(os.environ["APPDATA"])
+    else:
+        base_dir = Path(os.environ.get("XDG_DATA_HOME", Path.home().joinpath(".local", "share")))
+
+    path = base_dir.joinpath("DungeonTuber", *paths)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
 def get_path(path:str) -> PathLike[str]:
     if getattr(sys, 'frozen', False):
         # Running as compiled executable
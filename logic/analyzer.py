@@ -2,106 +2,85 @@ import atexit
 import json
 import os
 import random
-import re
 import threading
 import traceback
 import logging
-import urllib.request
-import urllib.error
-from _winapi import CREATE_NO_WINDOW
-
-import psutil
+import multiprocessing
 from abc import abstractmethod
 
-from queue import Queue
-from subprocess import Popen
-from typing import Any
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack
+from typing import Any, ContextManager
 from os import PathLike
 from pathlib import Path
 
-from PySide6.QtCore import QObject, Signal, QRunnable, QThreadPool, QFileInfo
+from PySide6.QtCore import QObject, Signal, QFileInfo
+
+from logic import audiofeatures
+from logic.audiofeatures import MIN_BPM, MAX_BPM
+from logic.excerpt import excerpt
+from logic.httpclient import HttpClient, HttpError, DEFAULT_TIMEOUT
+from logic.jobs import AnalysisJob, JobPriority, JobScheduler, job_key
+from logic.journal import get_job_journal
+from logic.resultcache import result_cache
+from logic.pipeline import AnalysisPipeline
+from logic.progress import ProgressAggregator
+from logic.mp3 import Mp3Entry, parse_mp3, update_categories_and_tags, print_mp3_tags, file_signature, read_analysis_tags
+from logic.scanner import DirectoryScanner, ScanEntry
+from logic.voxalyzer import VoxalyzerPool
+
+from config.settings import AppSettings, SettingKeys, CATEGORY_MIN, CATEGORY_MAX, CAT_VALENCE, CAT_AROUSAL, CAT_ENGAGEMENT, \
+    CAT_DARKNESS, CAT_AGGRESSIVE, CAT_HAPPY, CAT_PARTY, CAT_RELAXED, CAT_SAD, MusicCategory, get_category_keys, has_local_voxalyzer, has_voxalyzer, \
+    get_voxalyzer_command, get_voxalyzer_instances, DEFAULT_EXCERPT_WINDOWS, DEFAULT_EXCERPT_WINDOW_LENGTH
 
-from logic.mp3 import Mp3Entry, parse_mp3, update_categories_and_tags, print_mp3_tags, list_mp3s
+logger = logging.getLogger(__file__)
 
-from config.settings import AppSettings, SettingKeys, CATEGORY_MIN, CATEGORY_MAX, MusicCategory, get_category_keys, has_local_voxalyzer, has_voxalyzer
-from config.utils import get_executable_path
+voxalyzer_pool: VoxalyzerPool | None = None
+_voxalyzer_lock = threading.Lock()
 
-logger = logging.getLogger(__file__)
 
-voxalyzer_port: int|None = None
-voxalyzer_port_found_event = threading.Event()
-voxalyzer_process: Popen[str]|None = None
-
-def start_voxalyzer() -> str | None:
-    global voxalyzer_process
-    has_local_voxalyzer = os.path.isfile(get_executable_path("voxalyzer.exe"))
-
-    if has_local_voxalyzer and voxalyzer_port is None:
-        import subprocess
-
-        voxalyzer_process = subprocess.Popen([get_executable_path("voxalyzer.exe"), "--port", "0", "--host", "127.0.0.1"],
-                                   creationflags=CREATE_NO_WINDOW,
-                                   stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE,
-                                   stdin=subprocess.DEVNULL,
-                                   text=True
-                                   )
-        atexit.register(stop_voxalyzer)
-        # 3. Define the logger function
-        def stream_logger(pipe, prefix):
-            global voxalyzer_port
-            for line in pipe:
-                logger.info(f"[Voxalyzer]: {line.strip()}")
-                match = re.search(r"http://127.0.0.1:(\d+) ", line)
-                if match:
-                    voxalyzer_port = match.group(1)
-                    voxalyzer_port_found_event.set()
-                    break
-
-        logger.info("Voxalyzer: Listening for port...")
-
-        out_thread = threading.Thread(target=stream_logger, args=(voxalyzer_process.stdout, "INFO"), daemon=True)
-        err_thread = threading.Thread(target=stream_logger, args=(voxalyzer_process.stderr, "ERROR"), daemon=True)
-        out_thread.start()
-        err_thread.start()
-
-        # 3. Wait (blocks the main thread until .set() is called)
-        logger.info("Voxalyzer: Waiting for port...")
-        is_set = voxalyzer_port_found_event.wait(timeout=60)  # Optional timeout in seconds
-
-        if is_set:
-            logger.info(f"Voxalyzer is running on port {voxalyzer_port}")
-        else:
-            logger.error("Voxalyzer: Timed out waiting for port!")
+def start_voxalyzer() -> VoxalyzerPool | None:
+    """Starts the local Voxalyzer instances in the background, a changed command or instance count restarts them."""
+    global voxalyzer_pool
+    command = get_voxalyzer_command()
+    size = get_voxalyzer_instances()
 
-    if voxalyzer_port:
-        return f"http://localhost:{voxalyzer_port}"
-    else:
-        return None
+    with _voxalyzer_lock:
+        if voxalyzer_pool is not None and (voxalyzer_pool.command != command or voxalyzer_pool.size != size):
+            voxalyzer_pool.stop()
+            voxalyzer_pool = None
+
+        if voxalyzer_pool is None and command is not None:
+            voxalyzer_pool = VoxalyzerPool(command, size, timeout=AppSettings.value(SettingKeys.VOXALYZER_TIMEOUT, DEFAULT_TIMEOUT, type=int))
+            voxalyzer_pool.start()
+
+        return voxalyzer_pool
 
-# This ensures the child is killed when Python exits gracefully
+# This ensures the children are killed when Python exits gracefully
 def stop_voxalyzer():
-    try:
-        if voxalyzer_process is not None:
-            parent = psutil.Process(voxalyzer_process.pid)
-            # Find all grandchildren (Uvicorn, etc.)
-            children = parent.children(recursive=True)
+    global voxalyzer_pool
+    with _voxalyzer_lock:
+        if voxalyzer_pool is not None:
+            voxalyzer_pool.stop()
+            voxalyzer_pool = None
 
-            for child in children:
-                child.terminate()
 
-            parent.terminate()
-    except psutil.NoSuchProcess:
-        pass
+atexit.register(stop_voxalyzer)
+
 
 def is_analyzed(file_path: PathLike[str] | Mp3Entry) -> bool:
     if isinstance(file_path, Mp3Entry):
-        entry = file_path
+        categories, summary = file_path.categories, file_path.summary
     else:
-        entry = parse_mp3(file_path)
+        # only the tag is read, the audio stream is not needed to tell
+        tags = read_analysis_tags(file_path)
+        if tags is None:
+            return False
+        categories, summary = tags
 
-    return (set(get_category_keys()) == set(entry.categories.keys()) and entry.summary is not None
-            and entry.summary != "This is a mock summary." and not "Voxalyzer" in entry.summary)
+    return (set(get_category_keys()) == set(categories.keys()) and summary is not None
+            and summary != "This is a mock summary." and not "Voxalyzer" in summary)
 
 
 def is_voxalyzed(file_path: PathLike[str] | Mp3Entry) -> bool:
@@ -135,8 +114,9 @@ class Analyzer(QObject):
     error = Signal(object, bool)
     result = Signal(Path)
     progress = Signal(str)
-
-    workerQueue = Queue()
+    # queued jobs, jobs in flight
+    queue_changed = Signal(int, int)
+    job_finished = Signal(object)
 
     @classmethod
     def get_analyzer(cls):
@@ -144,25 +124,157 @@ class Analyzer(QObject):
             return LocalVoxalyzerAnalyzer()
         elif has_voxalyzer():
             return VoxalyzerAnalyzer()
+        elif OfflineAnalyzer.is_available():
+            return OfflineAnalyzer()
         else:
             return MockAnalyzer()
 
+    # analyzers able to handle several files per request
+    supports_batch = False
+    # whether results are stored by audio hash and reused for identical audio
+    cache_results = False
+    # whether the job states are recorded in the journal, so the analysis resumes after a restart
+    journal_jobs = False
+    # whether long files may be sent as a few excerpts instead of the whole audio
+    supports_excerpt = False
+
     def __init__(self):
         super().__init__()
 
-        self.threadpool = QThreadPool(maxThreadCount=8)
+        self.batch_size = max(1, AppSettings.value(SettingKeys.VOXALYZER_BATCH_SIZE, 1, type=int)) if self.supports_batch else 1
+        # files longer than this many seconds are analyzed from excerpts, 0 sends every file as a whole
+        self.excerpt_min_length = AppSettings.value(SettingKeys.EXCERPT_MIN_LENGTH, 0, type=int) if self.supports_excerpt else 0
+        self.excerpt_windows = AppSettings.value(SettingKeys.EXCERPT_WINDOWS, DEFAULT_EXCERPT_WINDOWS, type=int)
+        self.excerpt_window_length = AppSettings.value(SettingKeys.EXCERPT_WINDOW_LENGTH, DEFAULT_EXCERPT_WINDOW_LENGTH, type=int)
+        self.pipeline = AnalysisPipeline(self, Worker)
+        # the pipeline decides how many jobs actually run, this only bounds what it may take
+        self.scheduler = JobScheduler(max_in_flight=(self.pipeline.limiter.maximum + 1) * self.batch_size)
+        self.scanners: dict[int, DirectoryScanner] = {}
+        self.journal = get_job_journal() if self.journal_jobs else None
+        self.aggregator = ProgressAggregator(self.scheduler, parent=self)
 
-        self.result.connect(self._try_next_worker)
-        self.error.connect(self._try_next_worker)
+        self.job_finished.connect(self._on_job_finished)
 
     def active_worker(self) -> int:
-        return self.threadpool.activeThreadCount()
+        return self.pipeline.active_count
+
+    def shutdown(self):
+        """Stops the analysis but keeps the journal, unfinished jobs are resumed on the next start."""
+        for scanner in self.scanners.values():
+            scanner.cancel()
+        self.scanners.clear()
+        self.scheduler.cancel_all()
+        self.pipeline.stop()
+
+    def resume(self) -> int:
+        """Queues the jobs and directory scans left unfinished by the last run."""
+        if self.journal is None:
+            return 0
+
+        missing = []
+        resumed = 0
+        for file_path, priority in self.journal.pending():
+            if not os.path.isfile(file_path):
+                missing.append(file_path)
+            elif self.scheduler.submit(file_path, priority):
+                resumed += 1
+        self.journal.remove(missing)
+        self.aggregator.add_total(resumed)
+
+        for directory in self.journal.scans():
+            if os.path.isdir(directory):
+                self._process_directory(directory)
+            else:
+                self.journal.scan_finished(directory)
+
+        self._dispatch()
+        if resumed:
+            self.progress.emit(_("Resuming analysis of {0} files").format(resumed))
+        return resumed
+
+    def failed_count(self) -> int:
+        return self.journal.failed_count() if self.journal is not None else 0
+
+    def retry_failed(self) -> int:
+        if self.journal is None:
+            return 0
+
+        file_paths = [file_path for file_path in self.journal.failed() if os.path.isfile(file_path)]
+        self.process_files(file_paths)
+        return len(file_paths)
+
+    def queue_depth(self) -> int:
+        return self.scheduler.queued_count + self.scheduler.in_flight_count
+
+    def is_queued(self, file_path: PathLike[str]) -> bool:
+        return self.scheduler.is_queued(file_path)
+
+    def prioritize(self, file_path: PathLike[str], priority: JobPriority = JobPriority.PLAYING):
+        if self.scheduler.prioritize(file_path, priority):
+            logger.debug("Moved {0} up to {1}", file_path, priority.name)
+
+    def cancel(self, file_path: PathLike[str]) -> bool:
+        cancelled = self.scheduler.cancel(file_path)
+        if cancelled:
+            self.aggregator.remove_total(1)
+            if self.journal is not None:
+                self.journal.remove([file_path])
+        self._emit_queue_changed()
+        return cancelled
+
+    def cancel_batch(self, batch: int) -> int:
+        scanner = self.scanners.pop(batch, None)
+        if scanner is not None:
+            scanner.cancel()
+            if self.journal is not None:
+                self.journal.scan_finished(scanner.directory)
+        cancelled = self.scheduler.cancel_batch(batch)
+        self.aggregator.remove_total(len(cancelled))
+        if self.journal is not None:
+            self.journal.remove(cancelled)
+        self._emit_queue_changed()
+        return len(cancelled)
+
+    def cancel_all(self) -> int:
+        for scanner in self.scanners.values():
+            scanner.cancel()
+            if self.journal is not None:
+                self.journal.scan_finished(scanner.directory)
+        self.scanners.clear()
+        cancelled = self.scheduler.cancel_all()
+        self.aggregator.remove_total(cancelled)
+        if self.journal is not None:
+            self.journal.remove_queued()
+        self._emit_queue_changed()
+        if cancelled:
+            self.progress.emit(_("Cancelled analysis of {0} files").format(cancelled))
+        return cancelled
 
     @abstractmethod
     def analyze_mp3(self, file_path: PathLike[str]) -> Any:
         pass
 
-    def process(self, file_path: PathLike[str]| QFileInfo) -> bool:
+    def cache_variant(self) -> str:
+        """Results from excerpts are cached apart from those of whole files, and per excerpt setting."""
+        if self.excerpt_min_length <= 0:
+            return ""
+        return "excerpt{0}x{1}x{2}".format(self.excerpt_min_length, self.excerpt_windows, self.excerpt_window_length)
+
+    def excerpt(self, file_path: PathLike[str]) -> ContextManager[Path]:
+        """The file to send for the analysis, a temporary excerpt for long files."""
+        return excerpt(file_path, self.excerpt_min_length, self.excerpt_windows, self.excerpt_window_length)
+
+    def analyze_mp3s(self, file_paths: list[PathLike[str]]) -> list[Any]:
+        """Analyzes several files at once, a failed file yields its exception instead of a response."""
+        responses = []
+        for file_path in file_paths:
+            try:
+                responses.append(self.analyze_mp3(file_path))
+            except Exception as e:
+                responses.append(e)
+        return responses
+
+    def process(self, file_path: PathLike[str]| QFileInfo, priority: JobPriority = JobPriority.NORMAL) -> bool:
         try:
             if isinstance(file_path, QFileInfo):
                 file_path = file_path.filePath()
@@ -170,50 +282,191 @@ class Analyzer(QObject):
             logger.debug("Analyzing {0}", file_path)
 
             if Path(file_path).is_dir():
-                return self._process_directory(file_path)
+                return self._process_directory(file_path) is not None
             else:
-                return self._process_file(file_path)
+                return self._process_files([file_path], priority)
         except Exception as e:
             traceback.print_exc()
             logger.error("An error occurred while analyzing: {0}", e)
             return False
 
-    def _process_file(self, file_path: PathLike[str]) -> bool:
-        worker = Worker(file_path, self)
-        worker.setAutoDelete(True)
-        return self._try_worker(worker)
+    def process_files(self, files: list[PathLike[str] | Mp3Entry | ScanEntry], priority: JobPriority = JobPriority.NORMAL) -> int:
+        """Queues the files as one batch, the returned batch id can be passed to cancel_batch."""
+        batch = self.scheduler.new_batch()
+        self._process_files(files, priority, batch)
+        return batch
+
+    def _filter_analyzed(self, files: list[PathLike[str] | Mp3Entry | ScanEntry]) -> list[str]:
+        """
+        Drops the files known to be analyzed already, so workers never read tags just to skip a file:
+        a loaded entry or the journal decides as long as size and modification time of the file are unchanged,
+        files of unknown state get a quick look at their ID3 tag. Analyzed files are recorded in the journal,
+        the next run skips them without touching the file.
+        """
+        file_paths = [os.fspath(file.path) if isinstance(file, (Mp3Entry, ScanEntry)) else os.fspath(file) for file in files]
+        if not AppSettings.value(SettingKeys.SKIP_ANALYZED_MUSIC, True, type=bool):
+            return file_paths
+
+        done = self.journal.done_signatures(file_paths) if self.journal is not None else {}
+
+        pending = []
+        analyzed = []
+        for file, file_path in zip(files, file_paths):
+            if isinstance(file, ScanEntry):
+                signature = (file.size, file.mtime_ns)
+            else:
+                signature = file_signature(file_path)
+
+            if signature is None:
+                pending.append(file_path)
+            elif done.get(job_key(file_path)) == signature:
+                continue
+            elif is_analyzed(file if isinstance(file, Mp3Entry) and file.signature == signature else file_path):
+                analyzed.append(file_path)
+            else:
+                pending.append(file_path)
 
-    def _try_worker(self, worker):
-        success = self.threadpool.tryStart(worker)
-        if success:
-            logger.debug("Success: {0}", success)
-            return True
-        else:
-            logger.info("Queue full waiting")
-            self.workerQueue.put(worker)
-            return False
+        if analyzed:
+            logger.debug("Skipping {0} already analyzed files", len(analyzed))
+            if self.journal is not None:
+                self.journal.done(analyzed)
+        return pending
 
-    def _try_next_worker(self):
-        try:
-            if not self.workerQueue.empty():
-                logger.info("Trying next worker")
-                worker = self.workerQueue.get_nowait()
-                return self._try_worker(worker)
-        except Exception as e:
-            traceback.print_exc()
-            logger.error("An error occurred while fetching next worker: {0}", e)
-            return False
+    def _process_files(self, files: list[PathLike[str] | Mp3Entry | ScanEntry], priority: JobPriority, batch: int = None) -> bool:
+        pending = self._filter_analyzed(files)
+        queued = [file_path for file_path in pending if self.scheduler.submit(file_path, priority, batch)]
+        self.aggregator.add_total(len(queued), len(files) - len(pending))
+        if queued and self.journal is not None:
+            self.journal.queued(queued, priority)
+
+        self._dispatch()
+        return len(queued) > 0
+
+    def _dispatch(self):
+        if self.scheduler.queued_count:
+            self.pipeline.wake()
+            self.aggregator.start()
+
+        self._emit_queue_changed()
+
+    def _on_job_finished(self, job: AnalysisJob):
+        self.scheduler.done(job)
+        self._dispatch()
+        if self.queue_depth() == 0:
+            self._on_queue_drained()
+
+    def _on_queue_drained(self):
+        if self.cache_results:
+            logger.info(result_cache.report())
 
-    def _process_directory(self, directory_path: PathLike[str]) -> bool:
+    def _emit_queue_changed(self):
+        self.queue_changed.emit(self.scheduler.queued_count, self.scheduler.in_flight_count)
+
+    def _process_directory(self, directory_path: PathLike[str]) -> int:
         logger.debug("Processing {0}...", directory_path)
-        files = list_mp3s(directory_path)
+        batch = self.scheduler.new_batch()
+
+        # files are queued while the directory is still being scanned
+        scanner = DirectoryScanner(directory_path, parent=self)
+        scanner.files_found.connect(lambda entries: self._process_files(entries, JobPriority.BACKGROUND, batch))
+        scanner.finished.connect(lambda: self._on_scan_finished(batch, scanner))
+        self.scanners[batch] = scanner
+        if self.journal is not None:
+            self.journal.scan_started(directory_path)
+        scanner.start()
+        return batch
+
+    def _on_scan_finished(self, batch: int, scanner: DirectoryScanner):
+        self.scanners.pop(batch, None)
+        # an interrupted scan is repeated when the analysis is resumed
+        if not scanner.is_interrupted and self.journal is not None:
+            self.journal.scan_finished(scanner.directory)
+
+
+def _clamp(value: float) -> float:
+    return min(1.0, max(0.0, value))
+
+
+def features_to_categories(features: dict[str, Any]) -> dict[str, int]:
+    """Rough mapping of the offline audio features to the default categories, custom categories are left out."""
+    energy = _clamp((features["loudness_db"] + 40) / 30)
+    brightness = _clamp((features["centroid"] - 500) / 3000)
+    tempo = _clamp((features["bpm"] - MIN_BPM) / (MAX_BPM - MIN_BPM)) if features["bpm_confidence"] > 0.1 else 0.5
+    onsets = _clamp(features["onset_rate"] / 6)
+    dynamics = _clamp(features["dynamic_range_db"] / 30)
+    # a clear major key counts as positive, a clear minor key as negative
+    mode = 0.5 + (0.5 if features["major"] else -0.5) * _clamp(features["key_strength"])
+
+    arousal = 0.4 * energy + 0.3 * tempo + 0.3 * onsets
+    valence = 0.5 * mode + 0.3 * brightness + 0.2 * tempo
+    values = {
+        CAT_VALENCE: valence,
+        CAT_AROUSAL: arousal,
+        CAT_ENGAGEMENT: 0.5 * onsets + 0.3 * dynamics + 0.2 * energy,
+        CAT_DARKNESS: 1 - (0.5 * brightness + 0.5 * mode),
+        CAT_AGGRESSIVE: arousal - valence + 0.5,
+        CAT_HAPPY: 0.7 * valence + 0.3 * arousal,
+        CAT_PARTY: 0.4 * tempo + 0.3 * energy + 0.3 * valence,
+        CAT_RELAXED: 1 - arousal,
+        CAT_SAD: 0.7 * (1 - valence) + 0.3 * (1 - arousal),
+    }
+
+    keys = set(get_category_keys())
+    return {key: round(CATEGORY_MIN + _clamp(value) * (CATEGORY_MAX - CATEGORY_MIN)) for key, value in values.items() if key in keys}
+
+
+class OfflineAnalyzer(Analyzer):
+    """
+    Computes audio features locally with NumPy on a process pool and maps them to the categories.
+    Needs no Voxalyzer, but only knows the default categories.
+    """
+    cache_results = False
+    journal_jobs = True
+    supports_excerpt = True
 
-        result = False
-        # Parses all MP3 files in a given directory.
-        for filename in files:
-            file_path = Path(os.path.join(directory_path, filename))
-            result = self._process_file(file_path) or result
-        return result
+    def __init__(self):
+        super().__init__()
+        self.executor: ProcessPoolExecutor | None = None
+        self._executor_lock = threading.Lock()
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return audiofeatures.is_available()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self.executor is None:
+                # spawned processes don't inherit the Qt state of the application
+                self.executor = ProcessPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) - 1),
+                                                    mp_context=multiprocessing.get_context("spawn"))
+            return self.executor
+
+    def analyze_mp3(self, file_path: PathLike[str]) -> Any:
+        with self.excerpt(file_path) as analysis_path:
+            executor = self._executor()
+            try:
+                features = executor.submit(audiofeatures.analyze_file, analysis_path).result()
+            except BrokenProcessPool:
+                # a crashed worker breaks the whole pool, the next file gets a new one
+                with self._executor_lock:
+                    if self.executor is executor:
+                        self.executor = None
+                raise
+
+        key = "{0} {1}".format(features["key"], "major" if features["major"] else "minor") if features["key"] else "unknown key"
+        return {
+            "summary": "Offline analysis: {0:.0f} BPM, {1}.".format(features["bpm"], key),
+            "categories": [{"category": category, "scale": scale} for category, scale in features_to_categories(features).items()],
+            "features": features
+        }
+
+    def shutdown(self):
+        # queued decodes are dropped first, so stopping the pipeline does not wait for them
+        with self._executor_lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+        super().shutdown()
 
 
 class MockAnalyzer(Analyzer):
@@ -235,120 +488,210 @@ class MockAnalyzer(Analyzer):
 
         return mock_response
 
-class LocalVoxalyzerAnalyzer(Analyzer):
-    def _lazy_startup(self) -> str | None:
-        self.url = start_voxalyzer()
-
-        if self.url is not None and self.url !='None' and self.url !='':
-            if self.url.endswith("/analyze"):
-                pass
-            elif self.url.endswith("/"):
-                self.url = f"{self.url}analyze"
-            else:
-                self.url = f"{self.url}/analyze"
-        else:
-            self.url = None
+def _voxalyzer_base_url(url: str | None) -> str | None:
+    if url is None or url == 'None' or url == '':
+        return None
+    # older settings contain the full endpoint
+    return url.rstrip("/").removesuffix("/analyze")
 
-        return self.url
 
-    def analyze_mp3(self, file_path: PathLike[str]) -> Any:
-        url = self._lazy_startup()
+class VoxalyzerClientMixin:
+    client: HttpClient | None = None
+    base_url: str | None = None
 
-        if not url:
-            logger.error("Voxalyzer URL not set.")
+    def _client(self, base_url: str | None) -> HttpClient | None:
+        base_url = _voxalyzer_base_url(base_url)
+        if base_url is None:
             return None
 
-        logger.debug(f"Sending request to {url} for file {file_path}")
+        if self.client is None or self.base_url != base_url:
+            if self.client is not None:
+                self.client.close_all()
+            self.base_url = base_url
+            self.client = HttpClient(base_url, timeout=AppSettings.value(SettingKeys.VOXALYZER_TIMEOUT, DEFAULT_TIMEOUT, type=int))
+        return self.client
 
 
-        request_data = json.dumps({"file": os.path.abspath(file_path)})
+class LocalVoxalyzerAnalyzer(Analyzer):
+    supports_batch = True
+    cache_results = True
+    journal_jobs = True
+    supports_excerpt = True
 
-        req = urllib.request.Request(url, data=request_data.encode("utf-8"), method='POST')
-        req.add_header('Content-Type', 'application/json')
+    # None until the first batch request tells whether the server has a batch endpoint
+    batch_supported: bool | None = None
 
-        with urllib.request.urlopen(req) as response:
-            if response.status == 200:
-                response_body = response.read()
-                return json.loads(response_body)
-            else:
-                logger.error(f"Error: {response.status} - {response.reason}")
-                return None
+    def analyze_mp3(self, file_path: PathLike[str]) -> Any:
+        pool = start_voxalyzer()
 
+        if not pool:
+            logger.error("Voxalyzer command not set.")
+            return None
 
-class VoxalyzerAnalyzer(Analyzer):
+        with self.excerpt(file_path) as analysis_path, pool.instance() as instance:
+            logger.debug("Sending request to {0} for file {1}", instance.url, file_path)
+            return instance.client.post_json("analyze", {"file": os.path.abspath(analysis_path)})
+
+    def analyze_mp3s(self, file_paths: list[PathLike[str]]) -> list[Any]:
+        pool = start_voxalyzer()
+        if pool is None or len(file_paths) < 2 or self.batch_supported is False:
+            return super().analyze_mp3s(file_paths)
+
+        with ExitStack() as excerpts:
+            files = [os.path.abspath(excerpts.enter_context(self.excerpt(file_path))) for file_path in file_paths]
+            try:
+                with pool.instance() as instance:
+                    response = instance.client.post_json("analyze/batch", {"files": files})
+                self.batch_supported = True
+            except HttpError as e:
+                if e.status not in (404, 405, 501):
+                    raise
+                logger.info("Voxalyzer has no batch endpoint, analyzing files one by one")
+                self.batch_supported = False
+
+        if not self.batch_supported:
+            return super().analyze_mp3s(file_paths)
+
+        results = response.get("results", []) if isinstance(response, dict) else response
+        by_file = {result.get("file"): result for result in results if isinstance(result, dict)}
+
+        responses = []
+        for index, file in enumerate(files):
+            result = by_file.get(file)
+            if result is None and len(results) == len(files):
+                result = results[index]
+            if isinstance(result, dict) and result.get("error"):
+                result = RuntimeError(result.get("error"))
+            responses.append(result)
+        return responses
+
+
+class VoxalyzerAnalyzer(VoxalyzerClientMixin, Analyzer):
+    cache_results = True
+    journal_jobs = True
+    supports_excerpt = True
+
+    def _lazy_startup(self) -> HttpClient | None:
+        return self._client(AppSettings.value(SettingKeys.VOXALYZER_URL, type=str, defaultValue=''))
 
-    url:str=None
+    def analyze_mp3(self, file_path: PathLike[str]) -> Any:
+        client = self._lazy_startup()
 
-    def _lazy_startup(self) -> str | None:
-        self.url = AppSettings.value(SettingKeys.VOXALYZER_URL, type=str, defaultValue='')
+        if not client:
+            logger.error("Voxalyzer URL not set.")
+            return None
 
-        if self.url is not None and self.url !='':
-            if self.url.endswith("/"):
-                self.url = f"{self.url}analyze"
-            else:
-                self.url = f"{self.url}/analyze"
+        logger.debug("Sending request to {0} for file {1}", client.base_path, file_path)
+
+        with self.excerpt(file_path) as analysis_path:
+            status, reason, body = client.post_file("analyze", analysis_path)
+        if status == 200:
+            return json.loads(body)
         else:
-            self.url = None
+            logger.error("Error: {0} - {1}", status, reason)
+            # the pipeline retries overloaded or restarting servers
+            raise HttpError(status, reason, body)
+
+    def _on_queue_drained(self):
+        super()._on_queue_drained()
+        if self.client is not None and self.client.upload_stats:
+            logger.info("Voxalyzer upload throughput per worker:\n{0}", self.client.upload_report())
+
+class Worker(object):
+    """
+    Analyzes one batch of jobs in three stages, so the pipeline can retry and throttle the analyze stage on its own:
+    prepare skips analyzed files and applies cached results, analyze calls the analyzer and apply writes the results.
+    """
+    analyzer: Analyzer
+    jobs: list[AnalysisJob]
 
-        return self.url
+    def __init__(self, jobs: list[AnalysisJob], analyzer: Analyzer):
+        self.jobs = jobs
+        self.analyzer = analyzer
+        self.cache_keys: dict[Path, str] = {}
 
-    def analyze_mp3(self, file_path: PathLike[str]) -> Any:
-        url = self._lazy_startup()
+    def prepare(self) -> list[Path]:
+        """Returns the files still to be analyzed."""
+        if self.analyzer.journal is not None:
+            self.analyzer.journal.started(self.jobs)
 
-        if not url:
-            logger.error("Voxalyzer URL not set.")
-            return None
+        pending = []
+        for file_path in [Path(job.path) for job in self.jobs]:
+            # analyzed files were already dropped before queuing
+            if self.analyzer.cache_results and self.apply_cached(file_path):
+                continue
+            pending.append(file_path)
+        return pending
 
-        logger.debug(f"Sending request to {url} for file {file_path}")
+    def analyze(self, file_paths: list[Path]) -> list[Any]:
+        """One response per file, failures are returned as exceptions."""
+        self.analyzer.aggregator.file_started(file_paths[0].name)
 
-        with open(file_path, 'rb') as f:
-            file_content = f.read()
+        try:
+            if len(file_paths) == 1:
+                return [self.analyzer.analyze_mp3(file_paths[0])]
+            return self.analyzer.analyze_mp3s(file_paths)
+        except Exception as e:
+            return [e] * len(file_paths)
 
-        req = urllib.request.Request(url, data=file_content, method='POST')
-        req.add_header('Content-Type', 'application/octet-stream')
+    def apply(self, results: list[tuple[Path, Any]]):
+        for file_path, response_data in results:
+            self._apply_file(file_path, response_data, self.cache_keys.get(file_path))
 
-        with urllib.request.urlopen(req) as response:
-            if response.status == 200:
-                response_body = response.read()
-                return json.loads(response_body)
-            else:
-                logger.error(f"Error: {response.status} - {response.reason}")
-                return None
+    def run(self):
+        pending = self.prepare()
+        if pending:
+            self.apply(list(zip(pending, self.analyze(pending))))
 
-class Worker(QRunnable):
-    analyzer: Analyzer
+    def apply_cached(self, file_path: Path) -> bool:
+        """Applies the result of an earlier analysis of the same audio, returns False on a cache miss."""
+        try:
+            self.cache_keys[file_path] = result_cache.key(file_path, self.analyzer.cache_variant())
+        except OSError as e:
+            logger.warning("Could not hash {0}: {1}", file_path, e)
+            return False
 
-    def __init__(self, file_path: PathLike[str], analyzer: Analyzer):
-        super(Worker, self).__init__()
-        self.file_path = file_path
-        self.analyzer = analyzer
+        cached = result_cache.get(self.cache_keys[file_path])
+        if cached is None:
+            return False
 
-        logger.debug("Worker initialized")
+        self._apply_file(file_path, cached, cached=True)
+        return True
 
-    def run(self):
-        logger.debug("Worker run")
+    def _apply_file(self, file_path: Path, response_data: Any, cache_key: str = None, cached: bool = False):
+        journal = self.analyzer.journal
+        aggregator = self.analyzer.aggregator
         try:
-            self.process_file(self.file_path)
+            processed = self.process_file(file_path, response_data, cache_key)
         except Exception as e:
-            logger.error("An error occurred while analyzing: {0}", traceback.format_exc())
+            logger.error("An error occurred while analyzing: {0}", "".join(traceback.format_exception(e)))
+            if journal is not None:
+                journal.finished(file_path, str(e) or type(e).__name__)
+            aggregator.file_failed()
             self.analyzer.error.emit(str(e), False)
         else:
-            self.analyzer.result.emit(self.file_path)  # Return the result of the processing
+            if journal is not None:
+                journal.finished(file_path, None if processed else "No analysis result")
+            if cached:
+                aggregator.file_cached()
+            elif processed:
+                aggregator.file_analyzed((file_signature(file_path) or (0, 0))[0])
+            else:
+                aggregator.file_failed()
+            self.analyzer.result.emit(file_path)  # Return the result of the processing
 
-    def process_file(self, file_path: PathLike[str]):
+    def process_file(self, file_path: PathLike[str], response_data: Any, cache_key: str = None) -> bool:
+        """Returns True if the result was written to the file."""
         logger.debug("Processing {0}...", file_path)
 
-        if AppSettings.value(SettingKeys.SKIP_ANALYZED_MUSIC, True, type=bool) and is_analyzed(file_path):
-            self.analyzer.progress.emit(_("Skipping already analyzed file {0}").format(Path(file_path).name))
-            logger.debug("Skipping already analyzed file {0}", Path(file_path).name)
-            return
-
-        self.analyzer.progress.emit(_("Analyzing {0}...").format(Path(file_path).name))
-
-        response_data = self.analyzer.analyze_mp3(file_path)
+        if isinstance(response_data, Exception):
+            raise response_data
 
         if not response_data:
-            return
+            return False
+
+        if cache_key is not None:
+            result_cache.put(cache_key, response_data)
 
         # add tags
         try:
@@ -362,7 +705,9 @@ class Worker(QRunnable):
             else:
                 logger.warning("Could not find categories for {0}.", file_path)
 
-            self.analyzer.progress.emit(_("File {0} processed.").format(Path(file_path).name))
+            logger.debug("File {0} processed.", Path(file_path).name)
+            return bool(categories)
         except Exception as e:
             traceback.print_exc()
             logger.error("An error occurred while adding tags to {0}: {1}", file_path, e)
+            return False
@@ -1,15 +1,25 @@
+import logging
 import platform
-import threading
-import time
 from enum import Enum
 from os import PathLike
 
-from PySide6.QtCore import QTimer, Signal, QObject, QSize
-from vlc import MediaListPlayer, Instance, PlaybackMode, State, MediaPlayer
+from PySide6.QtCore import QTimer, Signal, QObject, QSize, QMetaMethod, Qt
+from vlc import MediaListPlayer, Instance, PlaybackMode, MediaPlayer, EventType, EventManager, Media, MediaParseFlag
 
-from config.settings import AppSettings, SettingKeys
+from config.settings import AppSettings, SettingKeys, DEFAULT_CROSSFADE_MS, DEFAULT_CROSSFADE_CURVE
+from logic.fade import FadeScheduler, FadeCurve
+
+logger = logging.getLogger(__file__)
 
 DEFAULT_VOLUME = 70
+# position updates for the UI are sent at most this often
+POSITION_INTERVAL_MS = 250
+# track_ending is emitted this long before the end, so the next track can be buffered in time
+PRELOAD_MS = 10000
+
+_PLAYER_EVENTS = (EventType.MediaPlayerTimeChanged, EventType.MediaPlayerLengthChanged, EventType.MediaPlayerEndReached,
+                  EventType.MediaPlayerPlaying, EventType.MediaPlayerPaused, EventType.MediaPlayerStopped,
+                  EventType.MediaPlayerEncounteredError)
 
 
 class EngineState(Enum):
@@ -27,6 +37,15 @@ class AudioEngine(QObject):
     track_finished = Signal()
     state_changed = Signal(EngineState)  # True if playing, False if stopped/paused
     position_changed = Signal(int, int)  # position (0-1000), current_time_ms, total_time_ms
+    # the current track is about to end, answer with preload() to continue without a gap
+    track_ending = Signal()
+    # playback went on with the preloaded track instead of finishing
+    track_advanced = Signal(str)
+
+    # libVLC calls the event callbacks on its own thread, these hand the events over to the Qt thread
+    _vlc_time_changed = Signal(object, int)
+    _vlc_length_changed = Signal(object, int)
+    _vlc_event = Signal(object, object)
 
     instance: Instance = None
     list_player: MediaListPlayer | None = None
@@ -34,16 +53,42 @@ class AudioEngine(QObject):
     player_fade: MediaPlayer | None = None
 
     cross_fade = True
+    current_path: str | None = None
 
     def __init__(self, visualizer: bool = True):
         super().__init__()
 
         self.current_volume = DEFAULT_VOLUME
+        self._event_managers: dict[int, tuple[MediaPlayer, EventManager]] = {}
+        self._time_ms = 0
+        self._length_ms = 0
+
+        # always queued, VLC may also raise events while a libVLC call of the Qt thread is running
+        self._vlc_time_changed.connect(self._on_time_changed, Qt.ConnectionType.QueuedConnection)
+        self._vlc_length_changed.connect(self._on_length_changed, Qt.ConnectionType.QueuedConnection)
+        self._vlc_event.connect(self._on_vlc_event, Qt.ConnectionType.QueuedConnection)
+
+        # throttles the time events of VLC, only runs while they arrive
+        self.position_timer = QTimer(self)
+        self.position_timer.setSingleShot(True)
+        self.position_timer.setInterval(POSITION_INTERVAL_MS)
+        self.position_timer.timeout.connect(self._emit_position_changed)
+
+        self.fader = FadeScheduler(self)
+
+        # starts the preloaded track so that its fade in ends with the current one
+        self.transition_timer = QTimer(self)
+        self.transition_timer.setSingleShot(True)
+        self.transition_timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.transition_timer.timeout.connect(self._advance)
+
+        # the next track, buffered in player_fade while the current one plays
+        self._next_media: Media | None = None
+        self._next_path: str | None = None
+        self._next_buffering = False
+        self._ending_emitted = False
+
         self.init_vlc(visualizer)
-        # Monitor VLC state
-        self.monitor_timer = QTimer()
-        self.monitor_timer.timeout.connect(self._check_status)
-        self.monitor_timer.start(250)  # Poll more frequently for position
 
         # Internal flags
         self._manual_stop = False
@@ -62,7 +107,21 @@ class AudioEngine(QObject):
     def set_aspect_ratio(self, size: QSize):
         self.player.video_set_aspect_ratio(f"{size.width()}:{size.height()}")
 
+    @property
+    def crossfade_ms(self) -> int:
+        return max(0, AppSettings.value(SettingKeys.CROSSFADE_DURATION, DEFAULT_CROSSFADE_MS, type=int))
+
+    @property
+    def crossfade_curve(self) -> FadeCurve:
+        try:
+            return FadeCurve(AppSettings.value(SettingKeys.CROSSFADE_CURVE, DEFAULT_CROSSFADE_CURVE, type=str))
+        except ValueError:
+            return FadeCurve(DEFAULT_CROSSFADE_CURVE)
+
     def init_vlc(self, visualizer: bool = True):
+        self.cancel_preload()
+        # the players are released below
+        self.fader.cancel_all()
         player_media = None
         player_fade_media = None
 
@@ -70,6 +129,7 @@ class AudioEngine(QObject):
             if self.player.is_playing():
                 player_media = self.player.get_media()
                 player_position = self.player.get_position()
+            self._detach_events(self.player)
             self.player.stop()
             self.player.release()
 
@@ -77,6 +137,7 @@ class AudioEngine(QObject):
             if self.player_fade.is_playing() and player_media is None:
                 player_fade_media = self.player_fade.get_media()
                 player_fade_position = self.player_fade.get_position()
+            self._detach_events(self.player_fade)
             self.player_fade.stop()
             self.player_fade.release()
 
@@ -122,6 +183,7 @@ class AudioEngine(QObject):
 
         self.player = self.instance.media_player_new()
         self.player.audio_set_volume(self.current_volume)
+        self._attach_events(self.player)
 
         if player_media is not None:
             self.player.set_media(player_media)
@@ -130,6 +192,7 @@ class AudioEngine(QObject):
 
         self.player_fade = self.instance.media_player_new()
         self.player_fade.audio_set_volume(self.current_volume)
+        self._attach_events(self.player_fade)
 
         if player_fade_media is not None:
             self.player_fade.set_media(player_fade_media)
@@ -140,8 +203,9 @@ class AudioEngine(QObject):
         if self.list_player is None:
             self.list_player = self.instance.media_list_player_new()
             self.list_player.set_playback_mode(PlaybackMode.loop)
+            self.player = self.list_player.get_media_player()
+            self._attach_events(self.player)
 
-        self.player = self.list_player.get_media_player()
         self.player.audio_set_volume(self.current_volume)
 
         # 2. Create a Media List and add your song
@@ -163,56 +227,48 @@ class AudioEngine(QObject):
             return True
 
     def pause(self):
+        # the transition is due at a playback time, not a wall clock time, play schedules it again
+        self.transition_timer.stop()
         self.player.pause()
         self.state_changed.emit(EngineState.PAUSE)
 
-    def _crossfade_thread(self, player_out, player_in, duration_ms=1000, steps=50):
-        """Thread function to handle volume crossfade."""
-        step_duration = duration_ms / steps / 1000.0  # in seconds
-
-        # Get the initial volume of the outgoing player
-        initial_volume_out = player_out.audio_get_volume()
-
-        for i in range(steps + 1):
-            progress = i / steps
-
-            # Fade out the old player
-            player_out.audio_set_volume(int(initial_volume_out * (1 - progress)))
-
-            # Fade in the new player
-            player_in.audio_set_volume(int(self.current_volume * progress))
-
-            time.sleep(step_duration)
-
-        player_out.stop()
-        # Ensure the new player is at the target volume
-        player_in.audio_set_volume(self.current_volume)
+    def _crossfade(self, player_out: MediaPlayer, player_in: MediaPlayer):
+        """Fades over to player_in, a fade still running on either player is taken over from its current volume."""
+        duration_ms = self.crossfade_ms
+        curve = self.crossfade_curve
+        self.fader.fade(player_out, 0, duration_ms, curve, player_out.stop)
+        self.fader.fade(player_in, self.current_volume, duration_ms, curve, start_volume=0)
 
     def play(self, file_path: PathLike[str] = None):
 
         if file_path is not None:
+            self.cancel_preload()
             media = self.instance.media_new(file_path)
 
-            if self.player.is_playing() and self.cross_fade:
+            if self.player.is_playing() and self.cross_fade and self.crossfade_ms > 0:
                 # Swap players for crossfade
                 self.player, self.player_fade = self.player_fade, self.player
                 self.player.set_media(media)
-
-                # Start crossfade in a new thread
-                fade_thread = threading.Thread(
-                    target=self._crossfade_thread,
-                    args=(self.player_fade, self.player)
-                )
-                fade_thread.daemon = True
-                fade_thread.start()
+                self._crossfade(self.player_fade, self.player)
             else:
+                self.fader.cancel(self.player)
+                self.player.audio_set_volume(self.current_volume)
                 self.player.set_media(media)
 
+            self._time_ms = 0
+            self._length_ms = 0
+            self._ending_emitted = False
+            self.current_path = str(file_path)
+
         self._manual_stop = False
         self.player.play()
+        self._schedule_transition()
         self.state_changed.emit(EngineState.PLAY)
 
     def stop(self):
+        self.cancel_preload()
+        self.fader.cancel(self.player)
+        self.player.audio_set_volume(self.current_volume)
         self._manual_stop = True
         self.player.stop()
         self.state_changed.emit(EngineState.STOP)
@@ -226,14 +282,22 @@ class AudioEngine(QObject):
             vol = int((value_0_150 ** 2) / 100)
 
         self.current_volume = vol
-        self.player.audio_set_volume(vol)
+        if not self.fader.retarget(self.player, vol):
+            self.player.audio_set_volume(vol)
 
     def set_position(self, position_0_1000: int):
         """Set player position (0-1000 scale)."""
         if self.player.is_seekable():
             self.player.set_position(position_0_1000 / 1000.0)
+            self._time_ms = int(self._length_ms * position_0_1000 / 1000)
             self._emit_position_changed()
 
+            if self._length_ms > 0 and self._length_ms - self._time_ms > PRELOAD_MS:
+                # seeked back out of the preload window, the next track is asked for again when it is reached
+                self.cancel_preload()
+            elif self.player.is_playing():
+                self._schedule_transition()
+
     def get_media(self):
         return self.player.get_media()
 
@@ -243,18 +307,143 @@ class AudioEngine(QObject):
     def get_total_time(self):
         return self.player.get_length()
 
-    def _check_status(self):
-        """Poll VLC status to detect end of track and update position."""
-        state = self.player.get_state()
-        if state == State.Ended:
-            if not self._manual_stop:
-                self.track_finished.emit()
+    def preload(self, file_path: PathLike[str]):
+        """
+        Prepares the track to play when the current one ends. Audio only engines open and buffer it paused in the
+        idle player, so the swap is gapless, with the VLC visualizer only the media is parsed ahead.
+        """
+        self._clear_next()
+        self._next_media = self.instance.media_new(file_path)
+        self._next_media.parse_with_options(MediaParseFlag.local, 0)
+        self._next_path = str(file_path)
+
+        # the idle player may still fade out the previous track, then it is only set at the swap
+        if self.cross_fade and not self.fader.is_fading(self.player_fade):
+            self.player_fade.set_media(self._next_media)
+            self.player_fade.audio_set_volume(0)
+            self.player_fade.play()
+            self._next_buffering = True
 
-        # Update position
-        if self.player.is_playing():
+        self._schedule_transition()
+
+    def cancel_preload(self):
+        self._clear_next()
+        # asks for the next track again if the current one is already close to its end
+        self._ending_emitted = False
+
+    def _clear_next(self):
+        self.transition_timer.stop()
+        if self._next_buffering:
+            self.player_fade.stop()
+        self._next_media = None
+        self._next_path = None
+        self._next_buffering = False
+
+    def _schedule_transition(self):
+        if self._next_media is None or not self.cross_fade or self.crossfade_ms <= 0 or self._length_ms <= 0:
+            return
+        self.transition_timer.start(max(0, self._length_ms - self._time_ms - self.crossfade_ms))
+
+    def _advance(self) -> bool:
+        """Continues with the preloaded track, returns False if there is none."""
+        if self._next_media is None:
+            return False
+
+        self.transition_timer.stop()
+        media, path, buffered = self._next_media, self._next_path, self._next_buffering
+        self._next_media = None
+        self._next_path = None
+        self._next_buffering = False
+        self._ending_emitted = False
+        self._time_ms = 0
+        self._length_ms = max(0, media.get_duration())
+        self.current_path = path
+
+        if self.cross_fade:
+            outgoing = self.player
+            self.player, self.player_fade = self.player_fade, self.player
+            if buffered:
+                self.player.set_pause(0)
+            else:
+                self.player.set_media(media)
+                self.player.play()
+
+            if outgoing.is_playing() and self.crossfade_ms > 0:
+                self._crossfade(outgoing, self.player)
+            else:
+                self.fader.cancel(outgoing)
+                outgoing.stop()
+                self.fader.cancel(self.player)
+                self.player.audio_set_volume(self.current_volume)
+        else:
+            # the video output is bound to the player, so it plays the next media itself
+            self.player.set_media(media)
+            self.player.play()
+
+        self.track_advanced.emit(path)
+        return True
+
+    def _attach_events(self, player: MediaPlayer):
+        """Forwards the VLC events of the player, the callbacks must not call into libVLC."""
+        events = player.event_manager()
+        events.event_attach(EventType.MediaPlayerTimeChanged, lambda event: self._vlc_time_changed.emit(player, event.u.new_time))
+        events.event_attach(EventType.MediaPlayerLengthChanged, lambda event: self._vlc_length_changed.emit(player, event.u.new_length))
+        for event_type in _PLAYER_EVENTS[2:]:
+            events.event_attach(event_type, lambda event, event_type=event_type: self._vlc_event.emit(player, event_type))
+        # the callbacks only live as long as the event manager
+        self._event_managers[id(player)] = (player, events)
+
+    def _detach_events(self, player: MediaPlayer):
+        entry = self._event_managers.pop(id(player), None)
+        if entry is not None:
+            for event_type in _PLAYER_EVENTS:
+                entry[1].event_detach(event_type)
+
+    def _on_time_changed(self, player: MediaPlayer, time_ms: int):
+        # events of the player fading out or of released players are late
+        if player is not self.player:
+            return
+        self._time_ms = time_ms
+        if not self.position_timer.isActive() and self.isSignalConnected(QMetaMethod.fromSignal(self.position_changed)):
+            self.position_timer.start()
+
+        if self._length_ms > 0 and self._length_ms - time_ms <= PRELOAD_MS and self.list_player is None:
+            if not self._ending_emitted:
+                self._ending_emitted = True
+                self.track_ending.emit()
+            # every time event corrects the drift of the timer
+            self._schedule_transition()
+
+    def _on_length_changed(self, player: MediaPlayer, length_ms: int):
+        if player is self.player:
+            self._length_ms = length_ms
+
+    def _on_vlc_event(self, player: MediaPlayer, event_type: EventType):
+        if player is self.player_fade and event_type == EventType.MediaPlayerPlaying and self._next_buffering:
+            # opened and buffered, wait at the start for the swap
+            player.set_pause(1)
+            player.set_time(0)
+            return
+        if player is not self.player:
+            return
+
+        if event_type == EventType.MediaPlayerEndReached:
+            self.position_timer.stop()
+            # a looping list player starts over by itself
+            if not self._manual_stop and self.list_player is None and not self._advance():
+                self.track_finished.emit()
+        elif event_type == EventType.MediaPlayerPlaying:
+            self._emit_position_changed()
+        elif event_type == EventType.MediaPlayerPaused:
+            self.position_timer.stop()
             self._emit_position_changed()
+        elif event_type == EventType.MediaPlayerStopped:
+            self.position_timer.stop()
+        elif event_type == EventType.MediaPlayerEncounteredError:
+            media = self.player.get_media()
+            logger.error("Playback of {0} failed", media.get_mrl() if media is not None else None)
+            self.position_timer.stop()
+            self.state_changed.emit(EngineState.STOP)
 
     def _emit_position_changed(self):
-        current_time_ms = self.player.get_time()
-        total_time_ms = self.player.get_length()
-        self.position_changed.emit(current_time_ms, total_time_ms)
+        self.position_changed.emit(self._time_ms, self._length_ms)
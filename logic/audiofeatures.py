@@ -0,0 +1,262 @@
+"""
+Offline audio features computed with NumPy, used by the OfflineAnalyzer when no Voxalyzer is available.
+Runs in worker processes, so nothing in here may import Qt.
+"""
+import logging
+import shutil
+import subprocess
+from dataclasses import dataclass, asdict
+from os import PathLike
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import miniaudio
+except ImportError:
+    miniaudio = None
+
+logger = logging.getLogger(__file__)
+
+SAMPLE_RATE = 22050
+FRAME_SIZE = 2048
+HOP_SIZE = 512
+# spectra are computed for this many frames at a time to bound the memory of long files
+BLOCK_FRAMES = 512
+# longer files are only decoded up to this point
+MAX_DECODE_SECONDS = 600
+
+MIN_BPM = 60
+MAX_BPM = 200
+# tempo estimates are weighted towards this, half and double tempo are otherwise equally likely
+PREFERRED_BPM = 120
+# the tempo is detected on this part of a file
+BPM_OFFSET_SECONDS = 30
+BPM_DECODE_SECONDS = 120
+
+KEY_NAMES = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
+# Krumhansl-Schmuckler key profiles
+_MAJOR_PROFILE = (6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88)
+_MINOR_PROFILE = (6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17)
+
+
+class DecodeError(Exception):
+    pass
+
+
+def is_available() -> bool:
+    """NumPy and a decoder, either the miniaudio module or an ffmpeg executable."""
+    return np is not None and (miniaudio is not None or shutil.which("ffmpeg") is not None)
+
+
+@dataclass(slots=True, frozen=True)
+class AudioFeatures:
+    duration: float
+    loudness_db: float
+    dynamic_range_db: float
+    centroid: float
+    rolloff: float
+    onset_strength: float
+    onset_rate: float
+    bpm: float
+    bpm_confidence: float
+    key: str
+    major: bool
+    key_strength: float
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def decode(file_path: PathLike[str], sample_rate: int = SAMPLE_RATE, max_seconds: float = MAX_DECODE_SECONDS,
+           offset_seconds: float = 0.0) -> "np.ndarray":
+    """Mono float32 samples of the file, starting offset_seconds into it."""
+    max_samples = int(sample_rate * max_seconds)
+    if miniaudio is not None:
+        try:
+            chunks = []
+            decoded = 0
+            for chunk in miniaudio.stream_file(str(file_path), output_format=miniaudio.SampleFormat.FLOAT32, nchannels=1,
+                                               sample_rate=sample_rate, frames_to_read=sample_rate * 10,
+                                               seek_frame=int(offset_seconds * sample_rate)):
+                chunks.append(np.frombuffer(chunk, dtype=np.float32))
+                decoded += len(chunk)
+                if decoded >= max_samples:
+                    break
+            return np.concatenate(chunks)[:max_samples] if chunks else np.zeros(0, dtype=np.float32)
+        except miniaudio.DecodeError as e:
+            raise DecodeError(str(e)) from e
+
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise DecodeError("No MP3 decoder available")
+    process = subprocess.run([ffmpeg, "-v", "error", "-ss", str(offset_seconds), "-i", str(file_path), "-t", str(max_seconds), "-f", "f32le", "-ac", "1",
+                              "-ar", str(sample_rate), "-"], capture_output=True, stdin=subprocess.DEVNULL)
+    if process.returncode != 0:
+        raise DecodeError(process.stderr.decode(errors="replace").strip())
+    return np.frombuffer(process.stdout, dtype=np.float32)
+
+
+def _chroma_matrix(sample_rate: int, frame_size: int) -> "np.ndarray":
+    """Maps the FFT bins between A0 and 5 kHz to the 12 pitch classes."""
+    frequencies = np.fft.rfftfreq(frame_size, 1.0 / sample_rate)
+    matrix = np.zeros((len(frequencies), 12), dtype=np.float32)
+    valid = (frequencies >= 27.5) & (frequencies <= 5000)
+    pitch_classes = np.round(12 * np.log2(frequencies[valid] / 440.0) + 69).astype(int) % 12
+    matrix[np.nonzero(valid)[0], pitch_classes] = 1.0
+    return matrix
+
+
+def spectral_frames(samples: "np.ndarray", sample_rate: int = SAMPLE_RATE):
+    """
+    Yields blocks of (magnitude spectra, frame rms) of hann windowed frames,
+    one row per hop of HOP_SIZE samples.
+    """
+    if len(samples) < FRAME_SIZE:
+        samples = np.pad(samples, (0, FRAME_SIZE - len(samples)))
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_SIZE)[::HOP_SIZE]
+    window = np.hanning(FRAME_SIZE).astype(np.float32)
+    for start in range(0, len(frames), BLOCK_FRAMES):
+        block = frames[start:start + BLOCK_FRAMES]
+        rms = np.sqrt(np.mean(np.square(block, dtype=np.float32), axis=1))
+        yield np.abs(np.fft.rfft(block * window, axis=1)).astype(np.float32), rms
+
+
+def _spectral_flux(spectra: "np.ndarray", previous: "np.ndarray | None") -> tuple["np.ndarray", "np.ndarray"]:
+    """Summed increase of the log magnitude per frame, previous is the last log spectrum of the block before."""
+    log_spectra = np.log1p(spectra * 10)
+    if previous is None:
+        previous = log_spectra[:1]
+    flux = np.maximum(0.0, np.diff(np.vstack([previous, log_spectra]), axis=0)).sum(axis=1)
+    return flux, log_spectra[-1:]
+
+
+def onset_envelope(samples: "np.ndarray", sample_rate: int = SAMPLE_RATE) -> "np.ndarray":
+    """Spectral flux of the log magnitude, one value per hop."""
+    envelopes = []
+    previous = None
+    for spectra, rms in spectral_frames(samples, sample_rate):
+        flux, previous = _spectral_flux(spectra, previous)
+        envelopes.append(flux)
+    return np.concatenate(envelopes)
+
+
+def estimate_tempo(envelope: "np.ndarray", frame_rate: float) -> tuple[float, float]:
+    """Tempo in BPM from the autocorrelation of the onset envelope, with the normalized peak height as confidence."""
+    if len(envelope) < 4:
+        return 0.0, 0.0
+    envelope = envelope - envelope.mean()
+    size = 1 << int(np.ceil(np.log2(2 * len(envelope))))
+    spectrum = np.fft.rfft(envelope, size)
+    autocorrelation = np.fft.irfft(spectrum * np.conj(spectrum), size)[:len(envelope)]
+    if autocorrelation[0] <= 0:
+        return 0.0, 0.0
+
+    min_lag = max(1, int(frame_rate * 60 / MAX_BPM))
+    max_lag = min(len(autocorrelation) - 1, int(frame_rate * 60 / MIN_BPM))
+    if max_lag <= min_lag:
+        return 0.0, 0.0
+
+    lags = np.arange(min_lag, max_lag + 1)
+    bpms = 60.0 * frame_rate / lags
+    weights = np.exp(-0.5 * np.square(np.log2(bpms / PREFERRED_BPM)))
+    best = int(np.argmax(autocorrelation[lags] * weights))
+    lag = float(lags[best])
+    confidence = float(np.clip(autocorrelation[lags[best]] / autocorrelation[0], 0.0, 1.0))
+
+    # whole lags are several BPM apart at usual tempos, a parabola through the neighbours finds the peak in between
+    if min_lag < lags[best] < max_lag:
+        before, peak, after = autocorrelation[lags[best] - 1:lags[best] + 2]
+        curvature = before - 2 * peak + after
+        if curvature < 0:
+            lag += 0.5 * (before - after) / curvature
+    return float(60.0 * frame_rate / lag), confidence
+
+
+def estimate_key(chroma: "np.ndarray") -> tuple[str, bool, float]:
+    """Key name, whether it is major and the correlation with the best matching key profile."""
+    if not chroma.any():
+        return "", True, 0.0
+    best = ("", True, -1.0)
+    for major, profile in ((True, _MAJOR_PROFILE), (False, _MINOR_PROFILE)):
+        profile = np.asarray(profile)
+        for tonic in range(12):
+            correlation = float(np.corrcoef(chroma, np.roll(profile, tonic))[0, 1])
+            if correlation > best[2]:
+                best = (KEY_NAMES[tonic], major, correlation)
+    return best
+
+
+def extract_features(samples: "np.ndarray", sample_rate: int = SAMPLE_RATE) -> AudioFeatures:
+    frequencies = np.fft.rfftfreq(FRAME_SIZE, 1.0 / sample_rate).astype(np.float32)
+    chroma_matrix = _chroma_matrix(sample_rate, FRAME_SIZE)
+
+    rms_blocks = []
+    centroids = []
+    rolloffs = []
+    flux_blocks = []
+    chroma = np.zeros(12, dtype=np.float64)
+    previous = None
+    for spectra, rms in spectral_frames(samples, sample_rate):
+        rms_blocks.append(rms)
+        totals = spectra.sum(axis=1)
+        voiced = totals > 1e-6
+        centroids.append((spectra[voiced] @ frequencies) / totals[voiced])
+        cumulative = np.cumsum(spectra[voiced], axis=1)
+        rolloffs.append(frequencies[np.argmax(cumulative >= 0.85 * cumulative[:, -1:], axis=1)])
+        chroma += (np.square(spectra) @ chroma_matrix).sum(axis=0)
+
+        flux, previous = _spectral_flux(spectra, previous)
+        flux_blocks.append(flux)
+
+    rms = np.concatenate(rms_blocks)
+    envelope = np.concatenate(flux_blocks)
+    frame_rate = sample_rate / HOP_SIZE
+
+    rms_db = 20 * np.log10(np.maximum(rms, 1e-5))
+    audible = rms_db[rms_db > -60]
+    loudness_db = float(20 * np.log10(max(float(np.sqrt(np.mean(np.square(rms)))), 1e-5)))
+    dynamic_range_db = float(np.percentile(audible, 95) - np.percentile(audible, 10)) if len(audible) else 0.0
+
+    centroid = np.concatenate(centroids)
+    rolloff = np.concatenate(rolloffs)
+
+    # onsets are local maxima of the envelope clearly above its running level
+    threshold = envelope.mean() + envelope.std()
+    peaks = (envelope[1:-1] > threshold) & (envelope[1:-1] >= envelope[:-2]) & (envelope[1:-1] > envelope[2:])
+    duration = len(samples) / sample_rate
+
+    bpm, bpm_confidence = estimate_tempo(envelope, frame_rate)
+    key, major, key_strength = estimate_key(chroma)
+
+    return AudioFeatures(duration=duration,
+                         loudness_db=loudness_db,
+                         dynamic_range_db=dynamic_range_db,
+                         centroid=float(np.median(centroid)) if len(centroid) else 0.0,
+                         rolloff=float(np.median(rolloff)) if len(rolloff) else 0.0,
+                         onset_strength=float(envelope.mean() / (envelope.max() or 1.0)) if len(envelope) else 0.0,
+                         onset_rate=float(peaks.sum() / duration) if duration else 0.0,
+                         bpm=bpm,
+                         bpm_confidence=bpm_confidence,
+                         key=key,
+                         major=major,
+                         key_strength=key_strength)
+
+
+def detect_bpm(file_path: PathLike[str]) -> tuple[float, float]:
+    """Tempo and confidence of the file, intros are skipped if the file is long enough."""
+    try:
+        samples = decode(file_path, max_seconds=BPM_DECODE_SECONDS, offset_seconds=BPM_OFFSET_SECONDS)
+    except DecodeError:
+        # shorter than the offset
+        samples = None
+    if samples is None or len(samples) < SAMPLE_RATE * 10:
+        samples = decode(file_path, max_seconds=BPM_DECODE_SECONDS)
+    return estimate_tempo(onset_envelope(samples), SAMPLE_RATE / HOP_SIZE)
+
+
+def analyze_file(file_path: PathLike[str]) -> dict:
+    """Entry point of the worker processes, returns the features as a plain dict."""
+    return extract_features(decode(file_path)).as_dict()
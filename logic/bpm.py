@@ -0,0 +1,96 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from os import PathLike
+from pathlib import Path
+
+from PySide6.QtCore import QThread, Signal
+
+from logic.audiofeatures import detect_bpm
+from logic.mp3 import has_mp3_bpm, update_mp3_bpm
+from logic.scanner import scan_mp3s
+
+logger = logging.getLogger(__file__)
+
+# tempos detected with less confidence are not written
+MIN_BPM_CONFIDENCE = 0.2
+
+
+class BpmDetector(QThread):
+    """
+    Detects the tempo of files and directories on a process pool and writes it to the TBPM tag.
+    Files which already have a tempo are left alone unless overwrite is set.
+    """
+    # files done, files total
+    progress = Signal(int, int)
+    result = Signal(Path)
+
+    def __init__(self, paths: list[PathLike[str]], overwrite: bool = False, min_confidence: float = MIN_BPM_CONFIDENCE, parent=None):
+        super().__init__(parent)
+        self.paths = paths
+        self.overwrite = overwrite
+        self.min_confidence = min_confidence
+        self.is_interrupted = False
+        self.detected = 0
+
+    def _files(self) -> list[Path]:
+        files = []
+        for path in self.paths:
+            if os.path.isdir(path):
+                files.extend(scan_mp3s(path))
+            else:
+                files.append(Path(path))
+        return [file_path for file_path in files if self.overwrite or not has_mp3_bpm(file_path)]
+
+    def run(self):
+        files = self._files()
+        if not files or self.is_interrupted:
+            self.progress.emit(0, 0)
+            return
+
+        done = 0
+        self.progress.emit(done, len(files))
+        # spawned processes don't inherit the Qt state of the application
+        with ProcessPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) - 1), mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = {executor.submit(detect_bpm, file_path): file_path for file_path in files}
+            try:
+                for future in as_completed(futures):
+                    if self.is_interrupted:
+                        break
+
+                    file_path = futures[future]
+                    done += 1
+                    try:
+                        bpm, confidence = future.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        logger.warning("Could not detect tempo of {0}: {1}", file_path, e)
+                    else:
+                        self._apply(file_path, bpm, confidence)
+                    self.progress.emit(done, len(files))
+            except BrokenProcessPool as e:
+                logger.error("BPM detection stopped: {0}", e)
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def _apply(self, file_path: Path, bpm: float, confidence: float):
+        if bpm <= 0 or confidence < self.min_confidence:
+            logger.debug("No reliable tempo for {0} ({1:.0f} BPM, confidence {2:.2f})", file_path.name, bpm, confidence)
+            return
+        try:
+            update_mp3_bpm(file_path, round(bpm), confidence=confidence)
+        except Exception as e:
+            logger.warning("Could not write tempo to {0}: {1}", file_path, e)
+            return
+        self.detected += 1
+        self.result.emit(file_path)
+
+    def cancel(self):
+        self.is_interrupted = True
+
+    def stop(self):
+        self.cancel()
+        self.wait()
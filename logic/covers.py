@@ -0,0 +1,275 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from enum import Enum
+from os import PathLike
+from pathlib import Path
+from typing import Hashable
+
+from PySide6.QtCore import Qt, QSize, QByteArray, QBuffer
+from PySide6.QtGui import QPixmap, QImageReader
+
+from config.settings import AppSettings, SettingKeys
+from config.utils import get_app_data_path
+
+logger = logging.getLogger(__file__)
+
+DEFAULT_COVER_CACHE_MB = 64
+PREVIEW_SIZE = QSize(128, 128)
+# thumbnails not shown for this long are deleted
+THUMBNAIL_MAX_AGE_DAYS = 90
+# stored in the cover index for files without an embedded cover
+NO_COVER = ""
+
+
+class CoverKind(Enum):
+    PREVIEW = 1
+    FULL = 2
+
+
+def pixmap_size_in_bytes(pixmap: QPixmap) -> int:
+    if pixmap is None or pixmap.isNull():
+        return 0
+    return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+
+class CoverCache:
+    """
+    Central LRU cache for decoded cover pixmaps with a memory budget in bytes.
+    Previews and full size covers share the same budget, the least recently used one is evicted first.
+    """
+
+    def __init__(self, budget_bytes: int = None):
+        if budget_bytes is None:
+            budget_bytes = AppSettings.value(SettingKeys.COVER_CACHE_SIZE, DEFAULT_COVER_CACHE_MB, type=int) * 1024 * 1024
+
+        self.budget_bytes = budget_bytes
+        self.memory_usage = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries: OrderedDict[Hashable, tuple[QPixmap, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable):
+        return key in self._entries
+
+    def get(self, key: Hashable) -> QPixmap | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, pixmap: QPixmap | None) -> QPixmap | None:
+        if pixmap is None or pixmap.isNull():
+            return pixmap
+
+        size = pixmap_size_in_bytes(pixmap)
+        if size > self.budget_bytes:
+            # a single image larger than the whole budget is handed out but never kept
+            logger.debug("Cover of {0} bytes exceeds cache budget of {1} bytes", size, self.budget_bytes)
+            return pixmap
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.memory_usage -= old[1]
+
+            self._entries[key] = (pixmap, size)
+            self.memory_usage += size
+
+            evicted = self._evict()
+
+        if evicted:
+            logger.debug("Evicted {0} covers. {1}", evicted, self.report())
+
+        return pixmap
+
+    def discard(self, key: Hashable):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.memory_usage -= old[1]
+
+    def set_budget(self, budget_bytes: int):
+        with self._lock:
+            self.budget_bytes = budget_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.memory_usage = 0
+
+    def _evict(self) -> int:
+        evicted = 0
+        while self.memory_usage > self.budget_bytes and self._entries:
+            key, (pixmap, size) = self._entries.popitem(last=False)
+            self.memory_usage -= size
+            evicted += 1
+
+        self.evictions += evicted
+        return evicted
+
+    def report(self) -> str:
+        return "Cover cache: {0} covers, {1:.1f} of {2:.1f} MB used, {3} hits, {4} misses, {5} evictions".format(
+            len(self._entries), self.memory_usage / (1024 * 1024), self.budget_bytes / (1024 * 1024), self.hits, self.misses, self.evictions)
+
+
+cover_cache = CoverCache()
+
+
+def cover_key(data: bytes) -> str:
+    """Identical embedded images (e.g. all tracks of an album) share the same key."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class CoverIndex:
+    """
+    Cover key of each file by path, size and modification time, kept in a sqlite database next to the thumbnails.
+    After a restart the thumbnail of a file is found without reading its tags.
+    """
+
+    def __init__(self, path: Path = None):
+        self.path = path
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _execute(self, sql: str, parameters=()) -> list[tuple]:
+        with self._lock:
+            try:
+                if self._connection is None:
+                    # opened on first use, most runs only ever read a few keys
+                    self._connection = sqlite3.connect(self.path or get_app_data_path("thumbnails").joinpath("index.sqlite"),
+                                                       check_same_thread=False)
+                    self._connection.execute("PRAGMA journal_mode=WAL")
+                    self._connection.execute("CREATE TABLE IF NOT EXISTS covers (path TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+                                             "mtime_ns INTEGER NOT NULL, key TEXT NOT NULL)")
+                with self._connection:
+                    return self._connection.execute(sql, parameters).fetchall()
+            except sqlite3.Error as e:
+                logger.error("Cover index error: {0}", e)
+                return []
+
+    def get(self, file_path: PathLike[str], signature: tuple[int, int]) -> str | None:
+        """The cover key, NO_COVER for files without a cover or None if the file is unknown or changed since."""
+        rows = self._execute("SELECT key FROM covers WHERE path = ? AND size = ? AND mtime_ns = ?", (os.path.abspath(file_path), *signature))
+        return rows[0][0] if rows else None
+
+    def put(self, file_path: PathLike[str], signature: tuple[int, int], key: str):
+        self._execute("INSERT OR REPLACE INTO covers (path, size, mtime_ns, key) VALUES (?, ?, ?, ?)",
+                      (os.path.abspath(file_path), *signature, key))
+
+    def prune(self) -> int:
+        """Removes the entries of files that no longer exist."""
+        missing = [(path,) for path, in self._execute("SELECT path FROM covers") if not os.path.exists(path)]
+        for row in missing:
+            self._execute("DELETE FROM covers WHERE path = ?", row)
+        return len(missing)
+
+
+cover_index = CoverIndex()
+
+
+def get_thumbnail_path(key: str) -> Path:
+    return get_app_data_path("thumbnails", key[:2]).joinpath(key + ".png")
+
+
+def get_cached_cover(key: str, kind: CoverKind) -> QPixmap | None:
+    pixmap = cover_cache.get((key, kind))
+    if pixmap is None and kind == CoverKind.PREVIEW:
+        pixmap = _load_thumbnail(key)
+    return pixmap
+
+
+def load_cover(key: str, data: bytes, kind: CoverKind) -> QPixmap | None:
+    pixmap = get_cached_cover(key, kind)
+    if pixmap is not None:
+        return pixmap
+
+    if kind == CoverKind.PREVIEW:
+        pixmap = _load_image(data, PREVIEW_SIZE)
+        _save_thumbnail(key, pixmap)
+    else:
+        pixmap = _load_image(data, None)
+
+    return cover_cache.put((key, kind), pixmap)
+
+
+def _load_thumbnail(key: str) -> QPixmap | None:
+    try:
+        thumbnail_path = get_thumbnail_path(key)
+        if thumbnail_path.is_file():
+            pixmap = QPixmap(str(thumbnail_path))
+            if not pixmap.isNull():
+                # the modification time tells prune_thumbnails when it was last shown
+                os.utime(thumbnail_path)
+                return cover_cache.put((key, CoverKind.PREVIEW), pixmap)
+    except OSError as e:
+        logger.warning("Could not read thumbnail {0}: {1}", key, e)
+    return None
+
+
+def _save_thumbnail(key: str, pixmap: QPixmap | None):
+    if pixmap is None or pixmap.isNull():
+        return
+    try:
+        pixmap.save(str(get_thumbnail_path(key)), "PNG")
+    except OSError as e:
+        logger.warning("Could not write thumbnail {0}: {1}", key, e)
+
+
+def prune_thumbnails(max_age_days: int = THUMBNAIL_MAX_AGE_DAYS) -> int:
+    """Deletes thumbnails not shown for max_age_days and forgets the covers of deleted files."""
+    deadline = time.time() - max_age_days * 24 * 60 * 60
+    removed = 0
+    for thumbnail_path in get_app_data_path("thumbnails").glob("*/*.png"):
+        try:
+            if thumbnail_path.stat().st_mtime < deadline:
+                thumbnail_path.unlink()
+                removed += 1
+        except OSError as e:
+            logger.debug("Could not remove thumbnail {0}: {1}", thumbnail_path, e)
+    forgotten = cover_index.prune()
+    logger.debug("Removed {0} thumbnails and {1} cover index entries", removed, forgotten)
+    return removed
+
+
+def _load_image(data: bytes, target_size: QSize | None) -> QPixmap | None:
+    # 1. Wrap bytes in a QBuffer so QImageReader can use it
+    byte_array = QByteArray(data)
+    buffer = QBuffer(byte_array)
+    buffer.open(QBuffer.OpenModeFlag.ReadOnly)
+    try:
+        # 2. Use QImageReader to handle the heavy lifting
+        reader = QImageReader(buffer)
+        reader.setAutoTransform(True)
+
+        # 3. Calculate aspect ratio scaling to target size
+        if target_size is not None:
+            orig_size = reader.size()
+            target_size = orig_size.scaled(target_size, Qt.AspectRatioMode.KeepAspectRatio)
+            reader.setScaledSize(target_size)
+
+        image = reader.read()
+
+        if not image.isNull():
+            return QPixmap.fromImage(image)
+    finally:
+        buffer.close()
+
+    return None
@@ -0,0 +1,203 @@
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from os import PathLike
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+from mutagen import MutagenError
+from mutagen.mp3 import MP3
+
+from logic.resultcache import audio_range
+
+logger = logging.getLogger(__file__)
+
+COPY_BLOCK_SIZE = 64 * 1024
+# bytes searched for the next frame header before giving up
+SYNC_SEARCH_SIZE = 64 * 1024
+
+# kbit/s by [version is MPEG1][layer] and bitrate index, MPEG2 and 2.5 share their tables
+_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+# Hz by version bits, MPEG2.5 = 0, MPEG2 = 2, MPEG1 = 3
+_SAMPLE_RATES = {0: (11025, 12000, 8000), 2: (22050, 24000, 16000), 3: (44100, 48000, 32000)}
+
+
+@dataclass(slots=True, frozen=True)
+class FrameHeader:
+    version: int
+    layer: int
+    sample_rate: int
+    bitrate: int
+    length: int
+    samples: int
+
+    def matches(self, other: "FrameHeader") -> bool:
+        """Frames of one stream share version, layer and sample rate, a random sync pattern rarely does."""
+        return self.version == other.version and self.layer == other.layer and self.sample_rate == other.sample_rate
+
+
+def parse_frame_header(data: bytes) -> FrameHeader | None:
+    if len(data) < 4 or data[0] != 0xFF or data[1] & 0xE0 != 0xE0:
+        return None
+
+    version = (data[1] >> 3) & 0x03
+    layer = 4 - ((data[1] >> 1) & 0x03)
+    bitrate_index = data[2] >> 4
+    sample_rate_index = (data[2] >> 2) & 0x03
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        # reserved values and free format streams, which have no fixed frame length
+        return None
+
+    mpeg1 = version == 3
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    padding = (data[2] >> 1) & 0x01
+
+    if layer == 1:
+        length = (12 * bitrate // sample_rate + padding) * 4
+        samples = 384
+    elif layer == 3 and not mpeg1:
+        length = 72 * bitrate // sample_rate + padding
+        samples = 576
+    else:
+        length = 144 * bitrate // sample_rate + padding
+        samples = 1152
+    return FrameHeader(version, layer, sample_rate, bitrate, length, samples)
+
+
+def find_frame(f: BinaryIO, offset: int, end: int) -> tuple[int, FrameHeader] | None:
+    """First frame at or after offset whose successor starts right where its length says."""
+    f.seek(offset)
+    data = f.read(min(SYNC_SEARCH_SIZE, end - offset))
+    position = data.find(b"\xFF")
+    while position != -1:
+        header = parse_frame_header(data[position:position + 4])
+        if header is not None:
+            following = position + header.length
+            if offset + following >= end:
+                return offset + position, header
+            if following + 4 <= len(data):
+                next_header = parse_frame_header(data[following:following + 4])
+            else:
+                f.seek(offset + following)
+                next_header = parse_frame_header(f.read(4))
+            if next_header is not None and next_header.matches(header):
+                return offset + position, header
+        position = data.find(b"\xFF", position + 1)
+    return None
+
+
+def _is_info_frame(f: BinaryIO, offset: int, header: FrameHeader) -> bool:
+    # the Xing/Info or VBRI frame carries no audio, only the frame count of the whole file
+    f.seek(offset)
+    data = f.read(min(header.length, 64))
+    return b"Xing" in data or b"Info" in data or b"VBRI" in data
+
+
+def excerpt_ranges(file_path: PathLike[str], windows: int, window_seconds: float) -> list[tuple[int, int]]:
+    """
+    Byte ranges of windows evenly spread over the audio, each starting and ending at a frame boundary.
+    An empty list means the windows would cover most of the file anyway.
+    """
+    start, end = audio_range(file_path)
+    with open(file_path, "rb") as f:
+        found = find_frame(f, start, end)
+        if found is None:
+            return []
+        first, header = found
+        if _is_info_frame(f, first, header):
+            first += header.length
+
+        window_bytes = int(header.bitrate * window_seconds / 8)
+        span = end - first
+        if window_bytes * windows >= span * 0.8:
+            return []
+
+        ranges = []
+        position = first
+        for index in range(windows):
+            # centered in its share of the file, so the intro and the fade out are not overrepresented
+            target = max(position, first + span * (2 * index + 1) // (2 * windows) - window_bytes // 2)
+            found = find_frame(f, target, end)
+            if found is None:
+                break
+            window_start, header = found
+
+            window_end = window_start
+            samples = 0
+            f.seek(window_start)
+            while samples < window_seconds * header.sample_rate and window_end < end:
+                frame = parse_frame_header(f.read(4))
+                if frame is None or not frame.matches(header):
+                    break
+                window_end += frame.length
+                samples += frame.samples
+                f.seek(window_end)
+
+            if window_end > window_start:
+                ranges.append((window_start, min(window_end, end)))
+                position = window_end
+        return ranges
+
+
+def write_excerpt(file_path: PathLike[str], out: BinaryIO, ranges: list[tuple[int, int]]) -> int:
+    """Copies the frames of the ranges without re-encoding, returns the number of bytes written."""
+    written = 0
+    with open(file_path, "rb") as f:
+        for start, end in ranges:
+            f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                block = f.read(min(COPY_BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                out.write(block)
+                remaining -= len(block)
+                written += len(block)
+    return written
+
+
+def audio_length(file_path: PathLike[str]) -> float:
+    try:
+        return MP3(file_path).info.length
+    except MutagenError as e:
+        logger.warning("Could not read length of {0}: {1}", file_path, e)
+        return 0.0
+
+
+@contextmanager
+def excerpt(file_path: PathLike[str], min_length: float, windows: int, window_seconds: float) -> Iterator[Path]:
+    """
+    Yields a temporary MP3 made of a few windows of the file if it is longer than min_length seconds,
+    otherwise the file itself. The first frame of each window may decode with a glitch as its bit reservoir
+    is missing, which does not matter for the mood analysis.
+    """
+    ranges = []
+    if 0 < min_length < audio_length(file_path) and windows > 0 and window_seconds > 0:
+        ranges = excerpt_ranges(file_path, windows, window_seconds)
+
+    if not ranges:
+        yield Path(file_path)
+        return
+
+    handle, temp_path = tempfile.mkstemp(suffix=".mp3", prefix="excerpt_")
+    try:
+        with os.fdopen(handle, "wb") as out:
+            size = write_excerpt(file_path, out, ranges)
+        logger.debug("Excerpt of {0}: {1} windows, {2} of {3} bytes", Path(file_path).name, len(ranges), size, os.path.getsize(file_path))
+        yield Path(temp_path)
+    finally:
+        try:
+            os.remove(temp_path)
+        except OSError as e:
+            logger.warning("Could not remove excerpt {0}: {1}", temp_path, e)
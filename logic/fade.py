@@ -0,0 +1,132 @@
+import logging
+import math
+import time
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Callable
+
+from PySide6.QtCore import QObject, QTimer, Qt
+from vlc import MediaPlayer
+
+logger = logging.getLogger(__file__)
+
+# volume steps of running fades, VLC applies a new volume with the next audio buffer anyway
+TICK_MS = 10
+# range of the logarithmic curve, quieter than this counts as silence
+LOG_RANGE_DB = 60.0
+
+
+class FadeCurve(StrEnum):
+    LINEAR = "LINEAR"
+    # constant loudness while two tracks overlap
+    EQUAL_POWER = "EQUAL_POWER"
+    # linear in decibel, sounds even to the ear for long fades
+    LOGARITHMIC = "LOGARITHMIC"
+
+
+def curve_value(curve: FadeCurve, progress: float, rising: bool) -> float:
+    """Share of the way from start to target volume after progress (0-1) of the fade."""
+    progress = min(1.0, max(0.0, progress))
+    if curve == FadeCurve.EQUAL_POWER:
+        if rising:
+            return math.sin(progress * math.pi / 2)
+        return 1.0 - math.cos(progress * math.pi / 2)
+    if curve == FadeCurve.LOGARITHMIC and 0.0 < progress < 1.0:
+        if rising:
+            return 10 ** ((progress - 1.0) * LOG_RANGE_DB / 20)
+        return 1.0 - 10 ** (-progress * LOG_RANGE_DB / 20)
+    return progress
+
+
+@dataclass(slots=True)
+class Fade:
+    player: MediaPlayer
+    start_volume: int
+    target_volume: int
+    start: float
+    duration: float
+    curve: FadeCurve
+    on_finished: Callable[[], None] | None = None
+
+    def volume(self, now: float) -> int:
+        progress = (now - self.start) / self.duration if self.duration > 0 else 1.0
+        value = curve_value(self.curve, progress, self.target_volume > self.start_volume)
+        return round(self.start_volume + (self.target_volume - self.start_volume) * value)
+
+    def done(self, now: float) -> bool:
+        return now - self.start >= self.duration
+
+
+class FadeScheduler(QObject):
+    """
+    Ramps the volume of media players on the Qt thread, timed by the monotonic clock.
+    A player has at most one fade, a new one continues from the current volume and drops the old one with its callback.
+    The timer only runs while fades are in progress.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._fades: dict[int, Fade] = {}
+
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.timer.setInterval(TICK_MS)
+        self.timer.timeout.connect(self._tick)
+
+    def fade(self, player: MediaPlayer, target_volume: int, duration_ms: int, curve: FadeCurve = FadeCurve.EQUAL_POWER,
+             on_finished: Callable[[], None] = None, start_volume: int = None):
+        """Fades the player from start_volume, by default its current volume, to target_volume."""
+        previous = self._fades.pop(id(player), None)
+        now = time.monotonic()
+        if start_volume is None:
+            start_volume = previous.volume(now) if previous is not None else player.audio_get_volume()
+
+        fade = Fade(player, max(0, start_volume), target_volume, now, duration_ms / 1000, curve, on_finished)
+        player.audio_set_volume(fade.start_volume)
+        if duration_ms <= 0:
+            self._finish(fade)
+            return
+
+        self._fades[id(player)] = fade
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def retarget(self, player: MediaPlayer, target_volume: int) -> bool:
+        """Lets a running fade in end at a new volume, returns False if the player is not fading in."""
+        fade = self._fades.get(id(player))
+        if fade is None or fade.target_volume <= fade.start_volume:
+            return False
+        fade.target_volume = max(fade.start_volume, target_volume)
+        return True
+
+    def is_fading(self, player: MediaPlayer) -> bool:
+        return id(player) in self._fades
+
+    def cancel(self, player: MediaPlayer):
+        """Stops the fade of the player where it is, without calling its callback."""
+        self._fades.pop(id(player), None)
+        if not self._fades:
+            self.timer.stop()
+
+    def cancel_all(self):
+        self._fades.clear()
+        self.timer.stop()
+
+    def _tick(self):
+        now = time.monotonic()
+        for key, fade in list(self._fades.items()):
+            if fade.done(now):
+                del self._fades[key]
+                self._finish(fade)
+            else:
+                fade.player.audio_set_volume(fade.volume(now))
+        if not self._fades:
+            self.timer.stop()
+
+    def _finish(self, fade: Fade):
+        fade.player.audio_set_volume(fade.target_volume)
+        if fade.on_finished is not None:
+            try:
+                fade.on_finished()
+            except Exception as e:
+                logger.error("Fade callback failed: {0}", e)
@@ -0,0 +1,165 @@
+import http.client
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from dataclasses import dataclass
+from os import PathLike
+from typing import Any
+
+logger = logging.getLogger(__file__)
+
+DEFAULT_TIMEOUT = 300
+
+# size of the buffers a streamed request body is sent with
+UPLOAD_BLOCK_SIZE = 64 * 1024
+
+# errors of a keep-alive socket the server already closed, the request is repeated once on a fresh connection
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest, http.client.BadStatusLine,
+                            ConnectionResetError, ConnectionAbortedError, BrokenPipeError)
+
+
+class HttpError(Exception):
+
+    def __init__(self, status: int, reason: str, body: bytes = b""):
+        super().__init__("{0} - {1}".format(status, reason))
+        self.status = status
+        self.reason = reason
+        self.body = body
+
+
+@dataclass(slots=True)
+class TransferStats:
+    requests: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second."""
+        return self.bytes / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self):
+        return "{0} uploads, {1:.1f} MB in {2:.1f} s, {3:.2f} MB/s".format(self.requests, self.bytes / (1024 * 1024), self.seconds,
+                                                                            self.throughput / (1024 * 1024))
+
+
+class HttpClient:
+    """
+    Minimal HTTP/1.1 client keeping one persistent connection per calling thread,
+    so every analysis worker reuses its TCP connection instead of opening one per file.
+    """
+
+    def __init__(self, base_url: str, timeout: float | None = DEFAULT_TIMEOUT):
+        url = urllib.parse.urlsplit(base_url)
+        self.scheme = url.scheme or "http"
+        self.host = url.hostname
+        self.port = url.port
+        self.base_path = url.path.rstrip("/")
+        self.timeout = timeout
+
+        self._local = threading.local()
+        self._connections: set[http.client.HTTPConnection] = set()
+        self._lock = threading.Lock()
+
+        # upload statistics per worker thread name
+        self.upload_stats: dict[str, TransferStats] = {}
+
+    def url(self, path: str) -> str:
+        return self.base_path + "/" + path.lstrip("/")
+
+    def _connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            if self.scheme == "https":
+                connection = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, blocksize=UPLOAD_BLOCK_SIZE)
+            else:
+                connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout, blocksize=UPLOAD_BLOCK_SIZE)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.add(connection)
+        return connection
+
+    def close(self):
+        """Closes the connection of the calling thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            self._local.connection = None
+            with self._lock:
+                self._connections.discard(connection)
+            connection.close()
+
+    def close_all(self):
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for connection in connections:
+            connection.close()
+
+    def request(self, method: str, path: str, body=None, headers: dict[str, str] = None) -> tuple[int, str, bytes]:
+        headers = headers or {}
+        # a seekable body stream is rewound before the request is repeated
+        start = body.tell() if hasattr(body, "seekable") and body.seekable() else None
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request(method, self.url(path), body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                if response.will_close:
+                    self.close()
+                return response.status, response.reason, data
+            except _STALE_CONNECTION_ERRORS as e:
+                self.close()
+                if attempt > 0:
+                    raise
+                if start is not None:
+                    body.seek(start)
+                elif not isinstance(body, (bytes, str, type(None))):
+                    # a body stream may be partly consumed already and can't be sent again
+                    raise
+                logger.debug("Reconnecting to {0}: {1}", self.host, e)
+            except Exception:
+                self.close()
+                raise
+
+    def post_file(self, path: str, file_path: PathLike[str], content_type: str = "application/octet-stream") -> tuple[int, str, bytes]:
+        """
+        Streams the file from disk with a known Content-Length, so only a few buffers per worker are held in memory.
+        """
+        size = os.path.getsize(file_path)
+        headers = {"Content-Type": content_type, "Content-Length": str(size)}
+
+        start = time.perf_counter()
+        with open(file_path, "rb") as f:
+            response = self.request("POST", path, f, headers)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            stats = self.upload_stats.setdefault(threading.current_thread().name, TransferStats())
+            stats.requests += 1
+            stats.bytes += size
+            stats.seconds += elapsed
+
+        logger.debug("Uploaded {0} bytes in {1:.2f} s ({2:.2f} MB/s)", size, elapsed, size / elapsed / (1024 * 1024) if elapsed > 0 else 0.0)
+        return response
+
+    def upload_report(self) -> str:
+        with self._lock:
+            return "\n".join("{0}: {1}".format(name, stats) for name, stats in sorted(self.upload_stats.items()))
+
+    def post_json(self, path: str, data: Any) -> Any:
+        status, reason, body = self.request("POST", path, json.dumps(data).encode("utf-8"), {"Content-Type": "application/json"})
+        return self._json_response(status, reason, body)
+
+    def get_json(self, path: str) -> Any:
+        status, reason, body = self.request("GET", path)
+        return self._json_response(status, reason, body)
+
+    @staticmethod
+    def _json_response(status: int, reason: str, body: bytes) -> Any:
+        if status != 200:
+            raise HttpError(status, reason, body)
+        return json.loads(body)
@@ -0,0 +1,175 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+from enum import IntEnum
+from os import PathLike
+
+logger = logging.getLogger(__file__)
+
+
+class JobPriority(IntEnum):
+    """Lower values are analyzed first."""
+    PLAYING = 0
+    SELECTED = 1
+    NORMAL = 2
+    BACKGROUND = 3
+
+
+class AnalysisJob(object):
+    __slots__ = ["path", "key", "priority", "batch", "sequence", "cancelled"]
+
+    path: str
+    key: str
+    priority: JobPriority
+    batch: int | None
+    sequence: int
+    cancelled: bool
+
+    def __init__(self, path: str, priority: JobPriority, batch: int | None, sequence: int):
+        self.path = path
+        self.key = job_key(path)
+        self.priority = priority
+        self.batch = batch
+        self.sequence = sequence
+        self.cancelled = False
+
+    def __lt__(self, other):
+        # same priority keeps submission order
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+    def __repr__(self):
+        return "AnalysisJob({0}, {1}, batch={2})".format(self.path, self.priority.name, self.batch)
+
+
+def job_key(path: PathLike[str]) -> str:
+    return os.path.normcase(os.path.abspath(path))
+
+
+class JobScheduler:
+    """
+    Thread safe priority queue of analysis jobs.
+    Every file is queued at most once, a resubmission with a more urgent priority moves the queued job up.
+    At most max_in_flight jobs are handed out via take() until they are reported back with done().
+    Cancelled jobs stay in the heap and are skipped lazily.
+    """
+
+    def __init__(self, max_in_flight: int = 8):
+        self.max_in_flight = max_in_flight
+
+        self._heap: list[AnalysisJob] = []
+        self._queued: dict[str, AnalysisJob] = {}
+        self._in_flight: dict[str, AnalysisJob] = {}
+        self._sequence = itertools.count()
+        self._batches = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def queued_count(self) -> int:
+        return len(self._queued)
+
+    @property
+    def in_flight_count(self) -> int:
+        return len(self._in_flight)
+
+    def new_batch(self) -> int:
+        return next(self._batches)
+
+    def is_queued(self, path: PathLike[str]) -> bool:
+        key = job_key(path)
+        return key in self._queued or key in self._in_flight
+
+    def submit(self, path: PathLike[str], priority: JobPriority = JobPriority.NORMAL, batch: int | None = None) -> bool:
+        """Returns False if the file is already being analyzed or was queued before."""
+        key = job_key(path)
+        with self._lock:
+            if key in self._in_flight:
+                return False
+
+            queued = self._queued.get(key)
+            if queued is not None:
+                if priority < queued.priority:
+                    self._requeue(queued, priority)
+                return False
+
+            job = AnalysisJob(os.path.abspath(path), priority, batch, next(self._sequence))
+            self._queued[key] = job
+            heapq.heappush(self._heap, job)
+            return True
+
+    def prioritize(self, path: PathLike[str], priority: JobPriority) -> bool:
+        with self._lock:
+            queued = self._queued.get(job_key(path))
+            if queued is None or queued.priority <= priority:
+                return False
+
+            self._requeue(queued, priority)
+            return True
+
+    def _requeue(self, job: AnalysisJob, priority: JobPriority):
+        job.cancelled = True
+        moved = AnalysisJob(job.path, priority, job.batch, next(self._sequence))
+        self._queued[job.key] = moved
+        heapq.heappush(self._heap, moved)
+
+    def cancel(self, path: PathLike[str]) -> bool:
+        """Cancels a queued job, jobs already running are finished."""
+        with self._lock:
+            job = self._queued.pop(job_key(path), None)
+            if job is None:
+                return False
+            job.cancelled = True
+            return True
+
+    def cancel_batch(self, batch: int) -> list[str]:
+        """Returns the paths of the cancelled jobs."""
+        with self._lock:
+            jobs = [job for job in self._queued.values() if job.batch == batch]
+            for job in jobs:
+                job.cancelled = True
+                del self._queued[job.key]
+            self._compact()
+            return [job.path for job in jobs]
+
+    def cancel_all(self) -> int:
+        with self._lock:
+            count = len(self._queued)
+            for job in self._queued.values():
+                job.cancelled = True
+            self._queued.clear()
+            self._heap.clear()
+            return count
+
+    def _compact(self):
+        # drop cancelled leftovers once they dominate the heap
+        if len(self._heap) > 2 * len(self._queued) + 64:
+            self._heap = [job for job in self._heap if not job.cancelled]
+            heapq.heapify(self._heap)
+
+    def take(self) -> AnalysisJob | None:
+        """Next job by priority, or None if the queue is empty or the in-flight window is full."""
+        with self._lock:
+            if len(self._in_flight) >= self.max_in_flight:
+                return None
+
+            while self._heap:
+                job = heapq.heappop(self._heap)
+                if job.cancelled:
+                    continue
+
+                del self._queued[job.key]
+                self._in_flight[job.key] = job
+                return job
+
+            return None
+
+    def take_batch(self, count: int) -> list[AnalysisJob]:
+        jobs = []
+        while len(jobs) < count and (job := self.take()) is not None:
+            jobs.append(job)
+        return jobs
+
+    def done(self, job: AnalysisJob):
+        with self._lock:
+            self._in_flight.pop(job.key, None)
@@ -0,0 +1,188 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from enum import Enum
+from os import PathLike
+from pathlib import Path
+
+from config.settings import get_category_keys
+from config.utils import get_app_data_path
+from logic.jobs import AnalysisJob, JobPriority, job_key
+from logic.mp3 import file_signature
+
+logger = logging.getLogger(__file__)
+
+
+class JobState(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    state TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    categories TEXT,
+    error TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+CREATE TABLE IF NOT EXISTS scans (
+    path TEXT PRIMARY KEY,
+    updated REAL NOT NULL
+);
+"""
+
+_UPSERT = """
+INSERT INTO jobs (key, path, state, priority, size, mtime_ns, categories, error, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET state = excluded.state, size = excluded.size, mtime_ns = excluded.mtime_ns,
+    categories = excluded.categories, error = excluded.error, updated = excluded.updated
+"""
+
+# sqlite limits the number of parameters of a statement
+_QUERY_CHUNK_SIZE = 500
+
+
+def categories_signature() -> str:
+    """A file analyzed for a different set of categories has to be analyzed again."""
+    return ",".join(sorted(get_category_keys()))
+
+
+class JobJournal:
+    """
+    Durable record of the analysis state of every file, kept in a sqlite database in the app data directory.
+    Queued and running jobs as well as unfinished directory scans are picked up again after a restart,
+    done jobs keep the size and modification time of the file after its tags were written.
+    """
+
+    def __init__(self, path: Path = None):
+        self.path = path or get_app_data_path().joinpath("analysis_journal.sqlite")
+        self._lock = threading.Lock()
+        # workers record their results from several threads, all access goes through the lock
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")]
+        if "categories" not in columns:
+            self._connection.execute("ALTER TABLE jobs ADD COLUMN categories TEXT")
+
+    def _execute(self, sql: str, parameters=()) -> list[tuple]:
+        with self._lock:
+            try:
+                with self._connection:
+                    return self._connection.execute(sql, parameters).fetchall()
+            except sqlite3.Error as e:
+                logger.error("Job journal error: {0}", e)
+                return []
+
+    def _execute_many(self, sql: str, rows: list[tuple]):
+        if not rows:
+            return
+        with self._lock:
+            try:
+                with self._connection:
+                    self._connection.executemany(sql, rows)
+            except sqlite3.Error as e:
+                logger.error("Job journal error: {0}", e)
+
+    def queued(self, file_paths: list[PathLike[str]], priority: JobPriority):
+        now = time.time()
+        self._execute_many("""
+            INSERT INTO jobs (key, path, state, priority, updated) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET state = excluded.state, priority = excluded.priority, error = NULL, updated = excluded.updated
+            """, [(job_key(file_path), os.path.abspath(file_path), JobState.QUEUED.value, int(priority), now) for file_path in file_paths])
+
+    def started(self, jobs: list[AnalysisJob]):
+        now = time.time()
+        self._execute_many(_UPSERT, [(job.key, job.path, JobState.RUNNING.value, int(job.priority), None, None, None, None, now)
+                                     for job in jobs])
+
+    def finished(self, file_path: PathLike[str], error: str = None):
+        """Records a done job with the current fingerprint of the file, or a failed one if an error is given."""
+        size, mtime_ns = file_signature(file_path) or (None, None)
+        state = JobState.DONE if error is None else JobState.FAILED
+        self._execute_many(_UPSERT, [(job_key(file_path), os.path.abspath(file_path), state.value, int(JobPriority.NORMAL), size, mtime_ns,
+                                      categories_signature() if error is None else None, error, time.time())])
+
+    def done(self, file_paths: list[PathLike[str]]):
+        """Records files found analyzed already with their current fingerprint, without a job having run."""
+        now = time.time()
+        categories = categories_signature()
+        rows = []
+        for file_path in file_paths:
+            size, mtime_ns = file_signature(file_path) or (None, None)
+            rows.append((job_key(file_path), os.path.abspath(file_path), JobState.DONE.value, int(JobPriority.NORMAL), size, mtime_ns,
+                         categories, None, now))
+        self._execute_many(_UPSERT, rows)
+
+    def remove(self, file_paths: list[PathLike[str]]):
+        self._execute_many("DELETE FROM jobs WHERE key = ?", [(job_key(file_path),) for file_path in file_paths])
+
+    def remove_queued(self):
+        self._execute("DELETE FROM jobs WHERE state = ?", (JobState.QUEUED.value,))
+
+    def pending(self) -> list[tuple[str, JobPriority]]:
+        """Unfinished jobs, the ones interrupted while running come first."""
+        rows = self._execute("SELECT path, priority FROM jobs WHERE state IN (?, ?) ORDER BY state = ? DESC, priority, rowid",
+                             (JobState.QUEUED.value, JobState.RUNNING.value, JobState.RUNNING.value))
+        return [(path, JobPriority(priority)) for path, priority in rows]
+
+    def failed(self) -> list[str]:
+        return [row[0] for row in self._execute("SELECT path FROM jobs WHERE state = ? ORDER BY rowid", (JobState.FAILED.value,))]
+
+    def failed_count(self) -> int:
+        rows = self._execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (JobState.FAILED.value,))
+        return rows[0][0] if rows else 0
+
+    def state(self, file_path: PathLike[str]) -> tuple[JobState, int | None, int | None] | None:
+        """State of the file with the size and modification time recorded when it was finished."""
+        rows = self._execute("SELECT state, size, mtime_ns FROM jobs WHERE key = ?", (job_key(file_path),))
+        if not rows:
+            return None
+        state, size, mtime_ns = rows[0]
+        return JobState(state), size, mtime_ns
+
+    def done_signatures(self, file_paths: list[PathLike[str]]) -> dict[str, tuple[int, int]]:
+        """Size and modification time by job key of the files analyzed for the current categories."""
+        keys = [job_key(file_path) for file_path in file_paths]
+        categories = categories_signature()
+        signatures = {}
+        for start in range(0, len(keys), _QUERY_CHUNK_SIZE):
+            chunk = keys[start:start + _QUERY_CHUNK_SIZE]
+            rows = self._execute("SELECT key, size, mtime_ns FROM jobs WHERE state = ? AND categories = ? AND key IN ({0})"
+                                 .format(",".join("?" * len(chunk))), (JobState.DONE.value, categories, *chunk))
+            for key, size, mtime_ns in rows:
+                signatures[key] = (size, mtime_ns)
+        return signatures
+
+    def scan_started(self, directory: PathLike[str]):
+        self._execute("INSERT OR REPLACE INTO scans (path, updated) VALUES (?, ?)", (os.path.abspath(directory), time.time()))
+
+    def scan_finished(self, directory: PathLike[str]):
+        self._execute("DELETE FROM scans WHERE path = ?", (os.path.abspath(directory),))
+
+    def scans(self) -> list[str]:
+        return [row[0] for row in self._execute("SELECT path FROM scans ORDER BY updated")]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_job_journal: JobJournal | None = None
+
+
+def get_job_journal() -> JobJournal:
+    global _job_journal
+    if _job_journal is None:
+        _job_journal = JobJournal()
+    return _job_journal
@@ -1,46 +1,161 @@
 import os
 
 import sys
-import glob
 import json
 import logging
+import queue
+import shutil
+import tempfile
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import Callable, Iterable, Mapping, MutableMapping
 from pathlib import Path
 from os import PathLike
 
-from PySide6.QtCore import Qt, QThread, Signal, QSize, QByteArray, QBuffer
-from PySide6.QtGui import QPixmap, QImageReader
+from PySide6.QtCore import Qt, QThread, Signal, QObject, QTimer
+from PySide6.QtGui import QPixmap
 
+from mutagen import MutagenError
 from mutagen.mp3 import MP3
 from mutagen.id3 import ID3, TXXX, COMM, TIT2, TCON, TALB, TPE1, TBPM, APIC, Encoding, PictureType, CHAP, CTOC
 
+from config.settings import get_category_keys
 from logic.lightengine import LightSetting
+from logic.covers import CoverKind, cover_key, get_cached_cover, load_cover, cover_index, NO_COVER
+from logic.scanner import scan
 
 logger = logging.getLogger(__file__)
 
+M3U_CACHE_TAG = "#EXT-X-DT:"
+
+# the umask can only be read by setting it, which is done once while importing rather than racing the writer thread
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+_NO_VALUE = float("nan")
+
+_category_slots: dict[str, int] = {}
+_category_keys: list[str] = []
+_category_lock = threading.Lock()
+
+
+def _category_slot(key: str, create: bool = False) -> int | None:
+    """
+    Categories of all entries share one append-only slot registry, seeded with the configured categories
+    so the common keys have the same fixed position for every entry.
+    """
+    slot = _category_slots.get(key)
+    if slot is not None or not create:
+        return slot
+
+    with _category_lock:
+        if not _category_keys:
+            for default_key in get_category_keys():
+                _category_slots.setdefault(sys.intern(default_key), len(_category_keys))
+                _category_keys.append(sys.intern(default_key))
+
+        slot = _category_slots.get(key)
+        if slot is None:
+            slot = len(_category_keys)
+            key = sys.intern(key)
+            _category_slots[key] = slot
+            _category_keys.append(key)
+        return slot
+
+
+def _intern(value: str | None) -> str | None:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _intern_all(values: list[str] | tuple[str, ...] | str | None) -> tuple[str, ...]:
+    if not values:
+        return ()
+    if isinstance(values, str):
+        return (sys.intern(values),)
+    return tuple(_intern(value) for value in values)
+
+
+class CategoryMap(MutableMapping):
+    """Dict-like view on the fixed-slot category values of a single Mp3Entry."""
+    __slots__ = ["_entry"]
+
+    def __init__(self, entry: "Mp3Entry"):
+        self._entry = entry
+
+    def __getitem__(self, key: str):
+        values = self._entry._categories
+        slot = _category_slots.get(key)
+        if values is None or slot is None or slot >= len(values) or values[slot] != values[slot]:
+            raise KeyError(key)
+        value = values[slot]
+        return int(value) if value.is_integer() else value
+
+    def __setitem__(self, key: str, value):
+        if value is None:
+            self.pop(key, None)
+            return
+
+        slot = _category_slot(key, create=True)
+        values = self._entry._categories
+        if values is None:
+            values = self._entry._categories = array("d")
+        if slot >= len(values):
+            values.extend([_NO_VALUE] * (slot + 1 - len(values)))
+        values[slot] = float(value)
+
+    def __delitem__(self, key: str):
+        values = self._entry._categories
+        slot = _category_slots.get(key)
+        if values is None or slot is None or slot >= len(values) or values[slot] != values[slot]:
+            raise KeyError(key)
+        values[slot] = _NO_VALUE
+
+    def __iter__(self):
+        values = self._entry._categories
+        if values is None:
+            return
+        for slot, value in enumerate(values):
+            if value == value:
+                yield _category_keys[slot]
+
+    def __len__(self):
+        values = self._entry._categories
+        if values is None:
+            return 0
+        return sum(1 for value in values if value == value)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
 class Mp3Entry(object):
-    __slots__ = ["index", "name", "path", "title", "artist", "album", "summary", "genres", "length", "favorite", "categories", "_tags", "_cover","_cover_preview",
-                 "_has_cover",
-                 "bpm", "_moods", "light","chapters"]
+    __slots__ = ["index", "name", "path", "title", "_artist", "_album", "summary", "_genres", "length", "favorite", "_categories", "_tags",
+                 "_has_cover", "_cover_key",
+                 "bpm", "light", "chapters", "signature"]
 
     index: int
     name: str | None
     path: Path
     title: str
-    artist: str
-    album: str
     summary: str
-    genres: list[str]
     length: int
     favorite: bool
-    _cover: QPixmap | None
-    _cover_preview: QPixmap | None
     _has_cover: bool | None
+    _cover_key: str | None
     bpm: int
     light: LightSetting | None
     duration:int
+    # (size, mtime_ns) of the file when the metadata was read
+    signature: tuple[int, int] | None
 
-    categories: dict[str, int]
-    _tags: list[str]
+    # artist, album, genres and tags repeat across a whole library and are stored interned
+    _artist: str | None
+    _album: str | None
+    _genres: tuple[str, ...]
+    _tags: tuple[str, ...]
+    # category values by registry slot, NaN marks a missing category
+    _categories: array | None
 
     chapters: list[dict[str, str]]
 
@@ -50,38 +165,81 @@ class Mp3Entry(object):
             self.name = name.removesuffix(".mp3").removesuffix(".MP3").removesuffix(".Mp3")
         else:
             self.name = None
-        self.path = path
         self.path = path if isinstance(path, Path) else Path(path)
         self.title = title
         self.artist = artist
         self.album = album
-        if isinstance(genre, str):
-            self.genres = [genre]
-        elif genre:
-            self.genres = genre
-        else:
-            self.genres = []
+        self.genres = genre
         self.summary = ""
         self.length = -1
         self.favorite = False
-        if categories:
-            self.categories = categories
-        else:
-            self.categories = {}
-
-        if tags:
-            self._tags = tags
-        else:
-            self._tags = []
+        self._categories = None
+        self.categories = categories
+        self.tags = tags
 
-        self._cover = None
-        self._cover_preview = None
         self._has_cover = None
+        self._cover_key = None
         self.bpm = bpm
         self.index = None
         self.light = None
 
         self.chapters = []
+        self.signature = None
+
+    @classmethod
+    def from_m3u_cache(cls, path: Path, data: dict):
+        """Restores an entry from the metadata cached in an extended playlist, see m3u_cache_line."""
+        entry = Mp3Entry(name=path.name, path=path, categories=data.get("categories"), tags=data.get("tags"), artist=data.get("artist"),
+                         album=data.get("album"), title=data.get("title"), genre=data.get("genres"), bpm=data.get("bpm"))
+        entry.summary = data.get("summary") or ""
+        entry.length = data.get("length", -1)
+        entry.favorite = bool(data.get("favorite", False))
+        if data.get("light"):
+            entry.light = LightSetting.json_load(data["light"])
+        if "size" in data and "mtime" in data:
+            entry.signature = (data["size"], data["mtime"])
+        return entry
+
+    @property
+    def artist(self) -> str | None:
+        return self._artist
+
+    @artist.setter
+    def artist(self, artist: str | None):
+        self._artist = _intern(artist)
+
+    @property
+    def album(self) -> str | None:
+        return self._album
+
+    @album.setter
+    def album(self, album: str | None):
+        self._album = _intern(album)
+
+    @property
+    def genres(self) -> tuple[str, ...]:
+        return self._genres
+
+    @genres.setter
+    def genres(self, genres: list[str] | str | None):
+        self._genres = _intern_all(genres)
+
+    @property
+    def categories(self) -> CategoryMap:
+        return CategoryMap(self)
+
+    @categories.setter
+    def categories(self, categories: dict[str, int] | list[dict] | None):
+        self._categories = None
+        if isinstance(categories, list):
+            categories = {item['category']: item['scale'] for item in categories}
+        if categories:
+            view = CategoryMap(self)
+            for key, value in categories.items():
+                try:
+                    view[key] = value
+                except (TypeError, ValueError):
+                    logger.warning("Ignoring invalid value {0!r} of category {1} in {2}", value, key, self.path)
 
     @property
     def length_in_ms(self):
@@ -90,15 +248,15 @@ class Mp3Entry(object):
         else:
             return None
     @property
-    def tags(self):
+    def tags(self) -> tuple[str, ...]:
         return self._tags
 
     @tags.setter
-    def tags(self, tags: list[str]):
-        self._tags = tags
+    def tags(self, tags: list[str] | None):
+        self._tags = _intern_all(tags)
 
     def add_tag(self, tag: str):
-        self.tags.append(tag)
+        self._tags = self._tags + (sys.intern(tag),)
 
     def _le(self, category, value) -> bool:
         return category in self.categories and self.get_category_value(category) <= value
@@ -115,83 +273,80 @@ class Mp3Entry(object):
         return self.path == other.path
 
     def get_category_value(self, category_key: str):
-        if self.categories is not None and category_key in self.categories:
-            return self.categories.get(category_key, None)
-        else:
+        # called for every row while sorting and filtering, so the slot is read without going through CategoryMap
+        values = self._categories
+        slot = _category_slots.get(category_key)
+        if values is None or slot is None or slot >= len(values):
             return None
+        value = values[slot]
+        if value != value:
+            return None
+        return int(value) if value.is_integer() else value
 
     @property
-    def cover(self):
-        self._load_cover()
-        return self._cover
+    def cover(self) -> QPixmap | None:
+        return self._get_cover(CoverKind.FULL)
 
     @property
-    def cover_preview(self):
-        self._load_cover_preview()
-        return self._cover_preview
+    def cover_preview(self) -> QPixmap | None:
+        return self._get_cover(CoverKind.PREVIEW)
 
     @property
     def has_cover(self) -> bool:
         if self._has_cover is not None:
             return self._has_cover
         else:
-            self._load_cover_preview()
+            self._get_cover(CoverKind.PREVIEW)
             return self._has_cover
 
     def clear_cover(self):
-        self._cover = None
-        self._cover_preview = None
+        self._cover_key = None
         self._has_cover = None
 
-    def _load_cover(self, audio: MP3 = None):
-        if (self._has_cover is None or self._has_cover) and self._cover is None:
-            if audio is None:
-                audio = MP3(self.path, ID3=ID3)
-            self._has_cover = False
-            for key in audio.tags.keys():
-                # APIC tags often have suffixes like APIC:Cover
-                if key.startswith("APIC"):
-                    data = audio.tags[key].data
-                    self._cover = self._load_image(data, None)
-                    self._has_cover = True
-                    break
-
-    def _load_cover_preview(self, audio: MP3 = None):
-        if (self._has_cover is None or self._has_cover) and self._cover_preview is None:
-            if audio is None:
-                audio = MP3(self.path, ID3=ID3)
-            self._has_cover = False
-            for key in audio.tags.keys():
-                # APIC tags often have suffixes like APIC:Cover
-                if key.startswith("APIC"):
-                    data = audio.tags[key].data
-                    self._cover_preview = self._load_image(data, QSize(128,128))
-                    self._has_cover = True
-                    break
-
-    def _load_image(self, data, target_size:QSize | None) -> QPixmap | None:
-        try:
-            # 1. Wrap bytes in a QBuffer so QImageReader can use it
-            byte_array = QByteArray(data)
-            buffer = QBuffer(byte_array)
-            buffer.open(QBuffer.OpenModeFlag.ReadOnly)
+    def _get_cover(self, kind: CoverKind) -> QPixmap | None:
+        if self._has_cover is False:
+            return None
 
-            # 2. Use QImageReader to handle the heavy lifting
-            reader = QImageReader(buffer)
-            reader.setAutoTransform(True)
+        signature = None
+        if self._cover_key is None:
+            # known from an earlier run unless the file changed since
+            signature = file_signature(self.path)
+            indexed_key = cover_index.get(self.path, signature) if signature is not None else None
+            if indexed_key == NO_COVER:
+                self._has_cover = False
+                return None
+            self._cover_key = indexed_key
+
+        if self._cover_key is not None:
+            pixmap = get_cached_cover(self._cover_key, kind)
+            if pixmap is not None:
+                self._has_cover = True
+                return pixmap
+
+        data = self._load_cover_data()
+        key = NO_COVER if data is None else cover_key(data)
+        if signature is not None and key != self._cover_key:
+            cover_index.put(self.path, signature, key)
+        if data is None:
+            return None
 
-            # 3. Calculate aspect ratio scaling to target size
-            if target_size is not None:
-                orig_size = reader.size()
-                target_size = orig_size.scaled(target_size, Qt.AspectRatioMode.KeepAspectRatio)
-                reader.setScaledSize(target_size)
+        self._cover_key = key
+        return load_cover(key, data, kind)
 
-            image = reader.read()
+    def _load_cover_data(self, audio: MP3 = None) -> bytes | None:
+        if audio is None:
+            audio = MP3(self.path, ID3=ID3)
+        self._has_cover = False
+        if audio.tags is None:
+            return None
 
-            if not image.isNull():
-                return QPixmap.fromImage(image)
-        finally:
-            buffer.close()
+        for key in audio.tags.keys():
+            # APIC tags often have suffixes like APIC:Cover
+            if key.startswith("APIC"):
+                self._has_cover = True
+                return audio.tags[key].data
+
+        return None
 
     @property
     def color(self):
@@ -310,9 +465,18 @@ class EffectEntry(object):
             return None
 
 
+def file_signature(file_path: PathLike[str]) -> tuple[int, int] | None:
+    try:
+        stat = os.stat(file_path)
+        return stat.st_size, stat.st_mtime_ns
+    except OSError:
+        return None
+
+
 def parse_mp3(file_path: PathLike[str]) -> Mp3Entry | None:
     try:
         entry = Mp3Entry(name=Path(file_path).name, path=file_path)
+        entry.signature = file_signature(file_path)
         audio = MP3(file_path, ID3=ID3)
 
         entry.length = int(audio.info.length)
@@ -336,28 +500,14 @@ def parse_mp3(file_path: PathLike[str]) -> Mp3Entry | None:
                 entry.bpm = int(audio.tags.get('TBPM').text[0])
 
             # Get Summary (COMM)
-            if "COMM::XXX" in audio.tags:
-                comm_frame = audio.tags.get("COMM::XXX")
-                if comm_frame.text:
-                    entry.summary = comm_frame.text[0]
-            else:
-                for key in audio.tags.keys():
-                    if key.startswith("COMM"):
-                        comm_frame = audio.tags[key]
-                        if comm_frame.text:
-                            entry.summary = comm_frame.text[0]
-                        break
+            summary = _summary_tag(audio.tags)
+            if summary is not None:
+                entry.summary = summary
 
             # Get Categories (TXXX:ai_categories)
-            txxx_cats = audio.tags.get("TXXX:ai_categories")
-            if txxx_cats and txxx_cats.text:
-                try:
-                    cats_map = json.loads(txxx_cats.text[0])
-                    if isinstance(cats_map, dict):
-                        entry.categories = cats_map
-
-                except json.JSONDecodeError:
-                    pass
+            cats_map = _categories_tag(audio.tags)
+            if cats_map is not None:
+                entry.categories = cats_map
 
             # Get Tags
             txxx_tags = audio.tags.get("TXXX:ai_tags")
@@ -390,6 +540,42 @@ def parse_mp3(file_path: PathLike[str]) -> Mp3Entry | None:
     return None
 
 
+def _summary_tag(tags: ID3) -> str | None:
+    if "COMM::XXX" in tags:
+        comm_frame = tags.get("COMM::XXX")
+        return comm_frame.text[0] if comm_frame.text else None
+
+    for key in tags.keys():
+        if key.startswith("COMM"):
+            comm_frame = tags[key]
+            return comm_frame.text[0] if comm_frame.text else None
+    return None
+
+
+def _categories_tag(tags: ID3) -> dict | None:
+    txxx_cats = tags.get("TXXX:ai_categories")
+    if txxx_cats and txxx_cats.text:
+        try:
+            cats_map = json.loads(txxx_cats.text[0])
+            if isinstance(cats_map, dict):
+                return cats_map
+        except json.JSONDecodeError:
+            pass
+    return None
+
+
+def read_analysis_tags(file_path: PathLike[str]) -> tuple[dict, str] | None:
+    """
+    Categories and summary of the file, read from the ID3 tag alone. Much cheaper than parse_mp3,
+    which also scans the audio stream for the length. None if the file has no readable tag.
+    """
+    try:
+        tags = ID3(file_path)
+    except (MutagenError, OSError):
+        return None
+    return _categories_tag(tags) or {}, _summary_tag(tags) or ""
+
+
 def _audio(path: PathLike[str] | MP3) -> MP3:
     if isinstance(path, MP3):
         audio = path
@@ -483,26 +669,42 @@ def update_mp3_artist(path: str | PathLike[str] | MP3, new_artist: str, save: bo
         logger.debug("Updated artist to {0} for {1}", new_artist, path)
 
 
-def update_mp3_bpm(path: str | PathLike[str] | MP3, new_bpm: int | None, save: bool = True):
+def update_mp3_bpm(path: str | PathLike[str] | MP3, new_bpm: int | None, save: bool = True, confidence: float = None):
+    """A confidence is stored along with detected tempos, manually entered ones drop the confidence of an old detection."""
     audio = _audio(path)
 
     if new_bpm is None:
         if "TBPM" in audio.tags:
             audio.tags.pop("TBPM")
+        audio.tags.delall("TXXX:ai_bpm_confidence")
     else:
+        old_bpm = audio.tags.get("TBPM")
+        changed = old_bpm is None or str(old_bpm.text[0] if old_bpm.text else "") != str(new_bpm)
         audio.tags.add(TBPM(Encoding.UTF8, text=[new_bpm]))
+        if confidence is not None:
+            audio.tags.add(TXXX(Encoding.UTF8, desc='ai_bpm_confidence', text=["{0:.2f}".format(confidence)]))
+        elif changed:
+            # an edited tempo is no longer the detected one, rewriting the same value e.g. when saving a song keeps it
+            audio.tags.delall("TXXX:ai_bpm_confidence")
     if save:
         audio.save()
         logger.debug("Updated bpm to {0} for {1}", new_bpm, path)
 
 
+def has_mp3_bpm(path: PathLike[str]) -> bool:
+    try:
+        return "TBPM" in ID3(path)
+    except (MutagenError, OSError):
+        return False
+
+
 def update_mp3_genre(path: str | PathLike[str] | MP3, new_genre: list[str] | str, save: bool = True):
     audio = _audio(path)
 
     if isinstance(new_genre, str):
         audio.tags.add(TCON(Encoding.UTF8, text=[new_genre]))
     else:
-        audio.tags.add(TCON(Encoding.UTF8, text=new_genre))
+        audio.tags.add(TCON(Encoding.UTF8, text=list(new_genre) if new_genre else []))
 
     if save:
         audio.save()
@@ -515,6 +717,8 @@ def update_mp3_categories(path: PathLike[str] | MP3, categories: dict[str, int],
     if categories:
         if isinstance(categories, list):
             categories = {item['category']: item['scale'] for item in categories}
+        elif isinstance(categories, Mapping):
+            categories = dict(categories)
 
         audio.tags.add(TXXX(Encoding.UTF8, desc='ai_categories', text=[json.dumps(categories, ensure_ascii=False)]))
     else:
@@ -555,7 +759,7 @@ def update_mp3_tags(path: str | PathLike[str] | MP3, tags: list[str], save: bool
             TXXX(
                 Encoding.UTF8,
                 desc='ai_tags',
-                text=tags
+                text=list(tags)
             )
         )
 
@@ -612,11 +816,11 @@ def update_mp3_chapters(path: str | PathLike[str] | MP3, chapters: list[dict], s
     if save:
         audio.save()
         logger.debug("Updated chapters to {0} for {1}", chapters, path)
-def list_mp3s(path: PathLike[str], recursive: bool = True):
+def list_mp3s(path: PathLike[str], recursive: bool = False):
     if isinstance(path, os.DirEntry):
         path = path.path
 
-    return glob.glob("*.mp3", root_dir=path, recursive=recursive)
+    return [os.path.relpath(entry.path, path) for entry in scan(path, recursive=recursive)]
 
 
 def update_categories_and_tags(path: PathLike[str] | ID3, summary: str, categories: dict[str, int] = None, tags: list[str] = None):
@@ -683,38 +887,32 @@ def print_mp3_tags(file_path: PathLike[str]):
 
 
 def remove_m3u(entries: list[Mp3Entry], playlist: PathLike[str]):
-    files = parse_m3u(playlist)
-
-    filtered = [file for file in files if file not in entries]
+    items = read_m3u(playlist)
+    if items is None:
+        raise ValueError("Not a m3u playlist: {0}".format(playlist))
 
-    create_m3u(filtered, playlist)
+    paths = {Path(entry.path) for entry in entries}
+    _write_m3u([item for item in items if item.path not in paths], playlist)
 
 
 def append_m3u(entries: list[Mp3Entry], playlist: PathLike[str], index: int = -1):
-    try:
-        if len(entries) > 0:
+    """Inserts the tracks in front of the track at index, a negative index appends them. Write errors are raised."""
+    if len(entries) == 0:
+        logger.warning("No mp3 files found.")
+        return
 
-            if index < 0:
-                logger.debug("Appending playlist '{0}'...", playlist)
+    logger.debug("Appending playlist '{0}'...", playlist)
+    items = read_m3u(playlist) if os.path.exists(playlist) else []
+    if items is None:
+        raise ValueError("Not a m3u playlist: {0}".format(playlist))
 
-                # write the playlist
-                with open(playlist, 'a', encoding="utf-8") as of:
-                    for mp3 in entries:
-                        relpath = os.path.relpath(mp3.path, str(Path(playlist).parent)).replace("\\", "/")
-                        of.write(f"#EXTINF:{mp3.length},{mp3.name}\n")
-                        of.write(relpath + "\n")
-            else:
-                mp3s = parse_m3u(playlist)
-                for i in reversed(entries):
-                    mp3s.insert(index, i)
-                create_m3u(mp3s, playlist)
-
-        else:
-            logger.warning("No mp3 files found.")
-
-    except Exception:
-        logger.error("ERROR occurred when processing entries.")
-        logger.error("Text: {0}", sys.exc_info()[0])
+    base_dir = Path(playlist).parent
+    added = [PlaylistItem(Path(mp3.path), _m3u_lines(mp3, base_dir).splitlines()) for mp3 in entries]
+    if index < 0:
+        index = len(items)
+    items[index:index] = added
+    # the whole playlist is rewritten, appending in place could leave a half written line behind
+    _write_m3u(items, playlist)
 
 
 def create_m3u(entries: list[Mp3Entry], playlist: PathLike[str]):
@@ -723,14 +921,8 @@ def create_m3u(entries: list[Mp3Entry], playlist: PathLike[str]):
             logger.debug("Writing playlist '{0}'...", playlist)
 
             # write the playlist
-            with open(playlist, 'w', encoding="utf-8") as of:
-                of.write("#EXTM3U\n")
-
-                # sorted by track number
-                for mp3 in entries:
-                    relpath = os.path.relpath(mp3.path, str(Path(playlist).parent)).replace("\\", "/")
-                    of.write(f"#EXTINF:{mp3.length},{mp3.name}\n")
-                    of.write(relpath + "\n")
+            base_dir = Path(playlist).parent
+            _write_m3u_text((_m3u_lines(mp3, base_dir) for mp3 in entries), playlist)
         else:
             logger.warning("No mp3 files found.")
 
@@ -739,7 +931,98 @@ def create_m3u(entries: list[Mp3Entry], playlist: PathLike[str]):
         logger.error("Text: {0}", sys.exc_info()[0])
 
 
-def get_m3u_paths(file_path: PathLike[str]) -> list[Path] | None:
+class PlaylistItem(object):
+    """A single track of an m3u playlist with its raw directive lines and the cached metadata if present."""
+    __slots__ = ["path", "lines", "cache"]
+
+    path: Path
+    lines: list[str]
+    cache: dict | None
+
+    def __init__(self, path: Path, lines: list[str], cache: dict | None = None):
+        self.path = path
+        self.lines = lines
+        self.cache = cache
+
+
+def m3u_cache_line(entry: Mp3Entry) -> str:
+    """
+    Extended m3u directive caching the metadata shown in the song table, so a playlist can be
+    displayed without reading the tags of every track. Players ignore unknown # lines.
+    """
+    data = {
+        "title": entry.title,
+        "artist": entry.artist,
+        "album": entry.album,
+        "genres": list(entry.genres),
+        "summary": entry.summary,
+        "length": entry.length,
+        "favorite": entry.favorite,
+        "bpm": entry.bpm,
+        "categories": dict(entry.categories),
+        "tags": list(entry.tags),
+    }
+    if entry.light is not None:
+        data["light"] = entry.light.json_dump()
+    if entry.signature is not None:
+        data["size"], data["mtime"] = entry.signature
+
+    return M3U_CACHE_TAG + json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def refresh_m3u_cache(entries: list[Mp3Entry], playlist: PathLike[str]):
+    """Replaces the cached metadata of the given tracks, all other lines of the playlist are kept as they are."""
+    items = read_m3u(playlist)
+    if items is None:
+        logger.warning("Not a m3u playlist: {0}", playlist)
+        return
+
+    fresh = {Path(entry.path): entry for entry in entries}
+    for item in items:
+        entry = fresh.get(item.path)
+        if entry is not None:
+            lines = [line for line in item.lines if not line.startswith(M3U_CACHE_TAG)]
+            # the cache directive goes right before the path line
+            lines.insert(len(lines) - 1, m3u_cache_line(entry))
+            item.lines = lines
+    _write_m3u(items, playlist)
+
+
+def _m3u_lines(entry: Mp3Entry, base_dir: Path) -> str:
+    relpath = os.path.relpath(entry.path, str(base_dir)).replace("\\", "/")
+    return f"#EXTINF:{entry.length},{entry.name}\n{m3u_cache_line(entry)}\n{relpath}\n"
+
+
+def _write_m3u(items: list[PlaylistItem], playlist: PathLike[str]):
+    """Writes the raw lines of the items, no track is touched."""
+    _write_m3u_text(("\n".join(item.lines) + "\n" for item in items), playlist)
+
+
+def _write_m3u_text(chunks: Iterable[str], playlist: PathLike[str]):
+    # write next to the playlist and swap it in, so a crash never leaves a half written playlist behind
+    playlist = os.path.abspath(playlist)
+    fd, temp_path = tempfile.mkstemp(prefix=".", suffix=".m3u.tmp", dir=os.path.dirname(playlist))
+    try:
+        with os.fdopen(fd, 'w', encoding="utf-8") as of:
+            of.write("#EXTM3U\n")
+            for chunk in chunks:
+                of.write(chunk)
+
+        if os.path.exists(playlist):
+            shutil.copymode(playlist, temp_path)
+        else:
+            # mkstemp creates the file for the owner only, a new playlist gets the mode open() would give it
+            os.chmod(temp_path, 0o666 & ~_UMASK)
+        os.replace(temp_path, playlist)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def read_m3u(file_path: PathLike[str]) -> list[PlaylistItem] | None:
     with open(file_path, 'r', encoding="utf-8") as infile:
 
         # All M3U files start with #EXTM3U.
@@ -750,26 +1033,39 @@ def get_m3u_paths(file_path: PathLike[str]) -> list[Path] | None:
         if not line.startswith('#EXTM3U'):
             return None
 
-        paths = []
+        items = []
         base_dir = Path(Path(infile.name)).parent
 
+        lines = []
+        cache = None
         for line in infile:
             line = line.strip()
-            if line.startswith('#EXTINF:'):
-                continue
-                # pull length and title from #EXTINF line
-                # length,title=line.split('#EXTINF:')[1].split(',',1)
-                # song=track(length,title,None)
+            if line.startswith(M3U_CACHE_TAG):
+                lines.append(line)
+                try:
+                    cache = json.loads(line.removeprefix(M3U_CACHE_TAG))
+                except json.JSONDecodeError:
+                    cache = None
+            elif line.startswith('#'):
+                # #EXTINF and any other directive belongs to the next path
+                lines.append(line)
             elif len(line) != 0:
-                # pull song path from all other, non-blank lines
-                # song.path=line
-
                 if Path(line).is_absolute():
-                    paths.append(Path(line))
+                    path = Path(line)
                 else:
-                    paths.append(Path(base_dir, line))
-                # reset the song variable so it doesn't use the same EXTINF more than once
-    return paths
+                    path = Path(base_dir, line)
+                items.append(PlaylistItem(path, lines + [line], cache if isinstance(cache, dict) else None))
+                # reset so the directives are not used more than once
+                lines = []
+                cache = None
+    return items
+
+
+def get_m3u_paths(file_path: PathLike[str]) -> list[Path] | None:
+    items = read_m3u(file_path)
+    if items is None:
+        return None
+    return [item.path for item in items]
 
 
 def parse_m3u(file_path: PathLike[str]) -> list[Mp3Entry] | None:
@@ -783,37 +1079,122 @@ def parse_m3u(file_path: PathLike[str]) -> list[Mp3Entry] | None:
 
 
 class Mp3FileLoader(QThread):
+    """
+    Parses mp3 files in the background and emits the entries in chunks.
+    Without initial files the loader keeps waiting for add_files until close_input is called,
+    so paths can be streamed in while a directory scan is still running.
+    """
     files_loaded = Signal(list)
-    finished = Signal()
 
-    def __init__(self, files: list[Path], parent=None):
+    def __init__(self, files: list[Path | PlaylistItem] | None, parent=None):
         super().__init__(parent)
-        self.files = files
+        self.files = queue.Queue()
         self.is_interrupted = False
 
+        if files is not None:
+            self.add_files(files)
+            self.close_input()
+
+    def add_files(self, files: list[Path | PlaylistItem]):
+        for file_path in files:
+            self.files.put(file_path)
+
+    def close_input(self):
+        self.files.put(None)
+
     def run(self):
         chunk = []
-        for file_path in self.files:
-            if self.is_interrupted:
+        while not self.is_interrupted:
+            try:
+                # hand out partial chunks while waiting for more input
+                file_path = self.files.get(timeout=0.2 if chunk else None)
+            except queue.Empty:
+                self.files_loaded.emit(chunk)
+                chunk = []
+                continue
+
+            if file_path is None or self.is_interrupted:
                 break
             try:
-                entry = parse_mp3(file_path)
+                if isinstance(file_path, PlaylistItem):
+                    if file_path.cache is not None:
+                        entry = Mp3Entry.from_m3u_cache(file_path.path, file_path.cache)
+                    else:
+                        entry = parse_mp3(file_path.path)
+                else:
+                    entry = parse_mp3(file_path)
                 if entry:
                     chunk.append(entry)
             except Exception:
                 pass
 
-            if len(chunk) >= 20:  # Chunk size
+            # cached entries cost no I/O, so they are handed out in much larger chunks
+            if len(chunk) >= (500 if isinstance(file_path, PlaylistItem) and file_path.cache is not None else 20):
                 self.files_loaded.emit(chunk)
                 chunk = []
 
-        if chunk:
+        if chunk and not self.is_interrupted:
             self.files_loaded.emit(chunk)
 
-        self.finished.emit()
+    def cancel(self):
+        self.is_interrupted = True
+        self.close_input()
 
     def stop(self):
+        self.cancel()
+        self.wait()
+
+
+class PlaylistValidator(QThread):
+    """
+    Revalidates entries restored from the playlist cache in the background.
+    Entries whose file changed since the cache was written are parsed again, vanished files are reported.
+    """
+    entries_updated = Signal(list)
+    entries_missing = Signal(list)
+
+    def __init__(self, entries: list[Mp3Entry], parent=None):
+        super().__init__(parent)
+        self.entries = entries
+        self.is_interrupted = False
+        self.updated = 0
+        self.missing = 0
+        self.updated_entries: list[Mp3Entry] = []
+
+    def run(self):
+        updated = []
+        missing = []
+        for entry in self.entries:
+            if self.is_interrupted:
+                break
+
+            signature = file_signature(entry.path)
+            if signature is None:
+                missing.append(entry.path)
+            elif signature != entry.signature:
+                fresh = parse_mp3(entry.path)
+                if fresh is not None:
+                    updated.append(fresh)
+                    self.updated_entries.append(fresh)
+
+            if len(updated) >= 20:
+                self.updated += len(updated)
+                self.entries_updated.emit(updated)
+                updated = []
+
+        if not self.is_interrupted:
+            if updated:
+                self.updated += len(updated)
+                self.entries_updated.emit(updated)
+            if missing:
+                self.missing += len(missing)
+                self.entries_missing.emit(missing)
+
+    def cancel(self):
         self.is_interrupted = True
+
+    def stop(self):
+        self.cancel()
         self.wait()
 
 
@@ -823,3 +1204,102 @@ def save_playlist(playlist_path, entries: list[Mp3Entry]) -> bool:
         return True
     else:
         return False
+
+
+class PlaylistWriter(QObject):
+    """
+    Saves playlists in a background thread. Saves requested in quick succession, e.g. while reordering
+    songs by drag and drop, are debounced into a single atomic write per playlist.
+    """
+    save_finished = Signal(str, bool)
+
+    def __init__(self, delay: int = 500, parent=None):
+        super().__init__(parent)
+        self._pending: dict[str, list[Mp3Entry]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="playlist-writer")
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay)
+        self._timer.timeout.connect(self._write_pending)
+
+    def save(self, playlist: PathLike[str], entries: list[Mp3Entry]):
+        # keep a snapshot of the order, later edits replace it until the timer fires
+        self._pending[os.path.abspath(playlist)] = list(entries)
+        self._timer.start()
+
+    def is_pending(self, playlist: PathLike[str]) -> bool:
+        return os.path.abspath(playlist) in self._pending
+
+    def refresh_cache(self, playlist: PathLike[str], entries: list[Mp3Entry]):
+        """Refreshes the cached metadata of some tracks in the order of the other writes, tracks not given are left alone."""
+        if self.is_pending(playlist):
+            # the pending save rewrites the whole playlist with fresh metadata anyway
+            return
+        self._executor.submit(self._refresh_cache, os.path.abspath(playlist), list(entries))
+
+    def remove(self, playlist: PathLike[str], entries: list[Mp3Entry]):
+        """Removes the tracks from the playlist file after all saves requested before."""
+        self._edit(playlist, remove_m3u, list(entries), playlist)
+
+    def append(self, playlist: PathLike[str], entries: list[Mp3Entry], index: int = -1):
+        """Inserts the tracks into the playlist file after all saves requested before."""
+        self._edit(playlist, append_m3u, list(entries), playlist, index)
+
+    def _edit(self, playlist: PathLike[str], edit: Callable, *args):
+        playlist = os.path.abspath(playlist)
+        if self.is_pending(playlist):
+            # the debounced save was requested before the edit, so it has to reach the file first
+            self._submit_write(playlist, self._pending.pop(playlist))
+        future = self._executor.submit(self._run_edit, playlist, edit, *args)
+        future.add_done_callback(lambda f, p=playlist: self.save_finished.emit(p, f.exception() is None))
+
+    def flush(self):
+        """Writes everything still pending and waits for it, e.g. before the application quits."""
+        self._timer.stop()
+        self._write_pending()
+        self._executor.submit(lambda: None).result()
+
+    def _write_pending(self):
+        pending, self._pending = self._pending, {}
+        for playlist, entries in pending.items():
+            self._submit_write(playlist, entries)
+
+    def _submit_write(self, playlist: str, entries: list[Mp3Entry]):
+        future = self._executor.submit(self._write, playlist, entries)
+        future.add_done_callback(lambda f, p=playlist: self.save_finished.emit(p, f.exception() is None))
+
+    @staticmethod
+    def _write(playlist: str, entries: list[Mp3Entry]):
+        try:
+            logger.debug("Writing playlist '{0}'...", playlist)
+            base_dir = Path(playlist).parent
+            _write_m3u_text((_m3u_lines(mp3, base_dir) for mp3 in entries), playlist)
+        except Exception as e:
+            logger.error("Failed to write playlist {0}: {1}", playlist, e)
+            raise
+
+    @staticmethod
+    def _run_edit(playlist: str, edit: Callable, *args):
+        try:
+            edit(*args)
+        except Exception as e:
+            logger.error("Failed to update playlist {0}: {1}", playlist, e)
+            raise
+
+    @staticmethod
+    def _refresh_cache(playlist: str, entries: list[Mp3Entry]):
+        try:
+            refresh_m3u_cache(entries, playlist)
+        except Exception as e:
+            logger.error("Failed to refresh the cache of playlist {0}: {1}", playlist, e)
+
+
+_playlist_writer: PlaylistWriter | None = None
+
+
+def get_playlist_writer() -> PlaylistWriter:
+    global _playlist_writer
+    if _playlist_writer is None:
+        _playlist_writer = PlaylistWriter()
+    return _playlist_writer
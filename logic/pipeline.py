@@ -0,0 +1,370 @@
+import asyncio
+import http.client
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from typing import Any, Callable, TYPE_CHECKING
+
+from PySide6.QtCore import QThread
+
+from logic.httpclient import HttpError
+from logic.jobs import AnalysisJob
+
+if TYPE_CHECKING:
+    from logic.analyzer import Analyzer, Worker
+
+logger = logging.getLogger(__file__)
+
+DEFAULT_INITIAL_CONCURRENCY = 4
+DEFAULT_MAX_CONCURRENCY = 16
+
+# status codes of an overloaded or restarting server
+TRANSIENT_STATUS = (408, 429, 500, 502, 503, 504)
+
+
+def is_transient(error: BaseException) -> bool:
+    """Errors worth retrying, everything else fails the file right away."""
+    if isinstance(error, HttpError):
+        return error.status in TRANSIENT_STATUS
+    return isinstance(error, (ConnectionError, TimeoutError, http.client.HTTPException))
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    attempts: int = 4
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+
+    def delay(self, attempt: int) -> float:
+        """Exponential backoff with jitter, so retries of a batch don't hit the server at the same moment."""
+        return min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class BreakerState(Enum):
+    CLOSED = 1
+    OPEN = 2
+    HALF_OPEN = 3
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests after failure_threshold consecutive transient failures.
+    After reset_timeout a single probe request is let through, its failure doubles the timeout.
+    Requests waiting on a breaker which has not closed again within give_up_after fail with a CircuitOpenError.
+    Only used from the event loop thread of the pipeline, so there is no locking.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0, max_reset_timeout: float = 60.0,
+                 give_up_after: float = 300.0):
+        self.failure_threshold = failure_threshold
+        self.initial_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.give_up_after = give_up_after
+
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.first_opened_at: float | None = None
+
+    async def wait(self):
+        """Waits until a request may be sent."""
+        while True:
+            if self.state == BreakerState.CLOSED:
+                return
+
+            if self.first_opened_at is not None and time.monotonic() - self.first_opened_at > self.give_up_after:
+                raise CircuitOpenError("Voxalyzer did not respond for {0:.0f} seconds".format(time.monotonic() - self.first_opened_at))
+
+            if self.state == BreakerState.OPEN:
+                remaining = self.opened_at + self.reset_timeout - time.monotonic()
+                if remaining <= 0:
+                    self.state = BreakerState.HALF_OPEN
+                    return
+                await asyncio.sleep(remaining)
+            else:
+                # the probe request is still running
+                await asyncio.sleep(0.2)
+
+    def record_success(self):
+        if self.state != BreakerState.CLOSED:
+            logger.info("Circuit breaker closed")
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.reset_timeout = self.initial_reset_timeout
+        self.first_opened_at = None
+
+    def record_failure(self) -> bool:
+        """Returns True if the breaker opened."""
+        if self.state == BreakerState.HALF_OPEN:
+            self.reset_timeout = min(self.max_reset_timeout, self.reset_timeout * 2)
+            self._open()
+            return True
+
+        self.failures += 1
+        if self.state == BreakerState.CLOSED and self.failures >= self.failure_threshold:
+            self._open()
+            return True
+        return False
+
+    def _open(self):
+        self.state = BreakerState.OPEN
+        self.opened_at = time.monotonic()
+        if self.first_opened_at is None:
+            self.first_opened_at = self.opened_at
+        logger.warning("Circuit breaker opened for {0:.0f} s after {1} failures", self.reset_timeout, self.failures)
+
+
+class AdaptiveLimiter:
+    """
+    Semaphore whose limit follows the capacity of the server (AIMD):
+    every window of fast requests adds one slot, errors halve the limit and slow requests shrink it.
+    A request is slow if its latency per file exceeds tolerance times the baseline, the lowest latency seen lately.
+    """
+
+    def __init__(self, initial: int = DEFAULT_INITIAL_CONCURRENCY, minimum: int = 1, maximum: int = DEFAULT_MAX_CONCURRENCY,
+                 tolerance: float = 2.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.limit = float(max(minimum, min(initial, maximum)))
+
+        self.in_flight = 0
+        self.baseline: float | None = None
+        self._last_decrease = 0.0
+        self._condition: asyncio.Condition | None = None
+
+    def bind(self):
+        """Binds the limiter to the running event loop, the learned limit is kept."""
+        self._condition = asyncio.Condition()
+        self.in_flight = 0
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency: float | None, overloaded: bool):
+        async with self._condition:
+            self.in_flight -= 1
+            self._adjust(latency, overloaded)
+            self._condition.notify_all()
+
+    def _adjust(self, latency: float | None, overloaded: bool):
+        if latency is not None and not overloaded:
+            # the baseline slowly drifts up, so it recovers from a single lucky request
+            self.baseline = latency if self.baseline is None else min(latency, self.baseline + (latency - self.baseline) * 0.05)
+
+        slow = latency is not None and self.baseline is not None and latency > self.baseline * self.tolerance
+        if overloaded or slow:
+            now = time.monotonic()
+            # requests that were already running when the server got slow must not shrink the limit again
+            if now - self._last_decrease > max(latency or self.baseline or 0.0, 0.05):
+                self._last_decrease = now
+                self.limit = max(float(self.minimum), self.limit * (0.5 if overloaded else 0.8))
+                logger.debug("Analysis concurrency decreased to {0:.1f}", self.limit)
+        elif latency is not None:
+            self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+
+
+class AnalysisPipeline(QThread):
+    """
+    Runs the analysis jobs of an analyzer on an asyncio event loop.
+    Jobs are pulled from the scheduler as long as the adaptive limit allows, the blocking stages of a Worker
+    run on a thread pool. Transient failures are retried with exponential backoff behind a circuit breaker.
+    The analyzer passes in its Worker class, the pipeline module does not import the analyzer.
+    """
+
+    def __init__(self, analyzer: "Analyzer", worker_class: type["Worker"], max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        super().__init__()
+        self.analyzer = analyzer
+        self.worker_class = worker_class
+        self.limiter = AdaptiveLimiter(maximum=max_concurrency)
+        self.breaker = CircuitBreaker()
+        self.retry = RetryPolicy()
+
+        self.active_count = 0
+        self.retried = 0
+        self.failed = 0
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._stopping = False
+        # the event loop thread ends as soon as it runs idle, the lock guards the hand over to a new thread
+        self._active = False
+        self._lock = threading.Lock()
+        # stages writing tags, stop waits for them but not for requests whose results are dropped anyway
+        self._writing = 0
+        self._writing_done = threading.Condition()
+
+    def wake(self):
+        """Tells the pipeline new jobs have been queued."""
+        while True:
+            with self._lock:
+                if self._active:
+                    loop = self._loop
+                    if loop is not None:
+                        loop.call_soon_threadsafe(self._wake.set)
+                    return
+
+                if not self.isRunning():
+                    self._active = True
+                    self._stopping = False
+                    self.start()
+                    return
+
+            # a thread which just ran idle is about to finish, it needs the lock on its way out
+            self.wait()
+
+    def stop(self):
+        """
+        Stops taking jobs and waits for the workers writing tags, so no tags are written after this returns.
+        Requests still running are left to finish on their own, their results are dropped.
+        """
+        with self._lock:
+            with self._writing_done:
+                self._stopping = True
+            loop = self._loop
+            if loop is not None:
+                loop.call_soon_threadsafe(self._wake.set)
+        self.wait()
+
+        with self._writing_done:
+            self._writing_done.wait_for(lambda: self._writing == 0)
+
+    def run(self):
+        asyncio.run(self._main())
+
+    async def _main(self):
+        self._wake = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=self.limiter.maximum * 2, thread_name_prefix="analyzer")
+        self.limiter.bind()
+        self._loop = asyncio.get_running_loop()
+
+        tasks = set()
+        try:
+            while not self._stopping:
+                self._wake.clear()
+                # one batch more than the limit is prepared ahead, so a free slot is filled right away
+                if self.active_count > int(self.limiter.limit):
+                    await self._wake.wait()
+                    continue
+
+                jobs = self.analyzer.scheduler.take_batch(self.analyzer.batch_size)
+                if not jobs:
+                    if self.active_count == 0:
+                        with self._lock:
+                            if self.analyzer.scheduler.queued_count == 0:
+                                self._active = False
+                                break
+                    # finished batches wake the loop, so does the scheduler once it freed their jobs on the GUI thread
+                    await self._wake.wait()
+                    continue
+
+                self.active_count += 1
+                task = asyncio.create_task(self._run_jobs(jobs))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            with self._lock:
+                self._active = False
+                self._loop = None
+            for task in tasks:
+                task.cancel()
+            # requests still hanging on the server are not waited for
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _call(self, function: Callable, *args) -> Any:
+        return await self._loop.run_in_executor(self._executor, function, *args)
+
+    async def _call_writing(self, function: Callable, *args) -> Any:
+        """Runs a stage writing tags, it is skipped once the pipeline is stopping."""
+        return await self._call(self._writing_stage, function, *args)
+
+    def _writing_stage(self, function: Callable, *args) -> Any:
+        with self._writing_done:
+            if self._stopping:
+                return []
+            self._writing += 1
+        try:
+            return function(*args)
+        finally:
+            with self._writing_done:
+                self._writing -= 1
+                self._writing_done.notify_all()
+
+    async def _run_jobs(self, jobs: list[AnalysisJob]):
+        worker = self.worker_class(jobs, self.analyzer)
+        try:
+            pending = await self._call_writing(worker.prepare)
+
+            attempt = 0
+            while pending:
+                responses = await self._request(worker, pending)
+
+                retry = []
+                results = []
+                for file_path, response in zip(pending, responses):
+                    if isinstance(response, Exception) and is_transient(response) and attempt + 1 < self.retry.attempts:
+                        retry.append(file_path)
+                    else:
+                        results.append((file_path, response))
+                        if isinstance(response, Exception):
+                            self.failed += 1
+
+                if results:
+                    await self._call_writing(worker.apply, results)
+
+                pending = retry
+                if pending:
+                    delay = self.retry.delay(attempt)
+                    attempt += 1
+                    self.retried += len(pending)
+                    logger.info("Retrying {0} files in {1:.1f} s (attempt {2})", len(pending), delay, attempt + 1)
+                    await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Analysis of {0} failed: {1}", jobs, e)
+            self.analyzer.error.emit(str(e), False)
+        finally:
+            self.active_count -= 1
+            self._wake.set()
+            for job in jobs:
+                self.analyzer.job_finished.emit(job)
+
+    async def _request(self, worker: "Worker", file_paths: list[Path]) -> list[Any]:
+        try:
+            await self.breaker.wait()
+        except CircuitOpenError as e:
+            return [e] * len(file_paths)
+
+        await self.limiter.acquire()
+
+        overloaded = True
+        latency = None
+        try:
+            start = time.monotonic()
+            responses = await self._call(worker.analyze, file_paths)
+            latency = (time.monotonic() - start) / len(file_paths)
+            overloaded = any(isinstance(response, Exception) and is_transient(response) for response in responses)
+            return responses
+        finally:
+            await self.limiter.release(None if overloaded else latency, overloaded)
+            if overloaded:
+                if self.breaker.record_failure():
+                    self.analyzer.progress.emit(_("Voxalyzer is not responding, pausing analysis for {0:.0f} seconds")
+                                                .format(self.breaker.reset_timeout))
+            else:
+                self.breaker.record_success()
+            self._wake.set()
@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from PySide6.QtCore import QObject, Signal, QTimer
+
+from logic.jobs import JobScheduler
+
+# completions older than this don't count towards the current throughput
+THROUGHPUT_WINDOW = 30.0
+
+
+@dataclass(slots=True, frozen=True)
+class AnalysisProgress:
+    total: int = 0
+    analyzed: int = 0
+    skipped: int = 0
+    cache_hits: int = 0
+    failed: int = 0
+    queued: int = 0
+    running: int = 0
+    files_per_second: float = 0.0
+    bytes_per_second: float = 0.0
+    # seconds until the queue is done, None while the throughput is unknown
+    eta: float | None = None
+    current: str | None = None
+
+    @property
+    def done(self) -> int:
+        return self.analyzed + self.skipped + self.cache_hits + self.failed
+
+    @property
+    def finished(self) -> bool:
+        return self.queued == 0 and self.running == 0
+
+
+class ProgressAggregator(QObject):
+    """
+    Collects the events of the analysis workers and publishes them as one AnalysisProgress a few times per second.
+    The record methods are called from any thread and only update counters, the timer publishes on the GUI thread.
+    Counters start over when jobs are queued after all previous ones finished.
+    """
+    updated = Signal(AnalysisProgress)
+
+    def __init__(self, scheduler: JobScheduler, interval_ms: int = 250, parent=None):
+        super().__init__(parent)
+        self.scheduler = scheduler
+        self._lock = threading.Lock()
+        self._completions: deque[tuple[float, int]] = deque()
+        self._reset()
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.publish)
+
+    def _reset(self):
+        self.total = 0
+        self.analyzed = 0
+        self.skipped = 0
+        self.cache_hits = 0
+        self.failed = 0
+        self.current = None
+        self.started_at = time.monotonic()
+        self._completions.clear()
+        self._finished = False
+
+    def start(self):
+        """Called on the GUI thread whenever jobs are queued."""
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def add_total(self, count: int, skipped: int = 0):
+        with self._lock:
+            if self._finished:
+                self._reset()
+            self.total += count + skipped
+            self.skipped += skipped
+
+    def remove_total(self, count: int):
+        with self._lock:
+            self.total = max(self.done_count(), self.total - count)
+
+    def done_count(self) -> int:
+        return self.analyzed + self.skipped + self.cache_hits + self.failed
+
+    def file_started(self, name: str):
+        with self._lock:
+            self.current = name
+
+    def file_cached(self):
+        with self._lock:
+            self.cache_hits += 1
+            self._completions.append((time.monotonic(), 0))
+
+    def file_analyzed(self, size: int):
+        with self._lock:
+            self.analyzed += 1
+            self._completions.append((time.monotonic(), size))
+
+    def file_failed(self):
+        with self._lock:
+            self.failed += 1
+
+    def snapshot(self) -> AnalysisProgress:
+        now = time.monotonic()
+        with self._lock:
+            while self._completions and self._completions[0][0] < now - THROUGHPUT_WINDOW:
+                self._completions.popleft()
+
+            elapsed = max(1.0, now - max(self.started_at, now - THROUGHPUT_WINDOW))
+            files_per_second = len(self._completions) / elapsed
+            bytes_per_second = sum(size for timestamp, size in self._completions) / elapsed
+
+            queued = self.scheduler.queued_count
+            running = self.scheduler.in_flight_count
+            remaining = max(0, self.total - self.done_count(), queued + running)
+            eta = remaining / files_per_second if files_per_second > 0 else None
+
+            return AnalysisProgress(max(self.total, self.done_count() + queued + running), self.analyzed, self.skipped,
+                                    self.cache_hits, self.failed, queued, running, files_per_second, bytes_per_second,
+                                    eta if remaining else 0.0, self.current if running else None)
+
+    def publish(self):
+        progress = self.snapshot()
+        if progress.finished:
+            # the last snapshot stays visible until the next jobs are queued
+            self.timer.stop()
+            with self._lock:
+                self._finished = True
+        self.updated.emit(progress)
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+from os import PathLike
+from pathlib import Path
+from typing import Any
+
+from config.utils import get_app_data_path
+
+logger = logging.getLogger(__file__)
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# only the parts of a response that are written to the file are kept
+CACHED_FIELDS = ("summary", "categories", "tags")
+
+
+def _syncsafe(data: bytes) -> int:
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def audio_range(file_path: PathLike[str]) -> tuple[int, int]:
+    """Start and end offset of the audio frames without leading ID3v2 and trailing ID3v1/APEv2 tags."""
+    with open(file_path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+
+        start = 0
+        while True:
+            f.seek(start)
+            header = f.read(10)
+            if len(header) < 10 or header[:3] != b"ID3":
+                break
+            # header + tag + optional footer
+            start += 10 + _syncsafe(header[6:10]) + (10 if header[5] & 0x10 else 0)
+
+        end = size
+        if end - 128 >= start:
+            f.seek(end - 128)
+            if f.read(3) == b"TAG":
+                end -= 128
+
+        if end - 32 >= start:
+            f.seek(end - 32)
+            footer = f.read(32)
+            if footer[:8] == b"APETAGEX":
+                tag_size, flags = struct.unpack("<I4xI", footer[12:24])
+                end -= tag_size + (32 if flags & 0x80000000 else 0)
+
+        return start, max(start, end)
+
+
+def audio_hash(file_path: PathLike[str]) -> str:
+    """Hash of the audio frames only, so re-tagged copies of a track share the same key."""
+    start, end = audio_range(file_path)
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(HASH_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Analysis results by audio hash, persisted as one json file per hash in the app data directory.
+    Hashes are remembered per path together with size and modification time to avoid rereading unchanged files.
+    """
+
+    def __init__(self, directory: Path = None):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+        self._hashes: dict[str, tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _path(self, key: str) -> Path:
+        if self.directory is None:
+            return get_app_data_path("analysis", key[:2]).joinpath(key + ".json")
+        path = self.directory.joinpath(key[:2])
+        path.mkdir(parents=True, exist_ok=True)
+        return path.joinpath(key + ".json")
+
+    def key(self, file_path: PathLike[str], variant: str = "") -> str:
+        """
+        Cache key of the audio of the file. The variant keeps results apart which were produced differently
+        from the same audio, e.g. from excerpts instead of the whole file.
+        """
+        stat = os.stat(file_path)
+        path = os.path.abspath(file_path)
+        with self._lock:
+            known = self._hashes.get(path)
+        if known is not None and known[:2] == (stat.st_size, stat.st_mtime_ns):
+            key = known[2]
+        else:
+            key = audio_hash(file_path)
+            with self._lock:
+                self._hashes[path] = (stat.st_size, stat.st_mtime_ns, key)
+        return key + "-" + variant if variant else key
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        result = None
+        try:
+            cache_path = self._path(key)
+            if cache_path.is_file():
+                result = json.loads(cache_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read cached analysis {0}: {1}", key, e)
+
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def put(self, key: str, response: Any):
+        if not isinstance(response, dict) or not response.get("categories"):
+            return
+
+        result = {field: response.get(field) for field in CACHED_FIELDS}
+        try:
+            cache_path = self._path(key)
+            temp_path = cache_path.with_suffix(".tmp{0}".format(threading.get_ident()))
+            temp_path.write_text(json.dumps(result), encoding="utf-8")
+            os.replace(temp_path, cache_path)
+        except OSError as e:
+            logger.warning("Could not write cached analysis {0}: {1}", key, e)
+
+    def report(self) -> str:
+        return "Analysis cache: {0} hits, {1} misses, {2:.0%} hit rate".format(self.hits, self.misses, self.hit_rate)
+
+
+result_cache = ResultCache()
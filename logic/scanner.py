@@ -0,0 +1,145 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from os import PathLike
+from pathlib import Path
+from typing import Callable, Iterator
+
+from PySide6.QtCore import QThread, Signal
+
+logger = logging.getLogger(__file__)
+
+MP3_EXTENSIONS = (".mp3",)
+
+# directory listing is io bound, so a few more threads than cores pay off on network shares
+DEFAULT_SCAN_WORKERS = min(16, (os.cpu_count() or 1) + 4)
+
+
+@dataclass(slots=True, frozen=True)
+class ScanEntry:
+    path: Path
+    size: int
+    mtime_ns: int
+    is_dir: bool = False
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+
+def _matches(name: str, extensions: tuple[str, ...]) -> bool:
+    return name.lower().endswith(extensions)
+
+
+def _directory_id(path: str) -> tuple[int, int]:
+    # os.stat instead of DirEntry.stat, which leaves st_dev and st_ino zero on Windows
+    stat = os.stat(path)
+    return stat.st_dev, stat.st_ino
+
+
+def _scan_directory(directory: str, extensions: tuple[str, ...], include_dirs: bool) -> tuple[list[ScanEntry], list[tuple[str, tuple[int, int]]]]:
+    files = []
+    sub_directories = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        sub_directories.append((entry.path, _directory_id(entry.path)))
+                        if include_dirs:
+                            files.append(ScanEntry(Path(entry.path), 0, 0, True))
+                    elif _matches(entry.name, extensions) and entry.is_file():
+                        stat = entry.stat()
+                        files.append(ScanEntry(Path(entry.path), stat.st_size, stat.st_mtime_ns))
+                except OSError as e:
+                    logger.warning("Could not read {0}: {1}", entry.path, e)
+    except OSError as e:
+        logger.warning("Could not scan directory {0}: {1}", directory, e)
+
+    files.sort(key=lambda scan_entry: scan_entry.path.name.lower())
+    return files, sub_directories
+
+
+def scan(root: PathLike[str], extensions: tuple[str, ...] = MP3_EXTENSIONS, recursive: bool = True, include_dirs: bool = False,
+         is_interrupted: Callable[[], bool] = None, max_workers: int = DEFAULT_SCAN_WORKERS) -> Iterator[ScanEntry]:
+    """
+    Walks the directory tree with os.scandir, every subtree is listed in parallel.
+    Matching files are yielded as soon as their directory has been listed, the extension check ignores case.
+    Symlinked directories are followed, but every directory is only listed once, so links back up the tree end the walk.
+    """
+    if isinstance(root, os.DirEntry):
+        root = root.path
+    root = os.fspath(root)
+
+    if not recursive:
+        yield from _scan_directory(root, extensions, include_dirs)[0]
+        return
+
+    try:
+        visited = {_directory_id(root)}
+    except OSError as e:
+        logger.warning("Could not scan directory {0}: {1}", root, e)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scanner")
+    pending = {executor.submit(_scan_directory, root, extensions, include_dirs)}
+    try:
+        while pending:
+            if is_interrupted is not None and is_interrupted():
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, sub_directories = future.result()
+                for sub_directory, directory_id in sub_directories:
+                    if directory_id in visited:
+                        continue
+                    visited.add(directory_id)
+                    pending.add(executor.submit(_scan_directory, sub_directory, extensions, include_dirs))
+                yield from files
+    finally:
+        # an interrupted walk must not wait for listings still hanging on a slow share
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def scan_mp3s(root: PathLike[str], recursive: bool = True) -> list[Path]:
+    return [entry.path for entry in scan(root, recursive=recursive)]
+
+
+class DirectoryScanner(QThread):
+    """Streams the files found below a directory in chunks while the walk is still running."""
+    files_found = Signal(list)
+
+    def __init__(self, directory: PathLike[str], extensions: tuple[str, ...] = MP3_EXTENSIONS, chunk_size: int = 100, parent=None):
+        super().__init__(parent)
+        self.directory = directory
+        self.extensions = extensions
+        self.chunk_size = chunk_size
+        self.is_interrupted = False
+        self.found = 0
+
+    def run(self):
+        chunk = []
+        last_emit = time.monotonic()
+        for entry in scan(self.directory, self.extensions, is_interrupted=lambda: self.is_interrupted):
+            if self.is_interrupted:
+                break
+            chunk.append(entry)
+            self.found += 1
+
+            if len(chunk) >= self.chunk_size or time.monotonic() - last_emit > 0.25:
+                self.files_found.emit(chunk)
+                chunk = []
+                last_emit = time.monotonic()
+
+        if chunk and not self.is_interrupted:
+            self.files_found.emit(chunk)
+
+    def cancel(self):
+        self.is_interrupted = True
+
+    def stop(self):
+        self.cancel()
+        self.wait()
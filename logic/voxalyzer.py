@@ -0,0 +1,256 @@
+import http.client
+import logging
+import re
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from enum import Enum
+from typing import Iterator
+
+import psutil
+
+from logic.httpclient import HttpClient, DEFAULT_TIMEOUT
+
+logger = logging.getLogger(__file__)
+
+# the console window of the child process is hidden on windows
+CREATE_NO_WINDOW = getattr(subprocess, "CREATE_NO_WINDOW", 0) if sys.platform == "win32" else 0
+
+PORT_PATTERN = re.compile(r"http://127.0.0.1:(\d+) ")
+
+STARTUP_TIMEOUT = 120.0
+HEALTH_CHECK_INTERVAL = 5.0
+HEALTH_CHECK_TIMEOUT = 5.0
+STOP_TIMEOUT = 3.0
+# failed health checks after which an instance is restarted
+MAX_HEALTH_FAILURES = 3
+# restarts are delayed exponentially up to this, so a broken command doesn't spin
+MAX_RESTART_DELAY = 60.0
+
+
+class InstanceState(Enum):
+    STARTING = 1
+    READY = 2
+    FAILED = 3
+    STOPPED = 4
+
+
+class VoxalyzerInstance:
+    """One Voxalyzer child process, the port it listens on is read from its output."""
+
+    def __init__(self, index: int, command: list[str], timeout: float):
+        self.index = index
+        self.command = command
+        self.timeout = timeout
+
+        self.process: subprocess.Popen[str] | None = None
+        self.port: int | None = None
+        self.client: HttpClient | None = None
+        self.state = InstanceState.STOPPED
+        self.in_flight = 0
+        self.health_failures = 0
+        self.restarts = 0
+        self.started_at = 0.0
+        self.next_start = 0.0
+
+    @property
+    def url(self) -> str | None:
+        return "http://127.0.0.1:{0}".format(self.port) if self.port else None
+
+    def start(self, on_port):
+        self.port = None
+        self.client = None
+        self.health_failures = 0
+        self.started_at = time.monotonic()
+        self.state = InstanceState.STARTING
+
+        logger.info("Voxalyzer {0}: starting {1}", self.index, self.command)
+        try:
+            self.process = subprocess.Popen(self.command, creationflags=CREATE_NO_WINDOW, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                            stdin=subprocess.DEVNULL, text=True)
+        except OSError as e:
+            logger.error("Voxalyzer {0}: could not be started: {1}", self.index, e)
+            self.schedule_restart()
+            return
+
+        for pipe in (self.process.stdout, self.process.stderr):
+            threading.Thread(target=self._read_output, args=(self.process, pipe, on_port), daemon=True).start()
+
+    def _read_output(self, process: subprocess.Popen, pipe, on_port):
+        # keeps draining the pipe after the port was found, so the child never blocks on a full buffer
+        for line in pipe:
+            logger.debug("[Voxalyzer {0}]: {1}", self.index, line.strip())
+            match = PORT_PATTERN.search(line)
+            if match and process is self.process and self.port is None:
+                self.port = int(match.group(1))
+                self.client = HttpClient(self.url, timeout=self.timeout)
+                on_port(self)
+
+    def schedule_restart(self):
+        self.restarts += 1
+        self.state = InstanceState.FAILED
+        self.next_start = time.monotonic() + min(MAX_RESTART_DELAY, 2 ** min(self.restarts, 6))
+        logger.info("Voxalyzer {0}: restart {1} scheduled", self.index, self.restarts)
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self):
+        self.state = InstanceState.STOPPED
+        if self.client is not None:
+            self.client.close_all()
+        if self.process is None:
+            return
+
+        try:
+            parent = psutil.Process(self.process.pid)
+            # Find all grandchildren (Uvicorn, etc.)
+            processes = parent.children(recursive=True) + [parent]
+        except psutil.NoSuchProcess:
+            return
+
+        for process in processes:
+            try:
+                process.terminate()
+            except psutil.NoSuchProcess:
+                pass
+        gone, alive = psutil.wait_procs(processes, timeout=STOP_TIMEOUT)
+        for process in alive:
+            logger.warning("Voxalyzer {0}: killing process {1}", self.index, process.pid)
+            try:
+                process.kill()
+            except psutil.NoSuchProcess:
+                pass
+
+
+class VoxalyzerPool:
+    """
+    Runs several local Voxalyzer instances. They are started in the background, a monitor thread checks
+    their health and restarts crashed or hanging ones. Requests go to the ready instance with the fewest
+    requests in flight.
+    """
+
+    def __init__(self, command: list[str], size: int = 1, timeout: float = DEFAULT_TIMEOUT):
+        self.command = command
+        self.size = max(1, size)
+        self.instances = [VoxalyzerInstance(index, command, timeout) for index in range(self.size)]
+
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._monitor: threading.Thread | None = None
+
+    def start(self):
+        """Starts all instances without waiting for them."""
+        if self._monitor is not None:
+            return
+
+        with self._condition:
+            for instance in self.instances:
+                instance.start(self._on_port)
+
+        self._monitor = threading.Thread(target=self._monitor_loop, name="voxalyzer-monitor", daemon=True)
+        self._monitor.start()
+
+    def _on_port(self, instance: VoxalyzerInstance):
+        if self._check_health(instance):
+            with self._condition:
+                if instance.state == InstanceState.STARTING:
+                    logger.info("Voxalyzer {0} is running on port {1}", instance.index, instance.port)
+                    instance.state = InstanceState.READY
+                    self._condition.notify_all()
+
+    @staticmethod
+    def _check_health(instance: VoxalyzerInstance) -> bool:
+        if instance.url is None:
+            return False
+        client = HttpClient(instance.url, timeout=HEALTH_CHECK_TIMEOUT)
+        try:
+            # older servers have no health endpoint, any answer below 500 shows the server is up
+            status, reason, body = client.request("GET", "health")
+            return status < 500
+        except (OSError, http.client.HTTPException) as e:
+            logger.debug("Voxalyzer {0}: health check failed: {1}", instance.index, e)
+            return False
+        finally:
+            client.close()
+
+    def _monitor_loop(self):
+        while not self._stopped.wait(HEALTH_CHECK_INTERVAL):
+            for instance in self.instances:
+                if self._stopped.is_set():
+                    return
+                self._monitor_instance(instance)
+
+    def _monitor_instance(self, instance: VoxalyzerInstance):
+        now = time.monotonic()
+        if instance.state == InstanceState.FAILED:
+            if now >= instance.next_start:
+                with self._condition:
+                    instance.start(self._on_port)
+            return
+
+        if not instance.is_alive():
+            logger.warning("Voxalyzer {0} exited with code {1}", instance.index, instance.process.poll() if instance.process else None)
+            self._restart(instance)
+        elif instance.state == InstanceState.STARTING and now - instance.started_at > STARTUP_TIMEOUT:
+            logger.error("Voxalyzer {0}: timed out waiting for port", instance.index)
+            self._restart(instance)
+        elif instance.state == InstanceState.STARTING and instance.port is not None:
+            # the address may be printed before the server accepts connections
+            self._on_port(instance)
+        elif instance.state == InstanceState.READY and instance.in_flight == 0:
+            # busy instances prove their health with the requests they answer
+            if self._check_health(instance):
+                instance.health_failures = 0
+            else:
+                instance.health_failures += 1
+                if instance.health_failures >= MAX_HEALTH_FAILURES:
+                    logger.warning("Voxalyzer {0} is not responding", instance.index)
+                    self._restart(instance)
+
+    def _restart(self, instance: VoxalyzerInstance):
+        with self._condition:
+            if instance.state == InstanceState.FAILED:
+                return
+            instance.stop()
+            instance.schedule_restart()
+
+    def ready_count(self) -> int:
+        return sum(1 for instance in self.instances if instance.state == InstanceState.READY)
+
+    @contextmanager
+    def instance(self, timeout: float = STARTUP_TIMEOUT) -> Iterator[VoxalyzerInstance]:
+        """Hands out the least busy ready instance, waits for one while all are still starting."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                ready = [instance for instance in self.instances if instance.state == InstanceState.READY]
+                if ready:
+                    instance = min(ready, key=lambda candidate: candidate.in_flight)
+                    instance.in_flight += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stopped.is_set():
+                    raise ConnectionError("No Voxalyzer instance available")
+                self._condition.wait(remaining)
+
+        try:
+            yield instance
+        except ConnectionError:
+            # let the monitor look at it right away instead of waiting for the health check interval
+            if not instance.is_alive():
+                self._restart(instance)
+            raise
+        finally:
+            with self._condition:
+                instance.in_flight -= 1
+
+    def stop(self):
+        self._stopped.set()
+        with self._condition:
+            for instance in self.instances:
+                instance.stop()
+            self._condition.notify_all()